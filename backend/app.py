@@ -5,6 +5,7 @@ import shlex
 import shutil
 import os
 import queue
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from apiflask import APIFlask
 from flask import request, jsonify, send_from_directory
@@ -24,51 +25,115 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 # ... (rest of imports)
-from backend.services.system import get_info
+from backend.services.system import get_info, refresh_device_topology
 from backend.services.models import list_models, delete_model, models_root, get_recommended_models
-from backend.services.inference import load_pipeline, generate, quantize_model, is_model_in_use, release_model, is_model_loaded
+from backend.services.inference import load_pipeline, submit_generation, scheduler_stats, quantize_model, is_model_in_use, release_model, residency_stats, set_memory_budget
+from backend.services.streaming import TokenChannel, ThinkSplitter, flush_window, sse_stats
+from backend.services.streaming import register_request, cancel_request, finish_request, cancel_stats, streaming_status
+from backend.services.streaming import Signal, Park, ParkingStream
+from backend.services.response_cache import response_cache, replay_pieces
+from backend.services.context import fit_prompt, counter_for, summarizer
+from backend.services.embeddings import embedding_service
+from backend.services.search import search_stage
+from backend.services.sources import sources_budget, source_stats
+from backend.services.admission import admission, AdmissionRejected, PRIORITIES, run_admitted
+from backend.services import workers as model_workers
+from backend.services.tuner import perf_tuner, prompt_bucket, objective_for, arm_config, arm_of, stream_key
+from backend.services.inference import context_summarizer, load_stats, load_pipeline_async, load_status, create_chat_session, get_chat_session, delete_chat_session, session_generate, session_stats
 from backend.utils.tasks import task_store
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 MODELS_DIR = models_root(BASE_DIR)
+if os.environ.get("AIFUNLAND_EMBED_MODEL") and os.environ.get("AIFUNLAND_RESPONSE_CACHE_SEMANTIC", "0") == "1":
+    # the semantic cache tier only runs on a real embedding model
+    response_cache.set_embedder(embedding_service.embedder(MODELS_DIR / os.environ["AIFUNLAND_EMBED_MODEL"].replace("/", "__")), float(os.environ.get("AIFUNLAND_RESPONSE_CACHE_SIM", 0.9)))
 PERF = {"lat": {"CPU": [], "GPU": [], "NPU": [], "NVIDIA": []}, "ttft": {"CPU": [], "GPU": [], "NPU": [], "NVIDIA": []}, "tpot": {"CPU": [], "GPU": [], "NPU": [], "NVIDIA": []}, "throughput": {"CPU": [], "GPU": [], "NPU": [], "NVIDIA": []}, "gen": {"CPU": [], "GPU": [], "NPU": [], "NVIDIA": []}, "last": {}, "warn": None}
-PMODE_STATE = {"CPU": {"mode": "CUMULATIVE_THROUGHPUT", "stable": 0}, "GPU": {"mode": "CUMULATIVE_THROUGHPUT", "stable": 0}, "NPU": {"mode": "CUMULATIVE_THROUGHPUT", "stable": 0}, "NVIDIA": {"mode": "CUMULATIVE_THROUGHPUT", "stable": 0}}
-
-def _choose_perf_mode(config, device):
-    key = device if device in PERF["lat"] else ("NPU" if "NPU" in device else ("GPU" if "GPU" in device else ("CPU" if "CPU" in device else "CPU")))
-    tt = PERF["ttft"].get(key) or []
-    th = PERF["throughput"].get(key) or []
-    lat = PERF["lat"].get(key) or []
-    def _avg(a):
-        return float(sum(a)/len(a)) if a else None
-    def _var(a):
-        if not a:
-            return None
-        m = _avg(a)
-        return float(sum((x-m)*(x-m) for x in a)/len(a))
-    tt_m = _avg(tt) or 0.0
-    tt_v = _var(tt) or 0.0
-    th_m = _avg(th) or 0.0
-    lat_m = _avg(lat) or 0.0
-    max_new = int(config.get("max_new_tokens")) if config.get("max_new_tokens") is not None else 512
-    num_req = int(config.get("num_requests")) if config.get("num_requests") is not None else 1
-    want_thr = (max_new >= 512 or num_req > 1) or (th_m >= 1.0 and tt_m >= 800)
-    want_lat = tt_m >= 1500 and th_m < 2.0
-    st = PMODE_STATE.get(key)
-    cur = st["mode"]
-    if want_thr and cur != "THROUGHPUT":
-        st["stable"] += 1
-        if st["stable"] >= 3:
-            st["mode"] = "THROUGHPUT"
-            st["stable"] = 0
-    elif want_lat and cur != "LATENCY":
-        st["stable"] += 1
-        if st["stable"] >= 3:
-            st["mode"] = "LATENCY"
-            st["stable"] = 0
-    else:
-        st["stable"] = max(0, st["stable"]-1)
-    return st["mode"]
+
+def _choose_perf_mode(config, device, model_id=None, prompt=None):
+    """Resolve perf_mode AUTO through the online tuner; returns the arm to report back, if any."""
+    if config.get("prefill_igpu_decode_npu"):
+        # load_pipeline pins LATENCY for the iGPU prefill / NPU decode split
+        config["perf_mode"] = "LATENCY"
+        return None
+    sk = stream_key(device)
+    arm = perf_tuner.choose(str(model_id or ""), device, prompt_bucket(prompt), objective_for(config), config.get(sk) if sk else None)
+    config.update(arm_config(device, arm))
+    return arm
+
+def _wants_sources(config):
+    return bool(config.get("web_search")) or str(config.get("retrieval") or "").lower() == "local"
+
+def _gather_sources(config, prompt):
+    """(sources, origin) for augment_with_sources: the local index for retrieval "local", else web search."""
+    from backend.services import inference as _inf
+    q = config.get("search_query") or prompt
+    if str(config.get("retrieval") or "").lower() == "local":
+        from backend.services.docindex import local_index
+        return local_index().search(q, k=int(config.get("retrieval_k") or 5)), "local"
+    return _inf.web_search(q, max_results=5), "web"
+
+_SOURCES_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sources")
+# pipeline loads and generations behind /api/infer/stream; admission bounds how many run at once
+_STREAM_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("AIFUNLAND_STREAM_WORKERS", 32)), thread_name_prefix="stream")
+
+def _start_sources(config, prompt):
+    """Runs _gather_sources in the background so retrieval overlaps model loading; None if not requested."""
+    if not _wants_sources(config):
+        return None
+    return _SOURCES_POOL.submit(_gather_sources, config, prompt)
+
+def _cpu_replicas(config, device):
+    """Replica count from `cpu_replicas` (an int, or "auto" for one per NUMA node); 1 off CPU."""
+    v = config.get("cpu_replicas") or os.environ.get("AIFUNLAND_CPU_REPLICAS")
+    if device != "CPU" or not v:
+        return 1
+    if str(v).lower() == "auto":
+        from backend.services.system import numa_nodes
+        return len(numa_nodes())
+    try:
+        return max(1, int(v))
+    except Exception:
+        return 1
+
+def _load_for_request(model_dir, device, config, session=False):
+    """The pipeline for a request: a worker-process proxy in worker mode or for CPU replicas, else the in-process pipeline.
+
+    Session turns always run in-process: chat state (start_chat) and the
+    tokenizer live on the pipeline object, which workers do not expose.
+    """
+    replicas = _cpu_replicas(config, device)
+    if not session and (replicas > 1 or model_workers.enabled()):
+        return model_workers.worker_pool().pipeline(model_dir, device, config, replicas=replicas)
+    return load_pipeline(model_dir, device, config)
+
+def _client_id():
+    # the server binds to localhost, so remote_addr would put every caller under one fair-share quota
+    return request.headers.get("X-Client-Id") or None
+
+def _admission_args(data, config, default="interactive"):
+    """(priority class, deadline_ms) from the request body or config."""
+    cls = str(data.get("priority") or config.get("priority") or default).lower()
+    if cls not in PRIORITIES:
+        cls = default
+    dl = data.get("deadline_ms") or config.get("deadline_ms")
+    try:
+        dl = float(dl) if dl else None
+    except Exception:
+        dl = None
+    return cls, dl
+
+def _rejected(e):
+    resp = jsonify({"error": "admission_rejected", "reason": e.reason, "retry_after_s": e.retry_after_s})
+    if e.retry_after_s:
+        resp.headers["Retry-After"] = str(max(1, int(round(e.retry_after_s))))
+    return resp, (429 if e.reason == "client_queue_full" else 503)
+
+def _tuner_observe(model_id, device, prompt, pipe, chosen, metrics):
+    if not chosen or not isinstance(metrics, dict):
+        return
+    ran = arm_of(pipe, device, chosen)
+    perf_tuner.observe(str(model_id or ""), device, prompt_bucket(prompt), ran, metrics.get("ttft_ms"), metrics.get("throughput_tps"), chosen)
+    metrics["perf_tuner"] = {"arm": ran, "chosen": chosen}
 
 app = APIFlask(
     __name__,
@@ -88,6 +153,10 @@ def index():
 def api_system_info():
     return jsonify(get_info())
 
+@app.post("/api/system/refresh_devices")
+def api_system_refresh_devices():
+    return jsonify(refresh_device_topology())
+
 def _pick_default_model_id():
     import os
     env_id = os.environ.get("AIFUNLAND_DEFAULT_MODEL_ID")
@@ -111,18 +180,7 @@ def _preload_on_start():
         dev = os.environ.get("AIFUNLAND_DEFAULT_DEVICE") or "HETERO:NPU,GPU"
         cfg = {"perf_mode": "LATENCY", "hetero_enable": True, "max_prompt_len": 512, "min_response_len": 8, "auto_multi": True, "prefill_igpu_decode_npu": True}
         model_dir = MODELS_DIR / mid
-        def _bg():
-            try:
-                pipe = load_pipeline(model_dir, dev, cfg)
-                try:
-                    g2 = pipe.get_generation_config()
-                    g2.max_new_tokens = 1
-                    _ = pipe.generate("warmup", g2)
-                except Exception:
-                    pass
-            except Exception:
-                pass
-        threading.Thread(target=_bg, daemon=True).start()
+        load_pipeline_async(model_dir, dev, cfg, warmup=True, priority="warmup")
     except Exception:
         pass
 
@@ -141,8 +199,8 @@ def api_models_is_loaded():
     if not model_id:
         return jsonify({"error": "model_id required"}), 400
     model_dir = MODELS_DIR / model_id.replace("/", "__")
-    ok = is_model_loaded(model_dir, device)
-    return jsonify({"loaded": bool(ok)})
+    st = load_status(model_dir, device)
+    return jsonify({"loaded": st["state"] in ("ready", "warming"), **st})
 
 def _get_cache_dir():
     import os
@@ -187,7 +245,7 @@ def _run_modelscope_download(task_id, model_id, local_dir, include=None, exclude
             try:
                 from backend.services.inference import export_model_ir
                 save_dir = MODELS_DIR / (local_dir.name + "_ov_fp32")
-                threading.Thread(target=lambda: export_model_ir(local_dir, save_dir), daemon=True).start()
+                threading.Thread(target=lambda: run_admitted("maintenance", model_workers.run_isolated, export_model_ir, local_dir, save_dir), daemon=True).start()
             except Exception:
                 pass
         else:
@@ -219,7 +277,7 @@ def _run_modelscope_download(task_id, model_id, local_dir, include=None, exclude
                     try:
                         from backend.services.inference import export_model_ir
                         save_dir = MODELS_DIR / (local_dir.name + "_ov_fp32")
-                        threading.Thread(target=lambda: export_model_ir(local_dir, save_dir), daemon=True).start()
+                        threading.Thread(target=lambda: run_admitted("maintenance", model_workers.run_isolated, export_model_ir, local_dir, save_dir), daemon=True).start()
                     except Exception:
                         pass
                     return
@@ -256,7 +314,7 @@ def _run_modelscope_download(task_id, model_id, local_dir, include=None, exclude
                 try:
                     from backend.services.inference import export_model_ir
                     save_dir = MODELS_DIR / (local_dir.name + "_ov_fp32")
-                    threading.Thread(target=lambda: export_model_ir(local_dir, save_dir), daemon=True).start()
+                    threading.Thread(target=lambda: run_admitted("maintenance", model_workers.run_isolated, export_model_ir, local_dir, save_dir), daemon=True).start()
                 except Exception:
                     pass
             except Exception as e2:
@@ -404,13 +462,193 @@ def api_models_export_ir():
         try:
             from backend.services.inference import export_model_ir
             task_store.update(task_id, status="running", progress=1, message="exporting")
-            result = export_model_ir(src, dest)
+            result = run_admitted("maintenance", model_workers.run_isolated, export_model_ir, src, dest)
             task_store.complete(task_id, result=result)
         except Exception as e:
             task_store.update(task_id, status="error", error=str(e))
     threading.Thread(target=_bg, daemon=True).start()
     return jsonify({"task_id": task_id})
 
+def _job_file(job_dir: Path, name) -> Path | None:
+    """`name` resolved inside job_dir; None when it points anywhere else."""
+    root = job_dir.resolve()
+    try:
+        p = (root / str(name)).resolve()
+    except Exception:
+        return None
+    if p == root or root not in p.parents:
+        return None
+    return p
+
+@app.post("/api/jobs/batch")
+def api_jobs_batch():
+    import uuid
+    from backend.services.batch import run_batch_job
+    if request.files:
+        data = dict(request.form)
+        try:
+            data["config"] = json.loads(data.get("config") or "{}")
+        except Exception:
+            return jsonify({"error": "invalid_parameter", "message": "config must be JSON"}), 400
+    else:
+        data = request.get_json(force=True) or {}
+    model_id = data.get("model_id")
+    device = data.get("device", "CPU")
+    config = data.get("config") or {}
+    if not model_id:
+        return jsonify({"error": "model_id required"}), 400
+    err_msg = _validate_chat_config(config)
+    if err_msg:
+        return jsonify({"error": "invalid_parameter", "message": err_msg}), 400
+    model_dir = MODELS_DIR / model_id.replace("/", "__")
+    if not model_dir.exists():
+        return jsonify({"error": "model_not_found"}), 404
+    job_id = str(data.get("job_id") or uuid.uuid4().hex)
+    if not job_id.isalnum():
+        return jsonify({"error": "invalid_parameter", "message": "job_id must be alphanumeric"}), 400
+    job_dir = _get_cache_dir() / "jobs" / job_id
+    job_dir.mkdir(parents=True, exist_ok=True)
+    input_path = job_dir / "input.jsonl"
+    if "file" in request.files:
+        request.files["file"].save(str(input_path))
+    elif data.get("prompts"):
+        with open(input_path, "w", encoding="utf-8") as f:
+            for p in data["prompts"]:
+                f.write(json.dumps(p if isinstance(p, dict) else {"prompt": str(p)}, ensure_ascii=False) + "\n")
+    elif data.get("input_path"):
+        input_path = _job_file(job_dir, data["input_path"])
+        if input_path is None:
+            return jsonify({"error": "invalid_parameter", "message": "input_path must stay inside the job directory"}), 400
+    if not input_path.exists():
+        return jsonify({"error": "input required", "message": "upload a JSONL file, or pass prompts, input_path or an existing job_id"}), 400
+    output_path = _job_file(job_dir, data["output_path"]) if data.get("output_path") else job_dir / "output.jsonl"
+    if output_path is None:
+        return jsonify({"error": "invalid_parameter", "message": "output_path must stay inside the job directory"}), 400
+    offset = data.get("offset")
+    try:
+        offset = int(offset) if offset not in (None, "") else None
+        batch_size = int(data["batch_size"]) if data.get("batch_size") else None
+    except ValueError:
+        return jsonify({"error": "invalid_parameter", "message": "offset and batch_size must be integers"}), 400
+    task_id = task_store.create("batch")
+    threading.Thread(target=run_admitted, args=("batch", run_batch_job, task_id, model_dir, device, input_path, output_path, config, offset, batch_size), daemon=True).start()
+    return jsonify({"task_id": task_id, "job_id": job_id, "output": str(output_path)})
+
+@app.get("/api/jobs/batch/<job_id>/output")
+def api_jobs_batch_output(job_id):
+    if not job_id.isalnum():
+        return jsonify({"error": "not_found"}), 404
+    job_dir = _get_cache_dir() / "jobs" / job_id
+    if not (job_dir / "output.jsonl").exists():
+        return jsonify({"error": "not_found"}), 404
+    return send_from_directory(str(job_dir), "output.jsonl", mimetype="application/x-ndjson")
+
+@app.post("/api/models/autotune")
+def api_models_autotune():
+    from backend.services.autotune import run_autotune
+    data = request.get_json(force=True) or {}
+    model_id = data.get("model_id")
+    device = data.get("device", "CPU")
+    config = data.get("config") or {}
+    if not model_id:
+        return jsonify({"error": "model_id required"}), 400
+    err_msg = _validate_chat_config(config)
+    if err_msg:
+        return jsonify({"error": "invalid_parameter", "message": err_msg}), 400
+    model_dir = MODELS_DIR / model_id.replace("/", "__")
+    if not model_dir.exists():
+        return jsonify({"error": "model_not_found"}), 404
+    task_id = task_store.create("autotune")
+    threading.Thread(target=run_admitted, args=("maintenance", run_autotune, task_id, model_dir, device, config), daemon=True).start()
+    return jsonify({"task_id": task_id})
+
+@app.get("/api/models/autotune")
+def api_models_autotune_profile():
+    from backend.services.autotune import read_profiles, host_id
+    model_id = request.args.get("model_id")
+    if not model_id:
+        return jsonify({"error": "model_id required"}), 400
+    model_dir = MODELS_DIR / model_id.replace("/", "__")
+    if not model_dir.exists():
+        return jsonify({"error": "model_not_found"}), 404
+    return jsonify({"host": host_id(), "profiles": read_profiles(model_dir)})
+
+@app.post("/api/embed")
+def api_embed():
+    import os
+    from backend.services.embeddings import quantize_int8
+    data = request.get_json(force=True) or {}
+    model_id = data.get("model_id") or os.environ.get("AIFUNLAND_EMBED_MODEL")
+    device = data.get("device", "CPU")
+    texts = data.get("texts")
+    if texts is None and data.get("input") is not None:
+        texts = [data["input"]]
+    if not model_id or not isinstance(texts, list) or not texts:
+        return jsonify({"error": "model_id and texts required"}), 400
+    dtype = str(data.get("dtype") or "float32").lower()
+    if dtype not in ("float32", "int8"):
+        return jsonify({"error": "invalid_parameter", "message": "dtype must be float32 or int8"}), 400
+    model_dir = MODELS_DIR / model_id.replace("/", "__")
+    if not model_dir.exists():
+        return jsonify({"error": "model_not_found"}), 404
+    try:
+        import time
+        t0 = time.perf_counter()
+        cls, deadline_ms = _admission_args(data, data.get("config") or {})
+        with admission.admit(cls, _client_id(), deadline_ms):
+            vecs = embedding_service.embed(model_dir, texts, device, data.get("config") or {})
+        out = {"dim": int(vecs.shape[1]) if vecs.ndim == 2 else 0, "dtype": dtype, "count": len(texts)}
+        if dtype == "int8":
+            q, scale = quantize_int8(vecs)
+            out["embeddings"] = q.tolist()
+            out["scales"] = scale.tolist()
+        else:
+            out["embeddings"] = vecs.tolist()
+        out["ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+        return jsonify(out)
+    except AdmissionRejected as e:
+        return _rejected(e)
+    except Exception as e:
+        logger.error(f"Embedding failed: {str(e)}", exc_info=True)
+        return jsonify({"error": "internal_error", "message": str(e)}), 500
+
+@app.post("/api/index/ingest")
+def api_index_ingest():
+    from backend.services.docindex import local_index
+    data = request.get_json(force=True) or {}
+    folder = data.get("path")
+    if not folder or not Path(folder).is_dir():
+        return jsonify({"error": "invalid_parameter", "message": "path must be an existing folder"}), 400
+    task_id = task_store.create("index")
+    def _run():
+        task_store.update(task_id, status="running", progress=1, message="scanning")
+        try:
+            def _progress(i, n):
+                task_store.update(task_id, progress=max(1, min(99, int(100 * i / n))), message=f"{i}/{n} files")
+            result = run_admitted("maintenance", local_index().ingest, folder, progress=_progress)
+            task_store.complete(task_id, result=result)
+        except Exception as e:
+            task_store.update(task_id, status="error", error=str(e))
+    threading.Thread(target=_run, daemon=True).start()
+    return jsonify({"task_id": task_id})
+
+@app.get("/api/index/search")
+def api_index_search():
+    from backend.services.docindex import local_index
+    q = request.args.get("q")
+    if not q:
+        return jsonify({"error": "q required"}), 400
+    try:
+        k = max(1, min(50, int(request.args.get("k", 5))))
+    except ValueError:
+        return jsonify({"error": "invalid_parameter", "message": "k must be an integer"}), 400
+    return jsonify({"results": local_index().search(q, k=k)})
+
+@app.get("/api/index/stats")
+def api_index_stats():
+    from backend.services.docindex import local_index
+    return jsonify(local_index().stats())
+
 @app.get("/api/tasks/<task_id>")
 def api_task_status(task_id):
     t = task_store.get(task_id)
@@ -421,28 +659,33 @@ def api_task_status(task_id):
 @app.get("/api/tasks/stream/<task_id>")
 def api_task_stream(task_id):
     def _stream():
-        q = task_store.subscribe(task_id)
+        q = task_store.subscribe(task_id, signal=Signal())
         try:
             while True:
                 try:
-                    # Wait for update (timeout to keep connection alive)
-                    data = q.get(timeout=15)
-                    yield f"data: {json.dumps(data)}\n\n"
-                    if data.get("status") in ("completed", "error"):
-                        break
+                    data = q.get_nowait()
                 except queue.Empty:
-                    # Keep-alive comment
-                    yield ": keep-alive\n\n"
-                    # check if task still exists/valid
-                    curr = task_store.get(task_id)
-                    if not curr:
-                        break
+                    # Wait for update (timeout to keep connection alive)
+                    q.signal.clear()
+                    if q.empty():
+                        yield Park(q.signal, 15)
+                    if q.empty():
+                        # Keep-alive comment
+                        yield ": keep-alive\n\n"
+                        # check if task still exists/valid
+                        curr = task_store.get(task_id)
+                        if not curr:
+                            break
+                    continue
+                yield f"data: {json.dumps(data)}\n\n"
+                if data.get("status") in ("completed", "error"):
+                    break
         except GeneratorExit:
             pass
         finally:
             task_store.unsubscribe(task_id, q)
 
-    return app.response_class(_stream(), mimetype="text/event-stream")
+    return app.response_class(ParkingStream(_stream()), mimetype="text/event-stream")
 
 @app.post("/api/models/quantize")
 def api_models_quantize():
@@ -462,7 +705,7 @@ def api_models_quantize():
     def _run():
         task_store.update(task_id, status="running", message="quantizing")
         try:
-            result = quantize_model(src, out, mode, params)
+            result = run_admitted("maintenance", model_workers.run_isolated, quantize_model, src, out, mode, params)
             try:
                 release_model(src)
             except Exception:
@@ -519,8 +762,57 @@ def api_models_release():
         return jsonify({"error": "model_id required"}), 400
     target = MODELS_DIR / model_id.replace("/", "__")
     release_model(target)
+    model_workers.worker_pool().stop(target)
     return jsonify({"ok": True})
 
+@app.get("/api/models/residency")
+def api_models_residency():
+    return jsonify(residency_stats())
+
+@app.post("/api/models/residency")
+def api_models_residency_budget():
+    data = request.get_json(force=True)
+    budget_mb = data.get("budget_mb")
+    try:
+        if budget_mb is not None and float(budget_mb) <= 0:
+            return jsonify({"error": "invalid_parameter", "message": "budget_mb must be positive"}), 400
+        return jsonify(set_memory_budget(budget_mb))
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid_parameter", "message": "budget_mb must be a number"}), 400
+
+def _is_thinking_model(model_id):
+    # DeepSeek-R1 style templates open the <think> block inside the prompt
+    mid_lower = str(model_id).lower()
+    return "deepseek" in mid_lower and ("r1" in mid_lower or "reasoner" in mid_lower)
+
+def _strip_think(text):
+    s = str(text or "")
+    p = s.lower().find("</think>")
+    return s[p+8:].strip() if p != -1 else s
+
+def _replay_cached(cached, model_id, config):
+    chan = TokenChannel(*flush_window(config))
+    think = ThinkSplitter(in_think=_is_thinking_model(model_id), max_chars=_max_thinking_chars(config))
+    for piece in replay_pieces(cached["text"]):
+        for ev, text in think.feed(piece):
+            chan.put(text, ev)
+    for ev, text in think.flush():
+        chan.put(text, ev)
+    chan.close()
+    for ev, item, _n in chan.chunks():
+        yield chan.frame(ev, {"text": item})
+    metrics = {**cached["metrics"], "cache": cached["tier"], "cache_age_s": cached["age_s"]}
+    yield chan.frame("final", {"text": _strip_think(cached["text"]), "metrics": metrics, "stream": chan.stats(), "thinking": think.stats()})
+
+def _max_thinking_chars(config):
+    v = config.get("max_thinking_chars")
+    if v is None:
+        v = os.environ.get("AIFUNLAND_MAX_THINKING_CHARS", 65536)
+    try:
+        return int(v)
+    except Exception:
+        return 65536
+
 def _validate_chat_config(config):
     try:
         if "max_new_tokens" in config:
@@ -543,6 +835,40 @@ def _validate_chat_config(config):
             rp = float(config["repetition_penalty"])
             if rp < 0.1 or rp > 10.0: # reasonable range
                  return "repetition_penalty must be between 0.1 and 10.0"
+        if "num_assistant_tokens" in config:
+            nat = int(config["num_assistant_tokens"])
+            if nat < 1 or nat > 32:
+                return "num_assistant_tokens must be between 1 and 32"
+        if "assistant_confidence_threshold" in config:
+            act = float(config["assistant_confidence_threshold"])
+            if act <= 0.0 or act >= 1.0:
+                return "assistant_confidence_threshold must be between 0.0 and 1.0"
+        if config.get("decode_mode") not in (None, "", "default", "prompt_lookup"):
+            return "decode_mode must be 'default' or 'prompt_lookup'"
+        if "max_ngram_size" in config:
+            mns = int(config["max_ngram_size"])
+            if mns < 1 or mns > 16:
+                return "max_ngram_size must be between 1 and 16"
+        if "num_candidates" in config:
+            nc = int(config["num_candidates"])
+            if nc < 1 or nc > 32:
+                return "num_candidates must be between 1 and 32"
+        if "context_budget" in config:
+            cb = int(config["context_budget"])
+            if cb < 0 or cb > 131072:
+                return "context_budget must be between 0 and 131072"
+        if "max_thinking_chars" in config:
+            mtc = int(config["max_thinking_chars"])
+            if mtc < 0 or mtc > 1000000:
+                return "max_thinking_chars must be between 0 and 1000000"
+        if "sse_flush_ms" in config:
+            fm = int(config["sse_flush_ms"])
+            if fm < 0 or fm > 1000:
+                return "sse_flush_ms must be between 0 and 1000"
+        if "sse_flush_tokens" in config:
+            ft = int(config["sse_flush_tokens"])
+            if ft < 1 or ft > 256:
+                return "sse_flush_tokens must be between 1 and 256"
     except ValueError:
         return "Invalid numeric parameters in config"
     return None
@@ -570,23 +896,47 @@ def api_infer_chat():
     if not model_dir.exists():
         return jsonify({"error": "model_not_found"}), 404
     
+    ticket = None
     try:
         import time
         t0 = time.time()
+        cached = None if _wants_sources(config) else response_cache.lookup(model_id, prompt, config)
+        if cached is not None:
+            metrics = {**cached["metrics"], "cache": cached["tier"], "cache_age_s": cached["age_s"]}
+            return jsonify({"output": _strip_think(cached["text"]), "metrics": metrics})
+        try:
+            cls, deadline_ms = _admission_args(data, config)
+            ticket = admission.request(cls, _client_id(), deadline_ms)
+            ticket.wait()
+        except AdmissionRejected as e:
+            return _rejected(e)
+        tuned = None
         if str(config.get("perf_mode", "")).upper() == "AUTO":
-            config["perf_mode"] = _choose_perf_mode(config, device)
-        if config.get("web_search"):
+            tuned = _choose_perf_mode(config, device, model_id, prompt)
+        sources_fut = _start_sources(config, prompt)
+        pipe = _load_for_request(model_dir, device, config)
+        cur_dev = getattr(pipe, "_af_device", device)
+        cur_real = getattr(pipe, "_af_device_real", cur_dev)
+        prompt_ctx, ctx_info = fit_prompt(prompt, config, counter_for(pipe), context_summarizer(pipe))
+        src_info = {}
+        if sources_fut is not None:
             try:
-                from backend.services.inference import web_search, augment_with_sources
-                q = config.get("search_query") or prompt
-                sources = web_search(q, max_results=5)
-                prompt = augment_with_sources(prompt, sources, lang="zh")
+                from backend.services.inference import augment_with_sources
+                sources, origin = sources_fut.result()
+                counter = counter_for(pipe)
+                prompt_ctx = augment_with_sources(prompt_ctx, sources, lang="zh", origin=origin, query=config.get("search_query") or prompt,
+                                                  budget=sources_budget(config, counter(prompt_ctx)), count=counter, info=src_info)
             except Exception:
                 pass
-        pipe = load_pipeline(model_dir, device, config)
-        cur_dev = getattr(pipe, "_af_device", device)
-        cur_real = getattr(pipe, "_af_device_real", cur_dev)
-        output, metrics = generate(pipe, prompt, config)
+        output, metrics = submit_generation(pipe, prompt_ctx, config)
+        if isinstance(metrics, dict):
+            metrics["context"] = ctx_info
+            metrics["admission_queue_ms"] = round(ticket.wait_ms, 1)
+            if src_info:
+                metrics["sources"] = src_info
+        _tuner_observe(model_id, device, prompt, pipe, tuned, metrics)
+        if not _wants_sources(config):
+            response_cache.store(model_id, prompt, config, output, metrics)
         try:
             s = str(output)
             p = s.lower().find("</think>")
@@ -683,6 +1033,67 @@ def api_infer_chat():
                 "device": device
             }), 200
         return jsonify({"error": "internal_error", "message": msg}), 500
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+@app.post("/api/chat/sessions")
+def api_chat_session_create():
+    data = request.get_json(force=True)
+    model_id = data.get("model_id")
+    device = data.get("device", "CPU")
+    if not model_id:
+        return jsonify({"error": "model_id required"}), 400
+    model_dir = MODELS_DIR / model_id.replace("/", "__")
+    if not model_dir.exists():
+        return jsonify({"error": "model_not_found"}), 404
+    sess = create_chat_session(model_dir, device, data.get("system"))
+    return jsonify({"session_id": sess["id"], "model_id": model_id, "device": device})
+
+@app.get("/api/chat/sessions/<session_id>")
+def api_chat_session_get(session_id):
+    sess = get_chat_session(session_id)
+    if not sess:
+        return jsonify({"error": "not_found"}), 404
+    return jsonify({"session_id": sess["id"], "device": sess["device"], "turns": sess["turns"], "history": sess["history"]})
+
+@app.delete("/api/chat/sessions/<session_id>")
+def api_chat_session_delete(session_id):
+    return jsonify({"ok": delete_chat_session(session_id)})
+
+@app.post("/api/chat/sessions/<session_id>/messages")
+def api_chat_session_message(session_id):
+    sess = get_chat_session(session_id)
+    if not sess:
+        return jsonify({"error": "not_found"}), 404
+    data = request.get_json(force=True)
+    prompt = data.get("prompt")
+    config = data.get("config", {})
+    if not prompt:
+        return jsonify({"error": "prompt required"}), 400
+    err_msg = _validate_chat_config(config)
+    if err_msg:
+        return jsonify({"error": "invalid_parameter", "message": err_msg}), 400
+    try:
+        cls, deadline_ms = _admission_args(data, config)
+        with admission.admit(cls, _client_id(), deadline_ms) as ticket:
+            pipe = load_pipeline(Path(sess["model_dir"]), sess["device"], config)
+            output, metrics = session_generate(sess, pipe, prompt, config)
+        if isinstance(metrics, dict):
+            metrics["admission_queue_ms"] = round(ticket.wait_ms, 1)
+        try:
+            s = str(output)
+            p = s.lower().find("</think>")
+            if p != -1:
+                output = s[p+8:].strip()
+        except Exception:
+            pass
+        return jsonify({"output": output, "metrics": metrics, "session_id": session_id})
+    except AdmissionRejected as e:
+        return _rejected(e)
+    except Exception as e:
+        logger.error(f"Session generation failed: {str(e)}", exc_info=True)
+        return jsonify({"error": "internal_error", "message": str(e)}), 500
 
 @app.post("/api/infer/preload")
 def api_infer_preload():
@@ -703,23 +1114,11 @@ def api_infer_preload():
         cfg["prefill_igpu_decode_npu"] = True
     if str(cfg.get("perf_mode", "")).upper() == "AUTO":
         try:
-            cfg["perf_mode"] = _choose_perf_mode(cfg, device)
+            _choose_perf_mode(cfg, device, model_id)
         except Exception:
             pass
-    def _bg():
-        try:
-            pipe = load_pipeline(model_dir, device, cfg)
-            try:
-                g2 = pipe.get_generation_config()
-                g2.max_new_tokens = 1
-                _ = pipe.generate("warmup", g2)
-            except Exception:
-                pass
-        except Exception:
-            pass
-    t = threading.Thread(target=_bg, daemon=True)
-    t.start()
-    return jsonify({"ok": True, "async": True})
+    job = load_pipeline_async(model_dir, device, cfg, warmup=True, priority="warmup")
+    return jsonify({"ok": True, "async": True, **job.status()})
 def _encode_bmp(arr):
     import numpy as np, struct
     h = int(arr.shape[0])
@@ -849,8 +1248,10 @@ def api_image_generate():
         idx_final = mdir / "model_index.json"
         if not idx_final.exists():
             return jsonify({"error": "model_index_missing"}), 404
-        pipe = load_t2i_pipeline(mdir, devs, props)
-        image_tensor = t2i_generate(pipe, prompt, width=width, height=height, steps=steps, guidance_scale=guidance)
+        cls, deadline_ms = _admission_args(data, {})
+        with admission.admit(cls, _client_id(), deadline_ms):
+            pipe = load_t2i_pipeline(mdir, devs, props)
+            image_tensor = t2i_generate(pipe, prompt, width=width, height=height, steps=steps, guidance_scale=guidance)
         import base64
         arr = getattr(image_tensor, 'data', None)
         if arr is None:
@@ -859,6 +1260,8 @@ def api_image_generate():
         bmp = _encode_bmp(img)
         b64 = base64.b64encode(bmp).decode('ascii')
         return jsonify({"mime": "image/bmp", "image_b64": b64, "width": int(img.shape[1]), "height": int(img.shape[0])})
+    except AdmissionRejected as e:
+        return _rejected(e)
     except Exception as e:
         logger.error(f"Image generation failed: {str(e)}", exc_info=True)
         return jsonify({"error": "internal_error", "message": str(e)}), 500
@@ -1040,10 +1443,11 @@ def api_video_generate():
         else:
             return jsonify({"error": "model_not_found"}), 404
     try:
-        from modelscope.pipelines import pipeline
-        from modelscope.utils.constant import Tasks
-        p = pipeline(task=Tasks.text_to_video_synthesis, model=str(mdir))
-        out = p({"text": prompt})
+        from backend.services.inference import load_t2v_pipeline
+        cls, deadline_ms = _admission_args(data, {})
+        with admission.admit(cls, _client_id(), deadline_ms):
+            p = load_t2v_pipeline(mdir)
+            out = p({"text": prompt})
         vid = out.get("output_video") or out.get("video")
         if not vid:
             return jsonify({"error": "no_video"}), 500
@@ -1059,6 +1463,8 @@ def api_video_generate():
         except Exception:
             return jsonify({"error": "copy_failed"}), 500
         return jsonify({"video_url": f"/api/video/get/{name}"})
+    except AdmissionRejected as e:
+        return _rejected(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 @app.get("/api/infer/stream")
@@ -1066,6 +1472,11 @@ def api_infer_stream():
     model_id = request.args.get("model_id")
     device = request.args.get("device", "CPU")
     prompt = request.args.get("prompt")
+    session_id = request.args.get("session_id")
+    import re, uuid
+    request_id = request.args.get("request_id") or ""
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", request_id):
+        request_id = uuid.uuid4().hex
     cfg_s = request.args.get("config")
     try:
         config = json.loads(cfg_s) if cfg_s else {}
@@ -1085,29 +1496,81 @@ def api_infer_stream():
     if "auto_multi" not in config:
         config["auto_multi"] = True
     if "prefill_igpu_decode_npu" not in config:
-        config["prefill_igpu_decode_npu"] = True
+        # the split pins LATENCY; AUTO leaves the choice to the perf tuner
+        config["prefill_igpu_decode_npu"] = str(config.get("perf_mode", "")).upper() != "AUTO"
+    sess = None
+    if session_id:
+        sess = get_chat_session(session_id)
+        if not sess:
+            def _err_sess():
+                yield "event: error\n"
+                yield "data: {\"error\": \"session_not_found\"}\n\n"
+            return app.response_class(_err_sess(), mimetype="text/event-stream")
+        model_id = model_id or Path(sess["model_dir"]).name
+        device = sess["device"]
     if not model_id or not prompt:
         def _err():
             yield "event: error\n"
             yield "data: {\"error\": \"model_id and prompt required\"}\n\n"
         return app.response_class(_err(), mimetype="text/event-stream")
-    model_dir = MODELS_DIR / model_id.replace("/", "__")
+    model_dir = Path(sess["model_dir"]) if sess else MODELS_DIR / model_id.replace("/", "__")
     if not model_dir.exists():
         def _err2():
             yield "event: error\n"
             yield "data: {\"error\": \"model_not_found\"}\n\n"
         return app.response_class(_err2(), mimetype="text/event-stream")
+    adm_cls, adm_deadline = _admission_args(request.args, config)
+    client = _client_id()
     def _gen():
-        import time, queue, threading
+        import time, threading
+        cancel = register_request(request_id, config.get("max_new_tokens"))
+        ticket = None
         try:
             yield "event: start\n"
-            yield "data: {}\n\n"
+            # a client id already in use was replaced; cancel with the one sent here
+            yield "data: " + json.dumps({"request_id": cancel.request_id}) + "\n\n"
             t0 = time.time()
+            cacheable = sess is None and not _wants_sources(config)
+            cached = response_cache.lookup(model_id, prompt, config) if cacheable else None
+            if cached is not None:
+                yield from _replay_cached(cached, model_id, config)
+                return
+            try:
+                ticket = admission.request(adm_cls, client, adm_deadline)
+                while not ticket.wait(0):
+                    yield Park(ticket.signal, 0.5)
+                    if ticket.wait(0):
+                        break
+                    yield "event: queued\n"
+                    yield "data: " + json.dumps({"priority": adm_cls, "wait_ms": round(ticket.wait_ms)}) + "\n\n"
+            except AdmissionRejected as e:
+                yield "event: error\n"
+                yield "data: " + json.dumps({"error": "admission_rejected", "reason": e.reason, "retry_after_s": e.retry_after_s}) + "\n\n"
+                return
+            tuned = None
             if str(config.get("perf_mode", "")).upper() == "AUTO":
-                config["perf_mode"] = _choose_perf_mode(config, device)
+                tuned = _choose_perf_mode(config, device, model_id, prompt)
             
+            sources_fut = _start_sources(config, prompt)
+            loaded = {}
+            load_done = Signal()
+            def _load():
+                try:
+                    loaded["pipe"] = _load_for_request(model_dir, device, config, session=sess is not None)
+                except Exception as e:
+                    loaded["error"] = e
+                finally:
+                    load_done.set()
+            _STREAM_POOL.submit(_load)
+            yield Park(load_done, 0.5)
+            while not load_done.is_set():
+                yield "event: loading\n"
+                yield "data: " + json.dumps(load_status(model_dir, device)) + "\n\n"
+                yield Park(load_done, 0.5)
             try:
-                pipe = load_pipeline(model_dir, device, config)
+                if "error" in loaded:
+                    raise loaded["error"]
+                pipe = loaded["pipe"]
             except Exception as e:
                 msg = str(e)
                 if "bad allocation" in msg or "Memory" in msg:
@@ -1118,68 +1581,67 @@ def api_infer_stream():
 
             cur_dev = getattr(pipe, "_af_device", device)
             cur_real = getattr(pipe, "_af_device_real", cur_dev)
-            q = queue.Queue()
+            chan = TokenChannel(*flush_window(config))
             buf = []
             done = {"v": False}
             first = {"t": None}
-            gate = {"open": False, "buf": ""}
 
-            # Detect if model is likely a thinking model (e.g. DeepSeek R1)
-            # If not, open the gate immediately to avoid hiding output
-            mid_lower = str(model_id).lower()
-            is_thinking = "deepseek" in mid_lower and ("r1" in mid_lower or "reasoner" in mid_lower)
-            if not is_thinking:
-                gate["open"] = True
+            think = ThinkSplitter(in_think=_is_thinking_model(model_id), max_chars=_max_thinking_chars(config))
+
+            def _emit(parts):
+                for ev, text in parts:
+                    if ev == "token" and first["t"] is None:
+                        first["t"] = time.time()
+                    chan.put(text, ev)
 
             def sink(x):
                 try:
-                    xs = str(x)
-                    if not gate["open"]:
-                        gate["buf"] += xs
-                        s = gate["buf"].lower()
-                        k = s.find("</think>")
-                        if k != -1:
-                            gate["open"] = True
-                            post = gate["buf"][k+8:]
-                            gate["buf"] = ""
-                            if first["t"] is None:
-                                first["t"] = time.time()
-                            if post:
-                                q.put(post)
-                    else:
-                        if first["t"] is None:
-                            first["t"] = time.time()
-                        q.put(xs)
+                    _emit(think.feed(str(x)))
                 except Exception:
                     pass
+            st_running, st_stop, st_cancel = streaming_status()
             def streamer(subword):
+                if cancel.cancelled:
+                    # a dropped client gets CANCEL so the turn is not kept in chat history
+                    return st_cancel if cancel.reason == "disconnect" else st_stop
+                cancel.pieces += 1
                 try:
                     sink(subword)
                 except Exception:
                     pass
-                import openvino_genai as ov_genai
-                return ov_genai.StreamingStatus.RUNNING
+                return st_running
             out = {"text": None, "metrics": None, "error": None}
+            ctx_info = None
+            prompt_ctx = prompt
+            if sess is None:
+                prompt_ctx, ctx_info = fit_prompt(prompt, config, counter_for(pipe), context_summarizer(pipe))
             sources = None
-            if config.get("web_search"):
+            src_info = {}
+            if sources_fut is not None:
+                if not sources_fut.done():
+                    src_done = Signal()
+                    sources_fut.add_done_callback(lambda f: src_done.set())
+                    yield Park(src_done)
                 try:
-                    from backend.services.inference import web_search, augment_with_sources
-                    qtext = config.get("search_query") or prompt
-                    sources = web_search(qtext, max_results=5)
-                    try:
-                        yield "event: sources\n"
-                        yield "data: " + json.dumps({"sources": sources}) + "\n\n"
-                    except Exception:
-                        pass
-                    prompt_aug = augment_with_sources(prompt, sources, lang="zh")
+                    from backend.services.inference import augment_with_sources
+                    sources, origin = sources_fut.result()
+                    counter = counter_for(pipe)
+                    kept = []
+                    prompt_aug = augment_with_sources(prompt_ctx, sources, lang="zh", origin=origin, query=config.get("search_query") or prompt,
+                                                      budget=sources_budget(config, counter(prompt_ctx)), count=counter, info=src_info, kept=kept)
+                    # the client shows what the model actually saw, numbered as in the prompt
+                    yield "event: sources\n"
+                    yield "data: " + json.dumps({"sources": [{**s, "index": i} for i, s in enumerate(kept, 1)], "origin": origin}) + "\n\n"
                 except Exception:
-                    prompt_aug = prompt
+                    prompt_aug = prompt_ctx
             else:
-                prompt_aug = prompt
+                prompt_aug = prompt_ctx
             def run_gen():
                 try:
-                    from backend.services.inference import generate_stream
-                    text, metrics = generate_stream(pipe, prompt_aug, config, streamer)
+                    if sess is not None:
+                        text, metrics = session_generate(sess, pipe, prompt_aug, config, streamer)
+                    else:
+                        text, metrics = submit_generation(pipe, prompt_aug, config, streamer)
                     out["text"] = text
                     out["metrics"] = metrics
                 except Exception as e:
@@ -1189,28 +1651,20 @@ def api_infer_stream():
                 finally:
                     done["v"] = True
                     try:
-                        q.put(None)
+                        _emit(think.flush())
                     except Exception:
                         pass
-            th = threading.Thread(target=run_gen, daemon=True)
-            th.start()
+                    chan.close()
+            _STREAM_POOL.submit(run_gen)
             key = cur_dev if cur_dev in PERF["lat"] else ("NPU" if "NPU" in cur_dev else ("GPU" if "GPU" in cur_dev else ("CPU" if "CPU" in cur_dev else None)))
-            while True:
-                try:
-                    item = q.get(timeout=0.2)
-                except Exception:
-                    item = None
-                if item is None:
-                    if done["v"]:
-                        break
-                    else:
-                        continue
-                try:
+            for item in chan.parked_chunks():
+                if isinstance(item, Park):
+                    yield item
+                    continue
+                ev, item, _n = item
+                if ev == "token":
                     buf.append(item)
-                    yield "event: token\n"
-                    yield "data: " + json.dumps({"text": item}) + "\n\n"
-                except Exception:
-                    pass
+                yield chan.frame(ev, {"text": item})
             
             if out["error"]:
                 msg = out["error"]
@@ -1227,6 +1681,18 @@ def api_infer_stream():
                 if len(arr) > 30:
                     del arr[:len(arr)-30]
             metrics = out["metrics"]
+            if ctx_info is not None and isinstance(metrics, dict):
+                metrics["context"] = ctx_info
+            if src_info and isinstance(metrics, dict):
+                metrics["sources"] = src_info
+            if isinstance(metrics, dict):
+                metrics["admission_queue_ms"] = round(ticket.wait_ms, 1)
+            if cancel.cancelled and isinstance(metrics, dict):
+                metrics["cancelled"] = cancel.report()
+            else:
+                _tuner_observe(model_id, device, prompt, pipe, tuned, metrics)
+            if cacheable and not cancel.cancelled:
+                response_cache.store(model_id, prompt, config, out["text"], metrics)
             if first["t"] is not None and key:
                 try:
                     ttft_ms = float((first["t"] - t0) * 1000.0)
@@ -1272,14 +1738,28 @@ def api_infer_stream():
             except Exception:
                 pass
             yield "event: final\n"
-            yield "data: " + json.dumps({"text": s, "metrics": metrics}) + "\n\n"
+            yield "data: " + json.dumps({"text": s, "metrics": metrics, "stream": chan.stats(), "thinking": think.stats()}) + "\n\n"
         except Exception as e:
             msg = str(e)
             if "bad allocation" in msg or "Memory" in msg:
                 msg = "系统内存不足，无法完成生成。"
             yield "event: error\n"
             yield "data: " + json.dumps({"error": "internal_error", "message": msg}) + "\n\n"
-    return app.response_class(_gen(), mimetype="text/event-stream")
+        except GeneratorExit:
+            # client went away; the streamer stops generation at the next token
+            cancel.cancel("disconnect")
+            raise
+        finally:
+            if ticket is not None:
+                ticket.release()
+            finish_request(cancel)
+    return app.response_class(ParkingStream(_gen()), mimetype="text/event-stream")
+
+@app.post("/api/infer/cancel/<request_id>")
+def api_infer_cancel(request_id: str):
+    if not cancel_request(request_id, "stop"):
+        return jsonify({"error": "request_not_found"}), 404
+    return jsonify({"ok": True, "request_id": request_id})
 @app.get("/api/perf")
 def api_perf():
     def avg(a):
@@ -1342,7 +1822,20 @@ def api_perf():
         "last": PERF["last"],
         "warn": PERF["warn"],
         "usage": usage,
-        "hetero_participation": hp
+        "hetero_participation": hp,
+        "scheduler": scheduler_stats(),
+        "sessions": session_stats(),
+        "load": load_stats(),
+        "sse": sse_stats(),
+        "response_cache": response_cache.stats(),
+        "context": summarizer.stats(),
+        "cancel": cancel_stats(),
+        "tuner": perf_tuner.stats(),
+        "embed": embedding_service.stats(),
+        "search": search_stage.stats(),
+        "sources": source_stats(),
+        "admission": admission.stats(),
+        "workers": model_workers.worker_pool().stats()
     })
 
 @app.post("/api/system/clear_cache")
@@ -1380,7 +1873,14 @@ def run():
         _preload_on_start()
     except Exception:
         pass
-    app.run(host="127.0.0.1", port=8000)
+    if os.environ.get("AIFUNLAND_SERVER", "").lower() == "asgi":
+        try:
+            from backend.asgi import serve
+            serve(host="127.0.0.1", port=8000)
+            return
+        except ImportError as e:
+            logger.warning(f"ASGI mode unavailable ({e}); falling back to the Flask server")
+    app.run(host="127.0.0.1", port=8000, threaded=True)
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,212 @@
+"""Asyncio serving mode: the Flask routes behind an ASGI entry point.
+
+Plain routes run in a bounded thread pool. SSE routes whose body is a
+ParkingStream are driven on the event loop: each generator step runs in the
+pool, and every Park it yields is awaited as a loop callback, so an idle
+stream holds no thread. Serve with `AIFUNLAND_SERVER=asgi` (uvicorn) or
+`uvicorn backend.asgi:asgi_app`.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.services.streaming import Park, ParkingStream
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+def build_environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("127.0.0.1", 8000)
+    client = scope.get("client") or ("", 0)
+    env = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": str(client[0]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for raw_k, raw_v in scope.get("headers", []):
+        k = raw_k.decode("latin-1").upper().replace("-", "_")
+        v = raw_v.decode("latin-1")
+        if k == "CONTENT_TYPE":
+            env["CONTENT_TYPE"] = v
+            continue
+        if k == "CONTENT_LENGTH":
+            continue
+        key = "HTTP_" + k
+        env[key] = env[key] + "," + v if key in env else v
+    return env
+
+class AsgiApp:
+    """ASGI wrapper around a Flask app with connection, body and worker limits."""
+
+    def __init__(self, flask_app, workers: int | None = None, max_connections: int | None = None, max_body_mb: int | None = None):
+        self.flask_app = flask_app
+        self.workers = max(1, workers if workers is not None else _env_int("AIFUNLAND_ASGI_WORKERS", 16))
+        self.max_connections = max(1, max_connections if max_connections is not None else _env_int("AIFUNLAND_ASGI_MAX_CONNECTIONS", 1000))
+        self.max_body = max(1, max_body_mb if max_body_mb is not None else _env_int("AIFUNLAND_ASGI_MAX_BODY_MB", 512)) * 1024 * 1024
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="asgi")
+        self.counters = {"requests": 0, "rejected": 0, "open": 0, "streams": 0, "parked": 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                msg = await receive()
+                if msg["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif msg["type"] == "lifespan.shutdown":
+                    self.pool.shutdown(wait=False)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if self.counters["open"] >= self.max_connections:
+            self.counters["rejected"] += 1
+            await self._plain(send, 503, b'{"error": "too_many_connections"}')
+            return
+        self.counters["open"] += 1
+        self.counters["requests"] += 1
+        try:
+            await self._http(scope, receive, send)
+        finally:
+            self.counters["open"] -= 1
+
+    async def _plain(self, send, status, body):
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _http(self, scope, receive, send):
+        chunks, size = [], 0
+        while True:
+            msg = await receive()
+            if msg["type"] == "http.disconnect":
+                return
+            chunk = msg.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                await self._plain(send, 413, b'{"error": "request_too_large"}')
+                return
+            chunks.append(chunk)
+            if not msg.get("more_body"):
+                break
+        loop = asyncio.get_running_loop()
+        resp = await loop.run_in_executor(self.pool, self._dispatch, build_environ(scope, b"".join(chunks)))
+        headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in resp.headers.to_wsgi_list()]
+        await send({"type": "http.response.start", "status": resp.status_code, "headers": headers})
+        try:
+            if isinstance(resp.response, ParkingStream):
+                await self._drive(resp.response.gen, receive, send)
+            else:
+                it = iter(resp.iter_encoded())
+                while True:
+                    chunk = await loop.run_in_executor(self.pool, next, it, _END)
+                    if chunk is _END:
+                        break
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await loop.run_in_executor(self.pool, resp.close)
+
+    def _dispatch(self, environ):
+        app = self.flask_app
+        with app.request_context(environ):
+            try:
+                return app.full_dispatch_request()
+            except Exception as e:
+                return app.make_response(app.handle_exception(e))
+
+    async def _drive(self, gen, receive, send):
+        """Runs an SSE generator: steps in the pool, Parks on the loop, stops on client disconnect."""
+        loop = asyncio.get_running_loop()
+        gone = asyncio.Event()
+
+        async def _watch():
+            while True:
+                msg = await receive()
+                if msg["type"] == "http.disconnect":
+                    gone.set()
+                    return
+
+        watcher = asyncio.ensure_future(_watch())
+        self.counters["streams"] += 1
+        try:
+            while not gone.is_set():
+                item = await loop.run_in_executor(self.pool, next, gen, _END)
+                if item is _END:
+                    break
+                if isinstance(item, Park):
+                    await self._park(item, gone)
+                    continue
+                await send({"type": "http.response.body", "body": item.encode("utf-8"), "more_body": True})
+            if not gone.is_set():
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.counters["streams"] -= 1
+            watcher.cancel()
+            # GeneratorExit at the parked yield runs the route's disconnect handling
+            await loop.run_in_executor(self.pool, gen.close)
+
+    async def _park(self, park, gone):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def _wake():
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+
+        park.signal.on_set(_wake)
+        gone_wait = asyncio.ensure_future(gone.wait())
+        self.counters["parked"] += 1
+        try:
+            await asyncio.wait({fut, gone_wait}, timeout=park.timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.counters["parked"] -= 1
+            park.signal.remove(_wake)
+            gone_wait.cancel()
+
+    def stats(self):
+        return {**self.counters, "workers": self.workers, "max_connections": self.max_connections}
+
+def _make_app():
+    from backend.app import app
+    return AsgiApp(app)
+
+_asgi = None
+
+def get_asgi_app():
+    global _asgi
+    if _asgi is None:
+        _asgi = _make_app()
+    return _asgi
+
+def __getattr__(name):
+    # `uvicorn backend.asgi:asgi_app` resolves the attribute lazily so importing this module stays cheap
+    if name == "asgi_app":
+        return get_asgi_app()
+    raise AttributeError(name)
+
+def serve(host: str = "127.0.0.1", port: int = 8000):
+    import uvicorn
+    app = get_asgi_app()
+    uvicorn.run(app, host=host, port=port, log_level="info", limit_concurrency=app.max_connections + 16,
+                timeout_keep_alive=_env_int("AIFUNLAND_ASGI_KEEPALIVE_S", 5))
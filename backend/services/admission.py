@@ -0,0 +1,217 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from backend.services.streaming import Signal
+
+# lower value is served first
+PRIORITIES = {"interactive": 0, "batch": 1, "warmup": 2, "maintenance": 3}
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+class AdmissionRejected(Exception):
+    """Raised when work is refused; `reason` is deadline_unreachable, deadline_expired or client_queue_full."""
+
+    def __init__(self, reason: str, retry_after_s: float | None = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+class Ticket:
+    def __init__(self, ctl, seq: int, cls: str, client, deadline: float | None):
+        self._ctl = ctl
+        self.seq = seq
+        self.cls = cls
+        self.prio = PRIORITIES[cls]
+        self.client = client
+        self.deadline = deadline
+        self.state = "queued"
+        self.reason = None
+        self.t_enq = time.monotonic()
+        self.t_admit = None
+        # set when the ticket leaves the queue; SSE generators park on it
+        self.signal = Signal()
+
+    @property
+    def wait_ms(self):
+        end = self.t_admit if self.t_admit is not None else time.monotonic()
+        return (end - self.t_enq) * 1000.0
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """True once admitted, False on timeout; raises AdmissionRejected if the deadline passes in the queue."""
+        return self._ctl._wait(self, timeout)
+
+    def release(self):
+        self._ctl._release(self)
+
+class AdmissionController:
+    """Orders device work by priority class, deadline and per-client fair share.
+
+    Admitted work holds one of `slots`; non-interactive classes are capped
+    below that so interactive requests always find room. Among waiters the
+    controller picks the lowest class, then the client with the fewest
+    running requests, then the earliest deadline.
+    """
+
+    def __init__(self, slots: int | None = None, client_max: int | None = None, client_queue: int | None = None, class_caps: dict | None = None):
+        self.slots = max(1, slots if slots is not None else _env_int("AIFUNLAND_ADMIT_SLOTS", 8))
+        self.client_max = max(1, client_max if client_max is not None else _env_int("AIFUNLAND_ADMIT_CLIENT_MAX", 2))
+        self.client_queue = max(1, client_queue if client_queue is not None else _env_int("AIFUNLAND_ADMIT_CLIENT_QUEUE", 8))
+        half = max(1, self.slots // 2)
+        self.class_caps = {"interactive": self.slots, "batch": half, "warmup": 1, "maintenance": 1, **(class_caps or {})}
+        self._cv = threading.Condition()
+        self._seq = itertools.count()
+        self._queue = []
+        self._active = []
+        # EWMA of how long admitted work holds its slot, per class
+        self._hold_ms = {}
+        self._waits = {c: [] for c in PRIORITIES}
+        self.counters = {"admitted": 0, "rejected": {}, "released": 0}
+
+    def request(self, cls: str = "interactive", client=None, deadline_ms: float | None = None) -> Ticket:
+        if cls not in PRIORITIES:
+            raise ValueError(f"unknown priority class: {cls}")
+        now = time.monotonic()
+        deadline = now + float(deadline_ms) / 1000.0 if deadline_ms else None
+        with self._cv:
+            t = Ticket(self, next(self._seq), cls, client, deadline)
+            if client is not None and sum(1 for q in self._queue if q.client == client) >= self.client_queue:
+                self._reject_locked(t, "client_queue_full")
+                raise AdmissionRejected("client_queue_full", self._retry_after_locked(cls))
+            if deadline is not None:
+                # queue wait plus the class's usual hold time: refuse work that cannot finish in time
+                est = self._estimate_locked(t)
+                if est is not None and now + (est + self._hold_ms.get(cls, 0.0)) / 1000.0 > deadline:
+                    self._reject_locked(t, "deadline_unreachable")
+                    raise AdmissionRejected("deadline_unreachable", self._retry_after_locked(cls))
+            self._queue.append(t)
+            self._dispatch_locked()
+            return t
+
+    @contextmanager
+    def admit(self, cls: str = "interactive", client=None, deadline_ms: float | None = None):
+        t = self.request(cls, client, deadline_ms)
+        try:
+            t.wait()
+            yield t
+        finally:
+            t.release()
+
+    def stats(self):
+        with self._cv:
+            waits = {}
+            for c, arr in self._waits.items():
+                if arr:
+                    s = sorted(arr)
+                    waits[c] = {"n": len(s), "avg_ms": round(sum(s) / len(s), 1), "p95_ms": round(s[min(len(s) - 1, int(len(s) * 0.95))], 1)}
+            return {
+                "slots": self.slots,
+                "active": {c: sum(1 for t in self._active if t.cls == c) for c in PRIORITIES},
+                "queued": {c: sum(1 for t in self._queue if t.cls == c) for c in PRIORITIES},
+                "admitted": self.counters["admitted"],
+                "released": self.counters["released"],
+                "rejected": dict(self.counters["rejected"]),
+                "queue_wait": waits,
+                "hold_ms": {c: round(v, 1) for c, v in self._hold_ms.items()},
+            }
+
+    def _eligible_locked(self, t):
+        if sum(1 for a in self._active if a.cls == t.cls) >= self.class_caps.get(t.cls, self.slots):
+            return False
+        if t.client is not None and sum(1 for a in self._active if a.client == t.client) >= self.client_max:
+            return False
+        return True
+
+    def _dispatch_locked(self):
+        admitted = False
+        while len(self._active) < self.slots:
+            cands = [t for t in self._queue if self._eligible_locked(t)]
+            if not cands:
+                break
+            t = min(cands, key=lambda t: (t.prio, sum(1 for a in self._active if a.client == t.client) if t.client is not None else 0,
+                                          t.deadline if t.deadline is not None else float("inf"), t.seq))
+            self._queue.remove(t)
+            self._active.append(t)
+            t.state = "admitted"
+            t.t_admit = time.monotonic()
+            t.signal.set()
+            self.counters["admitted"] += 1
+            w = self._waits[t.cls]
+            w.append(t.wait_ms)
+            if len(w) > 500:
+                del w[:len(w) - 500]
+            admitted = True
+        if admitted:
+            self._cv.notify_all()
+
+    def _estimate_locked(self, t):
+        """Expected ms until t would be admitted, or None without history."""
+        own = self._hold_ms.get(t.cls)
+        if own is None:
+            return None
+        ahead = [q for q in self._queue if q.prio <= t.prio]
+        if not ahead and len(self._active) < self.slots and self._eligible_locked(t):
+            return 0.0
+        # every running item and everything queued ahead has to drain through the slots first
+        backlog = sum(self._hold_ms.get(q.cls, own) for q in ahead + self._active)
+        return backlog / self.slots
+
+    def _retry_after_locked(self, cls):
+        h = self._hold_ms.get(cls)
+        return round(h / 1000.0, 1) if h else None
+
+    def _reject_locked(self, t, reason):
+        t.state = "rejected"
+        t.reason = reason
+        t.signal.set()
+        r = self.counters["rejected"]
+        r[reason] = r.get(reason, 0) + 1
+        self._cv.notify_all()
+
+    def _wait(self, t, timeout):
+        end = time.monotonic() + timeout if timeout is not None else None
+        with self._cv:
+            while t.state == "queued":
+                now = time.monotonic()
+                if t.deadline is not None and now >= t.deadline:
+                    self._queue.remove(t)
+                    self._reject_locked(t, "deadline_expired")
+                    break
+                if end is not None and now >= end:
+                    return False
+                limits = [x for x in (t.deadline, end) if x is not None]
+                self._cv.wait(min(limits) - now if limits else None)
+            if t.state == "rejected":
+                raise AdmissionRejected(t.reason, self._retry_after_locked(t.cls))
+            return t.state == "admitted"
+
+    def _release(self, t):
+        with self._cv:
+            if t.state == "queued":
+                self._queue.remove(t)
+            elif t.state == "admitted":
+                self._active.remove(t)
+                held = (time.monotonic() - t.t_admit) * 1000.0
+                prev = self._hold_ms.get(t.cls)
+                self._hold_ms[t.cls] = held if prev is None else prev * 0.8 + held * 0.2
+                self.counters["released"] += 1
+            else:
+                return
+            t.state = "released"
+            t.signal.set()
+            self._dispatch_locked()
+            # waiters on a released ticket must wake even when nothing new was admitted
+            self._cv.notify_all()
+
+admission = AdmissionController()
+
+def run_admitted(cls: str, fn, *args, **kwargs):
+    """fn(*args, **kwargs) under an admission slot of class `cls`; thread targets for background work."""
+    with admission.admit(cls):
+        return fn(*args, **kwargs)
@@ -0,0 +1,188 @@
+import json
+import os
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from backend.utils.tasks import task_store
+
+PROFILE_NAME = "autotune_profile.json"
+_DEFAULT_LENGTHS = (128, 512, 2048)
+_FILLER = "The quick brown fox jumps over the lazy dog near the river bank. "
+# explicit config keys win over a stored profile
+_EXPLICIT = {"NUM_STREAMS": ("npu_streams", "gpu_streams"), "NPU_TILES": ("npu_tiles",), "NUM_REQUESTS": ("num_requests",)}
+
+@lru_cache(maxsize=1)
+def host_id() -> str:
+    """Identifies the hardware a profile was measured on, so one profile serves identical hosts."""
+    import hashlib
+    import platform
+    from backend.services.system import _cpu_model
+    raw = f"{_cpu_model()}|{os.cpu_count()}|{platform.machine()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:10]
+
+def profile_path(model_dir: Path) -> Path:
+    return Path(model_dir) / PROFILE_NAME
+
+def _tunable(device: str) -> bool:
+    # HETERO/AUTO/MULTI props apply to several plugins at once
+    return bool(device) and ":" not in device and "," not in device and not device.startswith(("AUTO", "MULTI", "HETERO"))
+
+def read_profiles(model_dir: Path) -> dict:
+    try:
+        with open(profile_path(model_dir), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return (data.get("profiles") or {}) if data.get("version") == 1 else {}
+    except Exception:
+        return {}
+
+def device_profile(model_dir: Path, device: str, config: dict | None = None) -> dict:
+    """Stored device properties for this host and device, minus keys the request sets itself."""
+    if not _tunable(device):
+        return {}
+    prof = read_profiles(model_dir).get(f"{host_id()}/{device}")
+    if not prof:
+        return {}
+    cfg = config or {}
+    out = {}
+    for k, v in (prof.get("props") or {}).items():
+        if any(cfg.get(ck) for ck in _EXPLICIT.get(k, ())):
+            continue
+        out[str(k)] = str(v)
+    return out
+
+def write_profile(model_dir: Path, device: str, profile: dict):
+    path = profile_path(model_dir)
+    profiles = read_profiles(model_dir)
+    profiles[f"{host_id()}/{device}"] = profile
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "profiles": profiles}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return path
+
+def sweep_space(device: str, topo: dict | None = None) -> list:
+    """(property, values) dimensions worth sweeping on this device; single-valued ones are dropped."""
+    topo = topo or {}
+    dims = []
+    if device.startswith("NPU"):
+        arch = str(topo.get("npu_arch") or "")
+        dims.append(("NPU_TILES", ["2", "4"] if "4000" in arch else ["1", "2"]))
+        dims.append(("NUM_REQUESTS", ["1", "4", "8"]))
+        dims.append(("NPU_TURBO", ["YES", "NO"]))
+    elif device.startswith("GPU"):
+        dims.append(("NUM_STREAMS", ["1", "2"]))
+        dims.append(("INFERENCE_PRECISION_HINT", ["f16", "f32"]))
+    else:
+        n = os.cpu_count() or 4
+        dims.append(("INFERENCE_NUM_THREADS", sorted({str(max(2, n // 4)), str(max(2, n // 2)), str(n)}, key=int)))
+        dims.append(("NUM_STREAMS", ["1", "2"]))
+        caps = [str(c).upper() for c in (topo.get("cpu_caps") or [])]
+        prec = ["f32"] + (["bf16"] if "BF16" in caps else []) + (["f16"] if "FP16" in caps else [])
+        dims.append(("INFERENCE_PRECISION_HINT", prec))
+    return [(k, vals) for k, vals in dims if len(vals) > 1]
+
+def make_prompt(tokens: int) -> str:
+    # ~0.75 words per token for English filler
+    words = _FILLER.split()
+    n = max(1, int(tokens * 0.75))
+    return "Summarize: " + " ".join(words[i % len(words)] for i in range(n))
+
+def score(result: dict, objective: str) -> float:
+    if objective == "ttft":
+        v = result.get("ttft_ms")
+        return -float(v) if v else float("-inf")
+    if result.get("throughput_tps"):
+        return float(result["throughput_tps"])
+    # without GenAI perf metrics fall back to wall time
+    v = result.get("generate_ms")
+    return -float(v) if v else float("-inf")
+
+def _mean(vals):
+    vals = [float(v) for v in vals if v]
+    return sum(vals) / len(vals) if vals else None
+
+def measure(model_dir: Path, device: str, props: dict, lengths, gen_cfg: dict, repeats: int = 1) -> dict:
+    """Compile one candidate and time it at each prompt length.
+
+    Candidates get their own cache key and are dropped afterwards, so copies
+    of the model that are serving traffic stay resident.
+    """
+    from backend.services import inference
+    cfg = {**gen_cfg, "device_props": dict(props), "hetero_enable": False, "prefill_igpu_decode_npu": False, "autotune_candidate": True}
+    t0 = time.perf_counter()
+    pipe = inference.load_pipeline(model_dir, device, cfg, reconfigure=False)
+    compile_ms = (time.perf_counter() - t0) * 1000.0
+    try:
+        inference.submit_generation(pipe, make_prompt(min(lengths)), {**gen_cfg, "max_new_tokens": 4})
+        by_len = {}
+        for n in lengths:
+            runs = []
+            for _ in range(max(1, int(repeats))):
+                t1 = time.perf_counter()
+                _, m = inference.submit_generation(pipe, make_prompt(n), gen_cfg)
+                m = dict(m or {})
+                m.setdefault("generate_ms", (time.perf_counter() - t1) * 1000.0)
+                runs.append(m)
+            by_len[str(n)] = {k: _mean(r.get(k) for r in runs) for k in ("ttft_ms", "tpot_ms", "throughput_tps", "generate_ms")}
+        res = {k: _mean(v.get(k) for v in by_len.values()) for k in ("ttft_ms", "tpot_ms", "throughput_tps", "generate_ms")}
+        res["by_length"] = by_len
+        res["compile_ms"] = round(compile_ms, 1)
+        res["effective_props"] = dict(getattr(pipe, "_af_props", None) or {})
+        return res
+    finally:
+        inference.release_pipeline(pipe)
+
+def run_autotune(task_id: str, model_dir: Path, device: str, config: dict | None = None):
+    """Task body for /api/models/autotune: coordinate-descent sweep, one property at a time."""
+    from backend.services.system import get_device_topology
+    try:
+        cfg = dict(config or {})
+        objective = "ttft" if str(cfg.pop("objective", "throughput")).lower() in ("ttft", "latency") else "throughput"
+        lengths = [int(n) for n in (cfg.pop("prompt_lengths", None) or _DEFAULT_LENGTHS)]
+        repeats = int(cfg.pop("repeats", 1) or 1)
+        gen_cfg = {"max_new_tokens": int(cfg.pop("max_new_tokens", 64) or 64), "temperature": 0.0, **cfg}
+        if not _tunable(device):
+            raise ValueError("autotune needs a single device (CPU, GPU.x or NPU)")
+        dims = sweep_space(device, get_device_topology())
+        total = 1 + sum(len(v) for _, v in dims)
+        done = 0
+        results = []
+        def _run(props):
+            nonlocal done
+            task_store.update(task_id, status="running", progress=max(1, int(99 * done / total)), message=f"{done + 1}/{total}: {props or 'baseline'}")
+            try:
+                r = measure(model_dir, device, props, lengths, gen_cfg, repeats)
+            except Exception as e:
+                r = {"error": str(e)}
+            done += 1
+            r["props"] = dict(props)
+            r["score"] = score(r, objective) if "error" not in r else float("-inf")
+            results.append(r)
+            return r
+        baseline = _run({})
+        best = baseline
+        chosen = {}
+        for prop, values in dims:
+            for v in values:
+                r = _run({**chosen, prop: v})
+                if r["score"] > best["score"]:
+                    best = r
+            chosen = dict(best["props"])
+        if best["score"] == float("-inf"):
+            raise RuntimeError(baseline.get("error") or "no candidate produced metrics")
+        profile = {
+            "device": device,
+            "host": {"id": host_id(), "cpu_count": os.cpu_count()},
+            "objective": objective,
+            "prompt_lengths": lengths,
+            "props": best["props"],
+            "baseline": {k: baseline.get(k) for k in ("ttft_ms", "tpot_ms", "throughput_tps")},
+            "best": {k: best.get(k) for k in ("ttft_ms", "tpot_ms", "throughput_tps")},
+            "results": [{k: v for k, v in r.items() if k != "score"} for r in results],
+            "created": time.time(),
+        }
+        path = write_profile(model_dir, device, profile)
+        task_store.complete(task_id, result={"profile": str(path), "props": best["props"], "baseline": profile["baseline"], "best": profile["best"], "candidates": len(results)})
+    except Exception as e:
+        task_store.update(task_id, status="error", error=str(e))
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from backend.services import inference
+from backend.utils.tasks import task_store
+
+_DEFAULT_BATCH = 8
+
+def throughput_config(device: str, config: dict | None):
+    """Generation config for offline jobs: throughput hints, no latency-only tricks."""
+    cfg = dict(config or {})
+    multi = any(str(device).startswith(p) for p in ("AUTO", "MULTI", "HETERO"))
+    mode = str(cfg.get("perf_mode") or "").upper()
+    if mode in ("", "AUTO", "LATENCY"):
+        cfg["perf_mode"] = "CUMULATIVE_THROUGHPUT" if multi else "THROUGHPUT"
+    cfg["prefill_igpu_decode_npu"] = False
+    return cfg
+
+def read_prompts(path: Path):
+    """Yield (index, record) for every non-empty line; a bare string line becomes {"prompt": line}."""
+    with open(path, "r", encoding="utf-8") as f:
+        idx = 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except Exception:
+                rec = line
+            if isinstance(rec, str):
+                rec = {"prompt": rec}
+            yield idx, rec
+            idx += 1
+
+def count_prompts(path: Path) -> int:
+    n = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                n += 1
+    return n
+
+def resume_offset(out_path: Path) -> int:
+    """Index of the first prompt without a result; drops a torn last line left by a crash."""
+    if not out_path.exists():
+        return 0
+    done = -1
+    good = 0
+    with open(out_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done = max(done, int(json.loads(line)["index"]))
+            except Exception:
+                break
+            good += len(line)
+    if good != out_path.stat().st_size:
+        with open(out_path, "r+b") as f:
+            f.truncate(good)
+    return done + 1
+
+def run_batch_job(task_id: str, model_dir: Path, device: str, input_path: Path, output_path: Path,
+                  config: dict | None = None, offset: int | None = None, batch_size: int | None = None):
+    """Task body for /api/jobs/batch; results are appended to output_path as JSONL."""
+    try:
+        cfg = throughput_config(device, config)
+        size = max(1, int(batch_size or cfg.pop("batch_size", None) or _DEFAULT_BATCH))
+        total = count_prompts(input_path)
+        start = resume_offset(output_path) if offset is None else max(0, int(offset))
+        task_store.update(task_id, status="running", progress=1, message=f"loading: {start}/{total}")
+        # offline work needs the throughput compile itself, not a latency sibling serving meanwhile
+        pipe = inference.load_pipeline(model_dir, device, cfg, reconfigure=False)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        done = start
+        failed = 0
+        t0 = time.perf_counter()
+        with open(output_path, "a", encoding="utf-8") as out:
+            batch = []
+            def _flush(batch):
+                nonlocal done, failed
+                results, bm = inference.generate_batch(pipe, [r.get("prompt", "") for _, r in batch], cfg)
+                for (idx, rec), (text, err) in zip(batch, results):
+                    row = {"index": idx, "id": rec.get("id", idx), "output": text}
+                    if err:
+                        row["error"] = err
+                        failed += 1
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+                done = batch[-1][0] + 1
+                rate = (done - start) / max(1e-6, time.perf_counter() - t0)
+                pct = int(100 * done / total) if total else 100
+                task_store.update(task_id, progress=max(1, min(99, pct)),
+                                  message=f"{done}/{total} prompts, {rate:.2f}/s, batch {bm['batch_ms']:.0f} ms")
+            for idx, rec in read_prompts(input_path):
+                if idx < start:
+                    continue
+                batch.append((idx, rec))
+                if len(batch) >= size:
+                    _flush(batch)
+                    batch = []
+            if batch:
+                _flush(batch)
+        task_store.complete(task_id, result={"output": str(output_path), "total": total, "done": done,
+                                             "failed": failed, "resumed_from": start})
+    except Exception as e:
+        task_store.update(task_id, status="error", error=str(e))
@@ -0,0 +1,286 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# role prefixes written by the web client's buildContextualPrompt()
+_ROLE_RE = re.compile(r"^(User|Assistant|用户|助手)\s*[:：]\s?")
+_SUMMARY_PREFIX = {"zh": "此前对话摘要：", "en": "Summary of earlier conversation: "}
+
+def _is_cjk(ch: str) -> bool:
+    o = ord(ch)
+    return 0x3000 <= o <= 0x9FFF or 0xAC00 <= o <= 0xD7AF or 0xF900 <= o <= 0xFAFF
+
+def estimate_tokens(text: str) -> int:
+    cjk = sum(1 for c in text if _is_cjk(c))
+    return cjk + (len(text) - cjk + 3) // 4
+
+class TokenCounter:
+    """Counts tokens with the model tokenizer; per-text results are memoized."""
+
+    def __init__(self, tokenizer=None, max_items: int = 4096):
+        self.tokenizer = tokenizer
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+
+    def __call__(self, text: str) -> int:
+        if not text:
+            return 0
+        k = hashlib.sha1(text.encode("utf-8")).digest()
+        with self._lock:
+            n = self._memo.get(k)
+            if n is not None:
+                self._memo.move_to_end(k)
+                return n
+        n = None
+        if self.tokenizer is not None:
+            try:
+                n = int(self.tokenizer.encode(text).input_ids.shape[-1])
+            except Exception:
+                n = None
+        if n is None:
+            n = estimate_tokens(text)
+        with self._lock:
+            self._memo[k] = n
+            if len(self._memo) > self.max_items:
+                self._memo.popitem(last=False)
+        return n
+
+_counters_lock = threading.Lock()
+_counters = OrderedDict()
+
+def counter_for(pipe) -> TokenCounter:
+    """Shared TokenCounter for a pipeline (or a heuristic one when pipe is None)."""
+    key = id(pipe) if pipe is not None else None
+    with _counters_lock:
+        ent = _counters.get(key)
+        if ent is not None and ent[0] is pipe:
+            _counters.move_to_end(key)
+            return ent[1]
+        tok = None
+        if pipe is not None:
+            try:
+                tok = pipe.get_tokenizer()
+            except Exception:
+                tok = None
+        c = TokenCounter(tok)
+        _counters[key] = (pipe, c)
+        while len(_counters) > 16:
+            _counters.popitem(last=False)
+        return c
+
+def context_budget(config: dict | None):
+    """Prompt token budget: config.context_budget, NPU max_prompt_len, or AIFUNLAND_CONTEXT_BUDGET."""
+    cfg = config or {}
+    v = cfg.get("context_budget")
+    if v is None and cfg.get("max_prompt_len"):
+        # leave room for the chat template the pipeline wraps around the prompt
+        v = max(64, int(cfg["max_prompt_len"]) - 32)
+    if v is None:
+        v = os.environ.get("AIFUNLAND_CONTEXT_BUDGET", 4096)
+    try:
+        v = int(v)
+    except Exception:
+        return None
+    return v if v > 0 else None
+
+def split_flat_prompt(prompt: str):
+    """Split a client-built prompt into (head, turns, last); turns is a list of role-prefixed blocks."""
+    head, blocks = [], []
+    for line in str(prompt).split("\n"):
+        if _ROLE_RE.match(line):
+            blocks.append([line])
+        elif blocks:
+            blocks[-1].append(line)
+        else:
+            head.append(line)
+    turns = ["\n".join(b) for b in blocks]
+    if not turns:
+        return "\n".join(head), [], None
+    return "\n".join(head), turns[:-1], turns[-1]
+
+def _plan(sizes, fixed: int, budget: int, low_water: float):
+    """Number of leading items to drop so fixed + sum(kept) fits the budget."""
+    total = fixed + sum(sizes)
+    if total <= budget:
+        return 0, 0
+    target = max(0, int(budget * low_water))
+    drop, trimmed = 0, 0
+    while drop < len(sizes) and total - trimmed > target:
+        trimmed += sizes[drop]
+        drop += 1
+    return drop, trimmed
+
+def boundary_keys(turns) -> list:
+    """Chained keys for each turn boundary: keys[i] identifies turns[:i + 1]."""
+    h = hashlib.sha1()
+    keys = []
+    for t in turns:
+        h.update(t.encode("utf-8") + b"\0")
+        keys.append(h.hexdigest())
+    return keys
+
+class Summarizer:
+    """Background summaries of dropped turns, keyed by their text or turn boundary."""
+
+    def __init__(self, max_items: int = 256):
+        self._lock = threading.Lock()
+        self._done = OrderedDict()
+        self._pending = set()
+        self.max_items = max_items
+        self.counters = {"requested": 0, "completed": 0, "failed": 0, "used": 0}
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get(self, text: str):
+        return self.get_by_key(self.key(text))
+
+    def get_by_key(self, k: str):
+        with self._lock:
+            s = self._done.get(k)
+            if s is not None:
+                self._done.move_to_end(k)
+                self.counters["used"] += 1
+            return s
+
+    def latest(self, keys):
+        """(i, summary) for the furthest boundary keys[i - 1] with a summary, or (0, None)."""
+        with self._lock:
+            for i in range(len(keys), 0, -1):
+                s = self._done.get(keys[i - 1])
+                if s is not None:
+                    self._done.move_to_end(keys[i - 1])
+                    self.counters["used"] += 1
+                    return i, s
+        return 0, None
+
+    def request(self, text: str, fn, key: str | None = None):
+        k = key or self.key(text)
+        with self._lock:
+            if k in self._done or k in self._pending:
+                return
+            self._pending.add(k)
+            self.counters["requested"] += 1
+        def _bg():
+            out = None
+            try:
+                out = fn(text)
+            except Exception:
+                out = None
+            with self._lock:
+                self._pending.discard(k)
+                if out:
+                    self._done[k] = str(out).strip()
+                    self.counters["completed"] += 1
+                    while len(self._done) > self.max_items:
+                        self._done.popitem(last=False)
+                else:
+                    self.counters["failed"] += 1
+        threading.Thread(target=_bg, daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "pending": len(self._pending), "cached": len(self._done)}
+
+summarizer = Summarizer()
+
+def _lang(text: str) -> str:
+    return "zh" if any(_is_cjk(c) for c in text[:200]) else "en"
+
+def _low_water() -> float:
+    try:
+        return min(1.0, max(0.1, float(os.environ.get("AIFUNLAND_CONTEXT_LOW_WATER", 0.75))))
+    except Exception:
+        return 0.75
+
+def fit_prompt(prompt: str, config: dict | None, count=None, summarize=None):
+    """Trim the oldest turns of a flat multi-turn prompt to the token budget.
+
+    Returns (prompt, info). Summaries are keyed by the turn boundary they
+    cover: while the furthest summarized boundary plus the turns after it
+    still fits, that boundary is kept, so the client resending its whole
+    history does not move the drop point every turn. Otherwise the drop
+    point moves forward and the last summary is extended in the background
+    with only the newly dropped turns (`summarize(text)`).
+    """
+    budget = context_budget(config)
+    count = count or TokenCounter()
+    head, turns, last = split_flat_prompt(prompt)
+    info = {"budget": budget, "trimmed_tokens": 0, "dropped_turns": 0}
+    if budget is None or not turns:
+        return prompt, info
+    sizes = [count(t) for t in turns]
+    fixed = count(head) + count(last or "")
+    info["prompt_tokens"] = fixed + sum(sizes)
+    if info["prompt_tokens"] <= budget:
+        return prompt, info
+    keys = boundary_keys(turns)
+    at, summary = summarizer.latest(keys)
+    drop = at
+    if not summary or fixed + count(summary_line(summary)) + sum(sizes[at:]) > budget:
+        drop, _ = _plan(sizes, fixed, budget, _low_water())
+        at, summary = summarizer.latest(keys[:drop])
+    trimmed = sum(sizes[:drop])
+    info["prompt_tokens"] -= trimmed
+    lines = [head] if head else []
+    if summary:
+        line = summary_line(summary)
+        lines.append(line)
+        info["summary"] = "used" if at == drop else "partial"
+        info["prompt_tokens"] += count(line)
+    if at < drop and summarize is not None:
+        # only the turns dropped since the last summarized boundary are new
+        fresh = "\n".join(turns[at:drop])
+        summarizer.request((summary_line(summary) + "\n" + fresh) if summary else fresh, summarize, key=keys[drop - 1])
+        info.setdefault("summary", "pending")
+    lines.extend(turns[drop:])
+    lines.append(last)
+    info["trimmed_tokens"] = trimmed
+    info["dropped_turns"] = drop
+    return "\n".join(lines), info
+
+def fit_history(system: str, history: list, prompt: str, config: dict | None, count=None, summarize=None, prior_summary: str | None = None):
+    """Session variant of fit_prompt over role/content messages.
+
+    Returns (kept_history, summary_or_None, info); turns are dropped in
+    user/assistant pairs so the kept history still alternates. A pending
+    summary is reported as info["summary_key"] for Summarizer.get_by_key().
+    """
+    budget = context_budget(config)
+    count = count or TokenCounter()
+    info = {"budget": budget, "trimmed_tokens": 0, "dropped_turns": 0}
+    if budget is None or not history:
+        return history, None, info
+    pairs = [history[i:i + 2] for i in range(0, len(history), 2)]
+    sizes = [sum(count(m["content"]) + 4 for m in p) for p in pairs]
+    fixed = count(system or "") + count(prompt)
+    drop, trimmed = _plan(sizes, fixed, budget, _low_water())
+    info["prompt_tokens"] = fixed + sum(sizes) - trimmed
+    if not drop:
+        return history, None, info
+    dropped_msgs = [m for p in pairs[:drop] for m in p]
+    dropped = "\n".join(("User: " if m["role"] == "user" else "Assistant: ") + m["content"] for m in dropped_msgs)
+    if prior_summary:
+        dropped = _SUMMARY_PREFIX[_lang(prior_summary)] + prior_summary + "\n" + dropped
+    summary = summarizer.get(dropped)
+    if summary:
+        info["summary"] = "used"
+    elif summarize is not None:
+        summarizer.request(dropped, summarize)
+        info["summary"] = "pending"
+        info["summary_key"] = summarizer.key(dropped)
+    info["trimmed_tokens"] = trimmed
+    info["dropped_turns"] = len(dropped_msgs)
+    return [m for p in pairs[drop:] for m in p], summary, info
+
+def summary_line(summary: str) -> str:
+    return _SUMMARY_PREFIX[_lang(summary)] + summary
+
+def summary_prompt(text: str) -> str:
+    if _lang(text) == "zh":
+        return "请用不超过100字概括以下对话的要点，只输出摘要：\n" + text
+    return "Summarize the key facts of this conversation in under 80 words. Output only the summary.\n" + text
@@ -0,0 +1,396 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+# Local knowledge base: folders of text are chunked into an on-disk, segmented
+# inverted index scored with BM25. Each ingest writes one new segment for new or
+# changed files and tombstones the chunks it replaces; postings are numpy files
+# opened with mmap so a query only touches the pages of its own terms.
+
+_EXTS = (".txt", ".md", ".markdown", ".rst", ".text")
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[぀-ヿ㐀-䶿一-鿿가-힯]+")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+def terms(text: str) -> list:
+    """Lower-cased latin words plus CJK character bigrams (single characters for one-char runs)."""
+    out = []
+    for tok in _TOKEN_RE.findall(str(text or "").lower()):
+        if _CJK_RE.match(tok):
+            if len(tok) == 1:
+                out.append(tok)
+            else:
+                out.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+        else:
+            out.append(tok)
+    return out
+
+def chunk_text(text: str, max_chars: int = 800):
+    """Split on blank lines, packing paragraphs up to max_chars; long paragraphs are cut on sentence ends."""
+    paras = [p.strip() for p in re.split(r"\n\s*\n", str(text or "")) if p.strip()]
+    pieces = []
+    for p in paras:
+        while len(p) > max_chars:
+            cut = max(p.rfind(s, 0, max_chars) for s in (". ", "。", "！", "？", "! ", "? ", "\n"))
+            cut = cut + 1 if cut > max_chars // 3 else max_chars
+            pieces.append(p[:cut].strip())
+            p = p[cut:].strip()
+        if p:
+            pieces.append(p)
+    buf = ""
+    for p in pieces:
+        if buf and len(buf) + len(p) + 2 > max_chars:
+            yield buf
+            buf = p
+        else:
+            buf = (buf + "\n\n" + p) if buf else p
+    if buf:
+        yield buf
+
+def _title_of(path: Path, text: str) -> str:
+    for line in text.splitlines()[:20]:
+        s = line.strip()
+        if s.startswith("#"):
+            return s.lstrip("#").strip() or path.stem
+    return path.stem
+
+class _Segment:
+    """One immutable index segment, opened read-only with memory-mapped arrays."""
+
+    def __init__(self, seg_dir: Path):
+        import numpy as np
+        self.name = seg_dir.name
+        self.dir = seg_dir
+        with open(seg_dir / "terms.json", "r", encoding="utf-8") as f:
+            self.terms = json.load(f)
+        self.docs = np.load(seg_dir / "docs.npy", mmap_mode="r")
+        self.tfs = np.load(seg_dir / "tfs.npy", mmap_mode="r")
+        self.lens = np.load(seg_dir / "lens.npy", mmap_mode="r")
+        self.offsets = np.load(seg_dir / "offsets.npy", mmap_mode="r")
+        self.n = int(self.lens.shape[0])
+        self.total_len = int(self.lens.sum()) if self.n else 0
+        self.deleted = np.zeros(self.n, dtype=bool)
+        # searches holding this segment; a retired segment's files go once it drops to 0
+        self.refs = 0
+        self.retired = False
+
+    def norm(self, k1: float, b: float, avgdl: float):
+        """k1 * (1 - b + b * len / avgdl) per chunk, cached until avgdl changes."""
+        import numpy as np
+        key = (k1, b, avgdl)
+        if getattr(self, "_norm_key", None) != key:
+            self._norm = (k1 * (1.0 - b + b * np.asarray(self.lens, dtype=np.float32) / avgdl)).astype(np.float32)
+            self._norm_key = key
+        return self._norm
+
+    def chunk(self, local_id: int) -> dict:
+        with open(self.dir / "chunks.jsonl", "rb") as f:
+            f.seek(int(self.offsets[local_id]))
+            return json.loads(f.readline())
+
+def _write_segment(seg_dir: Path, chunks: list):
+    """chunks: [{"title", "url", "snippet", "terms"}]; writes postings sorted by term."""
+    import numpy as np
+    seg_dir.mkdir(parents=True, exist_ok=True)
+    post = {}
+    lens = np.zeros(len(chunks), dtype=np.uint32)
+    offsets = np.zeros(len(chunks), dtype=np.int64)
+    with open(seg_dir / "chunks.jsonl", "wb") as f:
+        for i, c in enumerate(chunks):
+            tf = {}
+            for t in c.pop("terms"):
+                tf[t] = tf.get(t, 0) + 1
+            lens[i] = sum(tf.values())
+            for t, n in tf.items():
+                post.setdefault(t, []).append((i, min(n, 65535)))
+            offsets[i] = f.tell()
+            f.write(json.dumps(c, ensure_ascii=False).encode("utf-8") + b"\n")
+    table = {}
+    docs_l, tfs_l = [], []
+    for t in sorted(post):
+        pl = post[t]
+        table[t] = [len(docs_l), len(pl)]
+        docs_l.extend(d for d, _ in pl)
+        tfs_l.extend(n for _, n in pl)
+    docs = np.asarray(docs_l, dtype=np.int32)
+    tfs = np.asarray(tfs_l, dtype=np.uint16)
+    np.save(seg_dir / "docs.npy", docs)
+    np.save(seg_dir / "tfs.npy", tfs)
+    np.save(seg_dir / "lens.npy", lens)
+    np.save(seg_dir / "offsets.npy", offsets)
+    with open(seg_dir / "terms.json", "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False)
+
+class DocIndex:
+    """BM25 index over local documents; ingest() is incremental by file mtime and size."""
+
+    def __init__(self, root: Path, k1: float = 1.2, b: float = 0.75, chunk_chars: int = 800, max_segments: int = 8):
+        self.root = Path(root)
+        self.k1 = float(k1)
+        self.b = float(b)
+        self.chunk_chars = int(chunk_chars)
+        self.max_segments = int(max_segments)
+        self._lock = threading.Lock()
+        self._ref_lock = threading.Lock()
+        self._manifest = {"version": 1, "segments": [], "files": {}, "deleted": {}, "next_seg": 1}
+        self._segments = []
+        self.counters = {"queries": 0, "query_ms": 0.0, "ingests": 0, "compactions": 0}
+        self._open()
+
+    def _open(self):
+        try:
+            with open(self.root / "index.json", "r", encoding="utf-8") as f:
+                m = json.load(f)
+            if m.get("version") == 1:
+                self._manifest = m
+        except Exception:
+            return
+        self._segments = self._load_segments(self._manifest)
+
+    def _load_segments(self, m):
+        segs = []
+        for name in m["segments"]:
+            s = _Segment(self.root / name)
+            for i in m["deleted"].get(name, []):
+                s.deleted[int(i)] = True
+            segs.append(s)
+        return segs
+
+    def _save_manifest(self, m):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / "index.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(m, f, ensure_ascii=False)
+        os.replace(tmp, self.root / "index.json")
+
+    def _chunks_for(self, path: Path):
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        title = _title_of(path, text)
+        for part in chunk_text(text, self.chunk_chars):
+            yield {"title": title, "url": str(path), "snippet": part, "terms": terms(part)}
+
+    def ingest(self, folder, progress=None) -> dict:
+        """Index new and changed files under folder; files that disappeared are dropped."""
+        folder = Path(folder).resolve()
+        with self._lock:
+            m = json.loads(json.dumps(self._manifest))
+            seen = set()
+            changed = []
+            for p in sorted(folder.rglob("*")):
+                if not p.is_file() or p.suffix.lower() not in _EXTS:
+                    continue
+                key = str(p)
+                seen.add(key)
+                st = p.stat()
+                old = m["files"].get(key)
+                if old and old["mtime"] == st.st_mtime and old["size"] == st.st_size:
+                    continue
+                changed.append((p, st))
+            prefix = str(folder) + os.sep
+            removed = [k for k in m["files"] if k.startswith(prefix) and k not in seen]
+            for k in removed + [str(p) for p, _ in changed]:
+                ent = m["files"].pop(k, None)
+                if ent:
+                    for seg, start, count in ent["chunks"]:
+                        m["deleted"].setdefault(seg, []).extend(range(start, start + count))
+            new_chunks = []
+            for i, (p, st) in enumerate(changed):
+                try:
+                    cs = list(self._chunks_for(p))
+                except Exception:
+                    cs = []
+                m["files"][str(p)] = {"mtime": st.st_mtime, "size": st.st_size, "chunks": [], "_new": [len(new_chunks), len(cs)]}
+                new_chunks.extend(cs)
+                if progress:
+                    progress(i + 1, len(changed))
+            if new_chunks:
+                name = "seg_%06d" % m["next_seg"]
+                m["next_seg"] += 1
+                _write_segment(self.root / name, new_chunks)
+                m["segments"].append(name)
+            for ent in m["files"].values():
+                nw = ent.pop("_new", None)
+                if nw is not None and nw[1]:
+                    ent["chunks"] = [[name, nw[0], nw[1]]]
+            self._commit(m)
+            if len(m["segments"]) > self.max_segments or self._deleted_ratio() > 0.3:
+                self._compact_locked()
+            self.counters["ingests"] += 1
+            return {"files": len(changed), "removed": len(removed), "chunks": len(new_chunks), **self._shape()}
+
+    def _commit(self, m):
+        segs = self._load_segments(m)
+        self._save_manifest(m)
+        live = set(m["segments"])
+        drop = []
+        with self._ref_lock:
+            old = self._segments
+            self._manifest = m
+            self._segments = segs
+            for s in old:
+                if s.name not in live:
+                    s.retired = True
+                    if s.refs == 0:
+                        drop.append(s)
+        for s in drop:
+            shutil.rmtree(s.dir, ignore_errors=True)
+
+    def _acquire(self):
+        """Current segments, pinned against deletion until _release."""
+        with self._ref_lock:
+            segs = list(self._segments)
+            for s in segs:
+                s.refs += 1
+        return segs
+
+    def _release(self, segs):
+        drop = []
+        with self._ref_lock:
+            for s in segs:
+                s.refs -= 1
+                if s.retired and s.refs == 0:
+                    drop.append(s)
+        for s in drop:
+            shutil.rmtree(s.dir, ignore_errors=True)
+
+    def _deleted_ratio(self):
+        n = sum(s.n for s in self._segments)
+        return (sum(int(s.deleted.sum()) for s in self._segments) / n) if n else 0.0
+
+    def compact(self):
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        """Rewrite all live chunks into one segment."""
+        m = json.loads(json.dumps(self._manifest))
+        chunks = []
+        remap = {}
+        for s in self._segments:
+            for i in range(s.n):
+                if not s.deleted[i]:
+                    remap[(s.name, i)] = len(chunks)
+                    c = s.chunk(i)
+                    c["terms"] = terms(c["snippet"])
+                    chunks.append(c)
+        name = "seg_%06d" % m["next_seg"]
+        m["next_seg"] += 1
+        if chunks:
+            _write_segment(self.root / name, chunks)
+            m["segments"] = [name]
+        else:
+            m["segments"] = []
+        m["deleted"] = {}
+        for ent in m["files"].values():
+            ids = [remap[(seg, j)] for seg, start, count in ent["chunks"] for j in range(start, start + count) if (seg, j) in remap]
+            ent["chunks"] = [[name, ids[0], len(ids)]] if ids else []
+        self._commit(m)
+        self.counters["compactions"] += 1
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Top-k chunks as {title, url, snippet, score} (the shape augment_with_sources takes)."""
+        import numpy as np
+        t0 = time.perf_counter()
+        segs = self._acquire()
+        try:
+            return self._search(segs, query, k, t0)
+        finally:
+            self._release(segs)
+
+    def _search(self, segs, query, k, t0):
+        qterms = list(dict.fromkeys(terms(query)))
+        n_all = sum(s.n for s in segs)
+        if not qterms or not n_all:
+            return []
+        avgdl = max(1.0, sum(s.total_len for s in segs) / n_all)
+        df = {t: sum(s.terms[t][1] for s in segs if t in s.terms) for t in qterms}
+        idf = {t: math.log(1.0 + (n_all - d + 0.5) / (d + 0.5)) for t, d in df.items() if d}
+        hits = []
+        for s in segs:
+            posts = [(s.terms[t], w) for t, w in idf.items() if t in s.terms]
+            if posts:
+                hits.extend(self._score_segment(s, posts, k, avgdl))
+        hits.sort(key=lambda h: -h[0])
+        out = []
+        for v, s, i in hits[:k]:
+            c = s.chunk(i)
+            c["score"] = round(v, 4)
+            out.append(c)
+        self.counters["queries"] += 1
+        self.counters["query_ms"] += (time.perf_counter() - t0) * 1000.0
+        return out
+
+    def _score_segment(self, s, posts, k, avgdl):
+        """MaxScore: score the chunks of the rare terms exactly; the frequent terms are
+        only probed for those chunks, unless a chunk holding nothing but frequent terms
+        could still reach the top k."""
+        import numpy as np
+        norm = s.norm(self.k1, self.b, avgdl)
+        rare = [p for p in posts if p[0][1] * 8 < s.n]
+        common = [p for p in posts if p[0][1] * 8 >= s.n]
+        res = None
+        if rare:
+            ids = np.concatenate([np.asarray(s.docs[a:a + c]) for (a, c), _ in rare])
+            w = np.concatenate([self._weights(s, a, c, w, norm) for (a, c), w in rare])
+            uniq, inv = np.unique(ids, return_inverse=True)
+            sc = np.bincount(inv, weights=w).astype(np.float32)
+            for (a, c), w in common:
+                d = s.docs[a:a + c]
+                pos = np.minimum(np.searchsorted(d, uniq), c - 1)
+                hit = np.asarray(d[pos]) == uniq
+                tf = np.asarray(s.tfs[a:a + c][pos[hit]], dtype=np.float32)
+                sc[hit] += w * tf * (self.k1 + 1.0) / (tf + norm[uniq[hit]])
+            keep = ~s.deleted[uniq]
+            uniq, sc = uniq[keep], sc[keep]
+            bound = sum(w * (self.k1 + 1.0) for _, w in common)
+            if not common or (len(sc) >= k and float(np.partition(sc, len(sc) - k)[len(sc) - k]) >= bound):
+                res = (uniq, sc)
+        if res is None:
+            # dense: a term lists each chunk once, so plain fancy-index adds are safe
+            sc = np.zeros(s.n, dtype=np.float32)
+            for (a, c), w in posts:
+                sc[s.docs[a:a + c]] += self._weights(s, a, c, w, norm)
+            sc[s.deleted] = 0.0
+            uniq = np.flatnonzero(sc > 0)
+            res = (uniq, sc[uniq])
+        uniq, sc = res
+        if len(sc) > k:
+            top = np.argpartition(-sc, k)[:k]
+            uniq, sc = uniq[top], sc[top]
+        return [(float(v), s, int(i)) for v, i in zip(sc, uniq)]
+
+    def _weights(self, s, a, c, idf, norm):
+        import numpy as np
+        tf = np.asarray(s.tfs[a:a + c], dtype=np.float32)
+        return idf * tf * (self.k1 + 1.0) / (tf + norm[s.docs[a:a + c]])
+
+    def _shape(self):
+        segs = self._segments
+        return {
+            "segments": len(segs),
+            "chunks": sum(s.n for s in segs) - sum(int(s.deleted.sum()) for s in segs),
+            "documents": len(self._manifest["files"]),
+        }
+
+    def stats(self):
+        q = self.counters["queries"]
+        return {**self._shape(), **self.counters, "avg_query_ms": (self.counters["query_ms"] / q) if q else None, "root": str(self.root)}
+
+_index = None
+_index_lock = threading.Lock()
+
+def local_index() -> DocIndex:
+    """Process-wide index under AIFUNLAND_DOCINDEX_DIR (default AIFUNLAND_CACHE_DIR/docindex)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                base = os.environ.get("AIFUNLAND_DOCINDEX_DIR")
+                if not base:
+                    base = str(Path(os.environ.get("AIFUNLAND_CACHE_DIR") or (Path.cwd() / "tmp")) / "docindex")
+                _index = DocIndex(Path(base))
+    return _index
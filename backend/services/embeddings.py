@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from backend.services import inference
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+def quantize_int8(vecs):
+    """Symmetric per-vector int8: vec ~= q * scale."""
+    import numpy as np
+    v = np.asarray(vecs, dtype=np.float32)
+    peak = np.abs(v).max(axis=1) if v.size else np.zeros(len(v), dtype=np.float32)
+    scale = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    q = np.clip(np.rint(v / scale[:, None]), -127, 127).astype(np.int8)
+    return q, scale
+
+class _MicroBatcher:
+    """Merges concurrent embed calls on one pipeline into embed_documents() calls of up to max_batch texts."""
+
+    def __init__(self, pipe, max_batch: int, max_wait_ms: float, counters: dict):
+        self.pipe = pipe
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.counters = counters
+        self._q = deque()
+        self._cv = threading.Condition()
+        self._closed = False
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, texts: list):
+        req = {"texts": texts, "done": threading.Event(), "out": None, "error": None}
+        with self._cv:
+            if self._closed:
+                raise RuntimeError("embedding pipeline was released")
+            self._q.append(req)
+            self._cv.notify()
+        req["done"].wait()
+        if req["error"] is not None:
+            raise req["error"]
+        return req["out"]
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            self._cv.notify()
+
+    def _take(self):
+        with self._cv:
+            while not self._q and not self._closed:
+                self._cv.wait()
+            if not self._q:
+                return None
+            # hold the first request up to max_wait for company
+            deadline = time.monotonic() + self.max_wait
+            while sum(len(r["texts"]) for r in self._q) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0 or self._closed:
+                    break
+                self._cv.wait(left)
+            batch, n = [], 0
+            while self._q and (not batch or n + len(self._q[0]["texts"]) <= self.max_batch):
+                r = self._q.popleft()
+                batch.append(r)
+                n += len(r["texts"])
+            return batch
+
+    def _loop(self):
+        import numpy as np
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            uniq = list(dict.fromkeys(t for r in batch for t in r["texts"]))
+            try:
+                vecs = []
+                for i in range(0, len(uniq), self.max_batch):
+                    vecs.append(np.asarray(self.pipe.embed_documents(uniq[i:i + self.max_batch]), dtype=np.float32))
+                mat = np.concatenate(vecs) if vecs else np.zeros((0, 0), dtype=np.float32)
+                pos = {t: i for i, t in enumerate(uniq)}
+                for r in batch:
+                    r["out"] = mat[[pos[t] for t in r["texts"]]]
+                self.counters["batches"] += 1
+                self.counters["batched_texts"] += len(uniq)
+            except Exception as e:
+                for r in batch:
+                    r["error"] = e
+            for r in batch:
+                r["done"].set()
+
+class EmbeddingService:
+    """/api/embed backend: LRU of recent text->vector results in front of per-model micro-batchers."""
+
+    def __init__(self, max_batch: int | None = None, max_wait_ms: float | None = None, cache_size: int | None = None):
+        self.max_batch = int(max_batch if max_batch is not None else _env_float("AIFUNLAND_EMBED_MAX_BATCH", 64))
+        self.max_wait_ms = float(max_wait_ms if max_wait_ms is not None else _env_float("AIFUNLAND_EMBED_MAX_WAIT_MS", 5))
+        self.cache_size = int(cache_size if cache_size is not None else _env_float("AIFUNLAND_EMBED_CACHE_SIZE", 20000))
+        self._lock = threading.Lock()
+        self._batchers = {}
+        self._cache = OrderedDict()
+        self.counters = {"requests": 0, "texts": 0, "cache_hits": 0, "batches": 0, "batched_texts": 0}
+
+    def _batcher(self, model_dir: Path, device: str, config: dict | None):
+        pipe = inference.load_embedding_pipeline(model_dir, device, config)
+        # one worker per pipeline: pooling, normalize and max_length each get their own
+        k = inference.embedding_key(model_dir, device, config)
+        with self._lock:
+            ent = self._batchers.get(k)
+            if ent is not None and ent[0] is pipe:
+                return ent[1]
+            if ent is not None:
+                # residency reloaded the model; retire the old worker
+                ent[1].close()
+            b = _MicroBatcher(pipe, self.max_batch, self.max_wait_ms, self.counters)
+            self._batchers[k] = (pipe, b)
+            return b
+
+    def embed(self, model_dir: Path, texts: list, device: str = "CPU", config: dict | None = None):
+        """float32 matrix with one row per text."""
+        import numpy as np
+        cfg = config or {}
+        scope = inference.embedding_key(model_dir, device, cfg)
+        texts = [str(t) for t in texts]
+        rows = [None] * len(texts)
+        miss = []
+        with self._lock:
+            self.counters["requests"] += 1
+            self.counters["texts"] += len(texts)
+            for i, t in enumerate(texts):
+                v = self._cache.get((scope, t))
+                if v is not None:
+                    self._cache.move_to_end((scope, t))
+                    rows[i] = v
+                else:
+                    miss.append(i)
+            self.counters["cache_hits"] += len(texts) - len(miss)
+        if miss:
+            mat = self._batcher(model_dir, device, cfg).submit([texts[i] for i in miss])
+            with self._lock:
+                for j, i in enumerate(miss):
+                    rows[i] = mat[j]
+                    self._cache[(scope, texts[i])] = mat[j]
+                    self._cache.move_to_end((scope, texts[i]))
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(rows).astype(np.float32, copy=False)
+
+    def embedder(self, model_dir: Path, device: str = "CPU", config: dict | None = None):
+        """fn(list[str]) -> 2D array, e.g. for response_cache.set_embedder()."""
+        return lambda texts: self.embed(model_dir, texts, device, config)
+
+    def stats(self):
+        with self._lock:
+            b = self.counters["batches"]
+            return {
+                **self.counters,
+                "avg_batch": (self.counters["batched_texts"] / b) if b else None,
+                "cache_entries": len(self._cache),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_ms,
+            }
+
+embedding_service = EmbeddingService()
@@ -1,9 +1,442 @@
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
 from pathlib import Path
 
+from backend.services.system import get_core, get_device_topology
+from backend.services.context import counter_for, fit_history, summarizer, summary_line, summary_prompt
+
 _pipe_cache = {}
 _t2i_cache = {}
+_t2v_cache = {}
+_embed_cache = {}
+_CB_DEFAULT_MAX_SEQS = 8
+
+# Residency: every cached LLM/T2I/T2V pipeline is registered here with its
+# estimated host-memory footprint. Loads that would exceed the budget evict the
+# cheapest-to-reload, least-recently-used idle pipelines first.
+
+def _ir_weight_bytes(model_dir: Path) -> int:
+    total = 0
+    try:
+        for fp in Path(model_dir).rglob("*.bin"):
+            try:
+                total += fp.stat().st_size
+            except Exception:
+                pass
+    except Exception:
+        pass
+    return total
+
+def _rss_bytes():
+    try:
+        import psutil
+        return int(psutil.Process().memory_info().rss)
+    except Exception:
+        return None
+
+def _default_mem_budget() -> int:
+    import os
+    v = os.environ.get("AIFUNLAND_MEM_BUDGET_MB")
+    if v:
+        try:
+            return int(float(v) * 1024 * 1024)
+        except ValueError:
+            pass
+    try:
+        from backend.services.system import _memory_info
+        mem = _memory_info()
+        if mem and mem.get("total_bytes"):
+            return int(mem["total_bytes"] * 0.7)
+    except Exception:
+        pass
+    return 8 * 1024 * 1024 * 1024
+
+def _pipe_busy(pipe) -> bool:
+    ent = _schedulers.get(id(pipe))
+    if ent is None or ent[0] is not pipe:
+        return False
+    try:
+        st = ent[1].stats()
+        return bool(st.get("active") or st.get("queue_depth"))
+    except Exception:
+        return False
+
+class _ResidencyManager:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._footprints = {}
+        self._budget = None
+        self.shares = 1
+        self.evictions = 0
+
+    def total_budget(self) -> int:
+        if self._budget is None:
+            self._budget = _default_mem_budget()
+        return self._budget
+
+    def budget(self) -> int:
+        # with model workers the total is split between this process and each worker
+        return self.total_budget() // self.shares
+
+    def set_budget(self, nbytes: int | None):
+        with self._lock:
+            self._budget = int(nbytes) if nbytes else None
+            self.reserve(0)
+
+    def set_shares(self, n: int):
+        with self._lock:
+            self.shares = max(1, int(n))
+            self.reserve(0)
+
+    def used(self) -> int:
+        with self._lock:
+            return sum(e["bytes"] for e in self._entries.values())
+
+    def estimate(self, model_dir: Path) -> int:
+        measured = self._footprints.get(str(model_dir)) or 0
+        return max(_ir_weight_bytes(model_dir), measured)
+
+    def reserve(self, nbytes: int):
+        evicted = []
+        with self._lock:
+            while self._entries and self.used() + nbytes > self.budget():
+                victim = self._pick_victim()
+                if victim is None:
+                    break
+                evicted.append(victim)
+                self._evict(victim)
+        if evicted:
+            import gc
+            gc.collect()
+        return evicted
+
+    def add(self, kind: str, key, cache: dict, model_dir: Path, nbytes: int, rss_delta: int | None, load_ms: float):
+        if rss_delta and rss_delta > 0:
+            self._footprints[str(model_dir)] = int(rss_delta)
+            nbytes = max(int(nbytes), int(rss_delta))
+        with self._lock:
+            self._entries[(kind, key)] = {
+                "kind": kind,
+                "key": key,
+                "cache": cache,
+                "model_dir": str(model_dir),
+                "bytes": int(nbytes),
+                "load_ms": float(load_ms),
+                "last_used": time.time(),
+                "hits": 0,
+            }
+            self._entries.move_to_end((kind, key))
+
+    def touch(self, kind: str, key):
+        with self._lock:
+            e = self._entries.get((kind, key))
+            if e is not None:
+                e["last_used"] = time.time()
+                e["hits"] += 1
+                self._entries.move_to_end((kind, key))
+
+    def discard(self, kind: str, key):
+        with self._lock:
+            self._entries.pop((kind, key), None)
+
+    def _pick_victim(self):
+        # value of keeping a pipeline: what a reload would cost, discounted by
+        # how long it has been idle and by how much memory it pins
+        now = time.time()
+        best = None
+        best_v = None
+        for ek, e in self._entries.items():
+            pipe = e["cache"].get(e["key"])
+            if pipe is not None and _pipe_busy(pipe):
+                continue
+            idle = max(0.0, now - e["last_used"])
+            gb = max(e["bytes"], 1) / float(1 << 30)
+            v = (e["load_ms"] + 1.0) / ((idle + 1.0) * max(gb, 0.01))
+            if best_v is None or v < best_v:
+                best, best_v = ek, v
+        return best
+
+    def _evict(self, ek):
+        e = self._entries.pop(ek, None)
+        if e is None:
+            return
+        self.evictions += 1
+        pipe = e["cache"].pop(e["key"], None)
+        if pipe is not None:
+            _forget_pipe(pipe)
+
+    def stats(self):
+        with self._lock:
+            rows = [{
+                "kind": e["kind"],
+                "model": Path(e["model_dir"]).name,
+                "key": [str(x) for x in e["key"]],
+                "bytes": e["bytes"],
+                "load_ms": e["load_ms"],
+                "idle_s": max(0.0, time.time() - e["last_used"]),
+                "hits": e["hits"],
+            } for e in self._entries.values()]
+        return {"budget_bytes": self.budget(), "total_budget_bytes": self.total_budget(), "shares": self.shares,
+                "used_bytes": sum(r["bytes"] for r in rows), "evictions": self.evictions, "entries": rows}
+
+_residency = _ResidencyManager()
+
+def _residency_begin(model_dir: Path):
+    est = _residency.estimate(model_dir)
+    _residency.reserve(est)
+    return {"est": est, "rss": _rss_bytes(), "t0": time.perf_counter()}
 
-def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
+def _residency_commit(kind: str, key, cache: dict, model_dir: Path, token: dict):
+    load_ms = (time.perf_counter() - token["t0"]) * 1000.0
+    rss1 = _rss_bytes()
+    delta = (rss1 - token["rss"]) if (rss1 is not None and token["rss"] is not None) else None
+    _residency.add(kind, key, cache, model_dir, token["est"], delta, load_ms)
+
+def residency_stats():
+    from backend.services.workers import active_pool
+    st = _residency.stats()
+    pool = active_pool()
+    if pool is not None:
+        st["workers"] = pool.memory_stats()
+    return st
+
+def set_memory_budget(budget_mb: float | None):
+    from backend.services.workers import active_pool
+    _residency.set_budget(int(float(budget_mb) * 1024 * 1024) if budget_mb else None)
+    pool = active_pool()
+    if pool is not None:
+        pool.rebalance()
+    return residency_stats()
+
+# config keys that can change which pipeline a request resolves to
+_COMPILE_KEYS = (
+    "perf_mode", "hetero_enable", "prefill_igpu_decode_npu", "npu_streams", "npu_tiles",
+    "num_requests", "gpu_streams", "enable_profiling", "max_prompt_len", "min_response_len",
+    "continuous_batching", "cb_max_seqs", "cb_max_batched_tokens", "cb_cache_gb", "cb_prefix_caching",
+    "draft_model_id", "draft_device", "decode_mode", "device_props", "use_profile", "cpu_threads",
+    "cpu_profile", "inference_precision", "kv_cache_precision", "dq_group_size",
+    "autotune_candidate",
+)
+_pipe_alias = {}
+_load_stats = {"hits": 0, "hit_ns": 0, "hit_ns_max": 0, "misses": 0, "miss_ns": 0}
+
+def _request_key(model_dir: Path, device: str, config: dict | None):
+    if not config:
+        return (str(model_dir), device)
+    items = []
+    for k in _COMPILE_KEYS:
+        v = config.get(k)
+        if v is not None:
+            items.append((k, v if isinstance(v, (str, int, float, bool)) else repr(v)))
+    return (str(model_dir), device, tuple(items))
+
+def _cached_pipeline(rkey):
+    ent = _pipe_alias.get(rkey)
+    if ent is not None:
+        key, runtime = ent
+        p = _pipe_cache.get(key)
+        if p is not None:
+            _residency.touch("llm", key)
+            if runtime:
+                _apply_runtime_settings(p, runtime)
+            return p
+    return None
+
+def load_pipeline(model_dir: Path, device: str, config: dict | None = None, reconfigure: bool = True):
+    """Cached pipeline for this request config.
+
+    With `reconfigure=False` the result is always compiled for exactly this
+    config: a pending background recompile is waited for and no differently
+    compiled sibling stands in (offline jobs that rely on their hints).
+    """
+    t0 = time.perf_counter_ns()
+    rkey = _request_key(model_dir, device, config)
+    if not reconfigure:
+        _wait_recompile(rkey)
+    p = _cached_pipeline(rkey) if reconfigure else None
+    if p is not None:
+        dt = time.perf_counter_ns() - t0
+        _load_stats["hits"] += 1
+        _load_stats["hit_ns"] += dt
+        if dt > _load_stats["hit_ns_max"]:
+            _load_stats["hit_ns_max"] = dt
+        return p
+    job = _LoadJob((str(model_dir), device), rkey, reconfigure)
+    return _drive_load(job, model_dir, device, config).result()
+
+class _LoadJob:
+    """One pipeline load; concurrent callers for the same model/device wait on it."""
+
+    def __init__(self, fkey, rkey, reconfigure=True):
+        self.fkey = fkey
+        self.rkey = rkey
+        self.reconfigure = reconfigure
+        self.state = "queued"
+        self.pipe = None
+        self.error = None
+        self.t0 = time.time()
+        self.t_done = None
+        self._done = threading.Event()
+
+    def _set(self, state):
+        self.state = state
+
+    def _finish(self, pipe=None, error=None, state="ready"):
+        self.pipe = pipe
+        self.error = error
+        self.state = state
+        self.t_done = time.time()
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def result(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.pipe
+
+    def status(self):
+        end = self.t_done or time.time()
+        elapsed = int((end - self.t0) * 1000)
+        progress = None
+        if self.state == "ready":
+            progress = 1.0
+        elif self.state == "queued":
+            progress = 0.0
+        elif self.state == "warming":
+            progress = 0.95
+        elif self.state == "compiling":
+            expect = _load_expect_ms.get(self.fkey)
+            if expect:
+                progress = round(min(0.9, elapsed / float(expect)), 3)
+        out = {"state": self.state, "elapsed_ms": elapsed, "progress": progress}
+        if self.error is not None:
+            out["error"] = str(self.error)
+        return out
+
+_load_lock = threading.Lock()
+_load_inflight = {}
+_load_last = {}
+_load_expect_ms = {}
+
+def _claim_load(job):
+    with _load_lock:
+        cur = _load_inflight.get(job.fkey)
+        if cur is None:
+            _load_inflight[job.fkey] = job
+            _load_last[job.fkey] = job
+        return cur
+
+def _run_load(job, model_dir, device, config, warmup=False):
+    t0 = time.perf_counter_ns()
+    try:
+        job._set("compiling")
+        p, key = _load_pipeline_uncached(model_dir, device, config, **({} if job.reconfigure else {"reconfigure": False}))
+        runtime = _runtime_settings(config)
+        _apply_runtime_settings(p, runtime)
+        cur = _pipe_alias.get(job.rkey)
+        # a background recompile may already have swapped this request's alias;
+        # an exact load is the right pipeline for it either way
+        if not job.reconfigure or cur is None or cur[0] == key or _pipe_cache.get(cur[0]) is None:
+            _pipe_alias[job.rkey] = (key, runtime)
+        _load_expect_ms[job.fkey] = (time.perf_counter_ns() - t0) / 1e6
+        if warmup:
+            job._set("warming")
+            try:
+                submit_generation(p, "warmup", {"max_new_tokens": 1})
+            except Exception:
+                pass
+        job._finish(p)
+    except Exception as e:
+        job._finish(error=e, state="failed")
+    finally:
+        with _load_lock:
+            if _load_inflight.get(job.fkey) is job:
+                _load_inflight.pop(job.fkey, None)
+        _load_stats["misses"] += 1
+        _load_stats["miss_ns"] += time.perf_counter_ns() - t0
+    return job
+
+def _drive_load(job, model_dir, device, config, warmup=False):
+    # loads of one model/device are serialized; a load of another config
+    # waits for the current one and then finds the compiled model cached
+    while True:
+        cur = _claim_load(job)
+        if cur is None:
+            return _run_load(job, model_dir, device, config, warmup)
+        cur.wait()
+        # a hot-reconfigure load may have returned a sibling; exact loads run their own
+        if cur.rkey == job.rkey and (job.reconfigure or not cur.reconfigure):
+            job._finish(cur.pipe, cur.error, cur.state)
+            return job
+
+def _admitted_load(job, model_dir, device, config, warmup, priority):
+    from backend.services.admission import admission, AdmissionRejected
+    try:
+        ticket = admission.request(priority, None)
+        ticket.wait()
+    except AdmissionRejected as e:
+        job._finish(error=e, state="failed")
+        return job
+    try:
+        return _drive_load(job, model_dir, device, config, warmup)
+    finally:
+        ticket.release()
+
+def load_pipeline_async(model_dir: Path, device: str, config: dict | None = None, warmup: bool = False, priority: str | None = None):
+    """Start loading in the background and return the job; a cached pipeline returns a finished job.
+
+    With `priority` the load first waits for an admission slot of that class.
+    """
+    rkey = _request_key(model_dir, device, config)
+    job = _LoadJob((str(model_dir), device), rkey)
+    p = _cached_pipeline(rkey)
+    if p is not None:
+        job._finish(p)
+        return job
+    with _load_lock:
+        cur = _load_inflight.get(job.fkey)
+    if cur is not None and cur.rkey == rkey:
+        return cur
+    if priority:
+        threading.Thread(target=_admitted_load, args=(job, model_dir, device, config, warmup, priority), daemon=True).start()
+    else:
+        threading.Thread(target=_drive_load, args=(job, model_dir, device, config, warmup), daemon=True).start()
+    return job
+
+def load_status(model_dir: Path, device: str):
+    fkey = (str(model_dir), device)
+    with _load_lock:
+        job = _load_inflight.get(fkey) or _load_last.get(fkey)
+    if job is not None and not job.done():
+        return job.status()
+    if is_model_loaded(model_dir, device):
+        return {"state": "ready", "progress": 1.0}
+    if job is not None and job.state == "failed":
+        return job.status()
+    return {"state": "unloaded"}
+
+def load_stats():
+    st = dict(_load_stats)
+    return {
+        "hits": st["hits"],
+        "hit_avg_us": (st["hit_ns"] / st["hits"] / 1000.0) if st["hits"] else None,
+        "hit_max_us": st["hit_ns_max"] / 1000.0,
+        "misses": st["misses"],
+        "miss_avg_ms": (st["miss_ns"] / st["misses"] / 1e6) if st["misses"] else None,
+        "reconfigure": reconfigure_stats(),
+    }
+
+def _load_pipeline_uncached(model_dir: Path, device: str, config: dict | None = None, reconfigure: bool = True):
     import openvino_genai as ov_genai
     import os
     os.environ.setdefault("OPENVINO_LOG_LEVEL", "0")
@@ -65,60 +498,7 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
             ov.save_model(ov_detok, str(target_dir / "openvino_detokenizer.xml"))
         except Exception:
             pass
-    import os
-    def _ordered_gpu_list(core):
-        try:
-            avail = core.available_devices
-        except Exception:
-            avail = []
-        gpu_devs = [d for d in avail if d.startswith("GPU")]
-        if not gpu_devs:
-            return []
-        info = {}
-        for d in gpu_devs:
-            try:
-                fn = core.get_property(d, "FULL_DEVICE_NAME")
-                fn = str(fn) if fn is not None else ""
-            except Exception:
-                fn = ""
-            info[d] = fn
-        def _is_igpu(name):
-            if not name:
-                return False
-            ln = name.lower()
-            if "(igpu)" in ln or " igpu" in ln:
-                return True
-            for k in ("integrated", "uhd", "iris", "hd graphics"):
-                if k in ln:
-                    return True
-            return False
-        integrated = [d for d, n in info.items() if _is_igpu(n)]
-        if integrated:
-            try:
-                integrated.sort(key=lambda s: int(s.split(".")[1]) if "." in s and s.split(".")[1].isdigit() else 0)
-            except Exception:
-                pass
-            others = [d for d in gpu_devs if d not in integrated]
-            return integrated + others
-        try:
-            import platform, subprocess
-            if platform.system() == "Windows":
-                out = subprocess.check_output(["wmic", "path", "Win32_VideoController", "get", "Name"], stderr=subprocess.STDOUT, shell=True, text=True)
-                controllers = [ln.strip() for ln in out.splitlines() if ln.strip() and not ln.strip().lower().startswith("name")]
-                intel_names = [n for n in controllers if "intel" in n.lower()]
-                if intel_names:
-                    key = intel_names[0].lower()
-                    matched = [d for d, fn in info.items() if key in fn.lower()]
-                    if matched:
-                        others = [d for d in gpu_devs if d not in matched]
-                        return matched + others
-        except Exception:
-            pass
-        intel_list = [d for d, fn in info.items() if fn and "intel" in fn.lower()]
-        if intel_list:
-            others = [d for d in gpu_devs if d not in intel_list]
-            return intel_list + others
-        return gpu_devs
+    topo = get_device_topology()
     try:
         from pathlib import Path as _P
         _base = os.environ.get("AIFUNLAND_CACHE_DIR") or str(_P.cwd() / "tmp")
@@ -131,10 +511,8 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
         pass
     if config and (device.startswith("AUTO") or device.startswith("MULTI")):
         try:
-            from openvino import Core as _Core
-            _core = _Core()
-            _devs = _core.available_devices
-            ordered_gpus = _ordered_gpu_list(_core)
+            _devs = topo.get("available") or []
+            ordered_gpus = topo.get("ordered_gpus") or []
             igpu = ordered_gpus[0] if ordered_gpus else None
             if config.get("hetero_enable"):
                 prio = []
@@ -165,9 +543,7 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
     try:
         if config and config.get("prefill_igpu_decode_npu"):
             try:
-                from openvino import Core as _Core
-                _core = _Core()
-                ordered_gpus = _ordered_gpu_list(_core)
+                ordered_gpus = topo.get("ordered_gpus") or []
                 igpu = ordered_gpus[0] if ordered_gpus else "GPU"
             except Exception:
                 igpu = "GPU"
@@ -234,9 +610,9 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
             
             # detect NPU architecture to set tiles and num_requests
             try:
-                from openvino import Core
-                core = Core()
-                arch = core.get_property("NPU", "DEVICE_ARCHITECTURE")
+                arch = topo.get("npu_arch")
+                if arch is None:
+                    raise RuntimeError("npu_arch_unknown")
                 arch_s = str(arch).lower()
                 if "4000" in arch_s:
                     inference_props["NPU_TILES"] = "4"
@@ -281,14 +657,58 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
              
     elif device == "CPU" or ("CPU" in device):
         try:
-            nt = os.cpu_count() or 4
-            inference_props["INFERENCE_NUM_THREADS"] = str(max(2, nt // 2))
+            pinned = (config or {}).get("cpu_threads")
+            if pinned:
+                # a replica pinned to its own core set uses exactly those cores
+                inference_props["INFERENCE_NUM_THREADS"] = str(int(pinned))
+                inference_props["ENABLE_CPU_PINNING"] = "YES"
+            else:
+                nt = os.cpu_count() or 4
+                inference_props["INFERENCE_NUM_THREADS"] = str(max(2, nt // 2))
+        except Exception:
+            pass
+        try:
+            from backend.services.system import cpu_profile
+            inference_props.update(cpu_profile(config)["props"])
         except Exception:
             pass
 
-    key = (str(model_dir), device)
+    # measured properties: an autotune sweep candidate, else the stored profile
+    tuned_props = (config or {}).get("device_props")
+    if tuned_props is None and (config or {}).get("use_profile", True):
+        try:
+            from backend.services.autotune import device_profile
+            tuned_props = device_profile(model_dir, device, config)
+        except Exception:
+            tuned_props = None
+    if tuned_props:
+        inference_props.update({str(k): str(v) for k, v in tuned_props.items()})
+
+    draft_id = (config or {}).get("draft_model_id")
+    lookup = (not draft_id) and str((config or {}).get("decode_mode") or "").lower() == "prompt_lookup"
+    # assisted decoding runs through LLMPipeline so its per-request
+    # acceptance metrics stay available
+    use_cb = _wants_continuous_batching(config) and not draft_id and not lookup
+    fp = _config_fingerprint(inference_props, config, use_cb)
+    key = (str(model_dir), device, fp) + ((f"draft:{draft_id}",) if draft_id else ()) + (("prompt_lookup",) if lookup else ())
+    if (config or {}).get("autotune_candidate"):
+        # sweep candidates never share a cache entry with, or stand in for, serving pipelines
+        key += ("autotune",)
     p = _pipe_cache.get(key)
+    replaced = None
+    if p is None and reconfigure and _hot_reconfigure_enabled():
+        sib = _sibling_pipeline(key)
+        if sib is not None and _sibling_can_serve(sib[1], config):
+            _start_recompile(_request_key(model_dir, device, config), key, model_dir, device, config, old_key=sib[0])
+            _residency.touch("llm", sib[0])
+            return sib[1], sib[0]
+        # compiled for another prompt/response size: load synchronously, then retire it
+        replaced = sib
     if p is None:
+        draft = {"dir": None, "note": None}
+        if draft_id:
+            draft["dir"], draft["note"] = _resolve_draft_model(model_dir.parent, str(draft_id), target_dir)
+        res_token = _residency_begin(target_dir)
         def _try(dev_str):
             pipe_cfg = {}
             try:
@@ -323,6 +743,34 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
                         pipe_cfg["MIN_RESPONSE_LEN"] = int(mrl)
             except Exception:
                 pass
+            if use_cb and (dev_str == "CPU" or dev_str.startswith("GPU")):
+                try:
+                    sc = _scheduler_config(ov_genai, config)
+                    cb_cfg = {k: v for k, v in pipe_cfg.items() if k not in ("MAX_PROMPT_LEN", "MIN_RESPONSE_LEN")}
+                    obj = ov_genai.ContinuousBatchingPipeline(str(target_dir), sc, dev_str, cb_cfg)
+                    engine = _BatchEngine(obj, sc.max_num_seqs, {"model": Path(str(model_dir)).name, "device": dev_str})
+                    _apply_runtime_settings(engine, _runtime_settings(config))
+                    with _sched_lock:
+                        _schedulers[id(obj)] = (obj, engine)
+                    return obj
+                except Exception:
+                    pass
+            if draft["dir"] is not None:
+                try:
+                    sd_cfg = dict(pipe_cfg)
+                    sd_cfg["draft_model"] = ov_genai.draft_model(str(draft["dir"]), _draft_device(dev_str, config))
+                    obj = ov_genai.LLMPipeline(str(target_dir), dev_str, sd_cfg)
+                    _set_pipe_meta(obj, speculative=draft["dir"].name)
+                    return obj
+                except Exception as e:
+                    draft["note"] = "draft_load_failed: " + str(e)[:200]
+            if lookup:
+                try:
+                    obj = ov_genai.LLMPipeline(str(target_dir), dev_str, {**pipe_cfg, "prompt_lookup": True})
+                    _set_pipe_meta(obj, prompt_lookup=True)
+                    return obj
+                except Exception as e:
+                    draft["note"] = "prompt_lookup_failed: " + str(e)[:200]
             obj = ov_genai.LLMPipeline(str(target_dir), dev_str, pipe_cfg)
             try:
                 setattr(obj, "_af_device_real", dev_str)
@@ -334,9 +782,8 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
                 devs = device.split(":",1)[1]
                 # map generic GPU to Intel iGPU first when available
                 try:
-                    from openvino import Core as _Core
-                    _hc = _Core()
-                    ordered_gpus = _ordered_gpu_list(_hc)
+                    _hc = get_core()
+                    ordered_gpus = topo.get("ordered_gpus") or []
                     igpu = ordered_gpus[0] if ordered_gpus else None
                     parts = [d.strip() for d in devs.split(",") if d.strip()]
                     mapped = []
@@ -372,9 +819,7 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
                         p = None
                     if p is None:
                         try:
-                            from openvino import Core as _Core
-                            _c = _Core()
-                            _c.set_property("AUTO", {"PERFORMANCE_HINT": perf_mode, "MODEL_DISTRIBUTION_POLICY": "PIPELINE_PARALLEL"})
+                            get_core().set_property("AUTO", {"PERFORMANCE_HINT": perf_mode, "MODEL_DISTRIBUTION_POLICY": "PIPELINE_PARALLEL"})
                         except Exception:
                             pass
                         try:
@@ -386,9 +831,8 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
                 devs = device.split(":",1)[1]
                 # map to HETERO with pipeline parallelism, GPU prioritized to Intel iGPU
                 try:
-                    from openvino import Core as _Core
-                    _hc = _Core()
-                    ordered_gpus = _ordered_gpu_list(_hc)
+                    _hc = get_core()
+                    ordered_gpus = topo.get("ordered_gpus") or []
                     igpu = ordered_gpus[0] if ordered_gpus else None
                     parts = [d.strip() for d in devs.split(",") if d.strip()]
                     mapped = []
@@ -434,11 +878,9 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
                     devs = device.split(":",1)[1]
                 else:
                     try:
-                        from openvino import Core
-                        c = Core()
-                        avail = c.available_devices
+                        avail = topo.get("available") or []
                         prio = []
-                        ordered_gpus = _ordered_gpu_list(c)
+                        ordered_gpus = topo.get("ordered_gpus") or []
                         if any(d.startswith("NPU") for d in avail):
                             prio.append("NPU")
                         if ordered_gpus:
@@ -455,9 +897,7 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
                         if "NUM_REQUESTS" not in inference_props:
                              inference_props["NUM_REQUESTS"] = "4"
                     try:
-                        from openvino import Core
-                        c = Core()
-                        c.set_property("AUTO", {"PERFORMANCE_HINT": perf_mode, "MODEL_DISTRIBUTION_POLICY": "PIPELINE_PARALLEL"})
+                        get_core().set_property("AUTO", {"PERFORMANCE_HINT": perf_mode, "MODEL_DISTRIBUTION_POLICY": "PIPELINE_PARALLEL"})
                     except Exception:
                         pass
                     try:
@@ -482,15 +922,17 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
             if p:
                 try:
                     setattr(p, "_af_device", device)
+                    # lets the perf tuner credit the arm that actually ran
+                    setattr(p, "_af_props", dict(inference_props))
                 except Exception:
                     pass
         except Exception as e:
             msg = str(e)
             order = []
             try:
-                from openvino import Core
-                core = Core()
-                order = core.available_devices
+                order = list(topo.get("available") or [])
+                if not order:
+                    raise RuntimeError("no_devices")
             except Exception:
                 order = ["GPU","CPU"]
             for d in order:
@@ -501,8 +943,212 @@ def load_pipeline(model_dir: Path, device: str, config: dict | None = None):
                     p = None
             if p is None:
                 raise
+        if draft_id and not pipeline_info(p).get("speculative"):
+            _set_pipe_meta(p, speculative=None, speculative_fallback=draft["note"] or "draft_unavailable")
+        if lookup and not pipeline_info(p).get("prompt_lookup"):
+            _set_pipe_meta(p, prompt_lookup=False, prompt_lookup_fallback=draft["note"] or "prompt_lookup_unavailable")
+        _set_pipe_meta(p, input_bounds=_input_bounds(config))
         _pipe_cache[key] = p
-    return p
+        _residency_commit("llm", key, _pipe_cache, target_dir, res_token)
+        if replaced is not None:
+            _retire_when_idle(*replaced)
+    else:
+        _residency.touch("llm", key)
+    return p, key
+
+def _tokenizer_fingerprint(model_dir: Path):
+    import hashlib
+    import json
+    tj = model_dir / "tokenizer.json"
+    try:
+        if tj.exists():
+            with open(tj, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            vocab = (data.get("model") or {}).get("vocab")
+            added = sorted((t.get("id"), t.get("content")) for t in (data.get("added_tokens") or []))
+            return hashlib.sha1(json.dumps([vocab, added], sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        files = [model_dir / n for n in ("vocab.json", "merges.txt")]
+        if all(f.exists() for f in files):
+            h = hashlib.sha1()
+            for f in files:
+                h.update(f.read_bytes())
+            return h.hexdigest()
+    except Exception:
+        pass
+    return None
+
+def _resolve_draft_model(root: Path, draft_id: str, target_dir: Path):
+    base = root / draft_id.replace("/", "__")
+    cands = [base] + [base.parent / (base.name + s) for s in ("_quant_int8", "_quant_int4", "_ov_fp32")]
+    draft_dir = next((c for c in cands if (c / "openvino_model.xml").exists()), None)
+    if draft_dir is None:
+        return None, "draft_not_found"
+    if draft_dir.resolve() == Path(target_dir).resolve():
+        return None, "draft_is_target"
+    # draft and target must share a vocabulary for token-level verification
+    fa = _tokenizer_fingerprint(draft_dir)
+    fb = _tokenizer_fingerprint(Path(target_dir))
+    if fa and fb and fa != fb:
+        return None, "tokenizer_mismatch"
+    return draft_dir, None
+
+def _draft_device(dev_str: str, config: dict | None) -> str:
+    d = (config or {}).get("draft_device")
+    if d:
+        return str(d)
+    return dev_str if (dev_str == "CPU" or dev_str.startswith("GPU")) else "CPU"
+
+def _wants_continuous_batching(config: dict | None) -> bool:
+    import os
+    v = (config or {}).get("continuous_batching")
+    if v is None:
+        v = os.environ.get("AIFUNLAND_CONTINUOUS_BATCHING", "1")
+    return str(v).strip().lower() not in ("0", "false", "no", "off", "")
+
+def _cb_seq_cap(cfg: dict):
+    # the compiled scheduler gets a power-of-two slot count; the engine
+    # admits cb_max_seqs of them, so lowering it needs no recompile
+    n = max(int(cfg.get("cb_max_seqs") or _CB_DEFAULT_MAX_SEQS), _CB_DEFAULT_MAX_SEQS)
+    cap = 1
+    while cap < n:
+        cap *= 2
+    return cap
+
+def _config_fingerprint(props: dict, config: dict | None, use_cb: bool) -> str:
+    """Canonical hash of the properties a pipeline is compiled with."""
+    import hashlib
+    import json
+    cfg = config or {}
+    eff = {k: str(v) for k, v in props.items()}
+    for k in ("max_prompt_len", "min_response_len"):
+        if cfg.get(k):
+            eff[k.upper()] = str(int(cfg[k]))
+    if use_cb:
+        eff["CB"] = [
+            _cb_seq_cap(cfg),
+            int(cfg.get("cb_max_batched_tokens") or 256),
+            int(cfg.get("cb_cache_gb") or 2),
+            bool(cfg.get("cb_prefix_caching", True)),
+        ]
+    return hashlib.sha1(json.dumps(eff, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+def _runtime_settings(config: dict | None):
+    cfg = config or {}
+    if cfg.get("cb_max_seqs"):
+        return {"max_seqs": int(cfg["cb_max_seqs"])}
+    return None
+
+def _apply_runtime_settings(target, runtime):
+    if not runtime:
+        return
+    eng = target if isinstance(target, _BatchEngine) else None
+    if eng is None:
+        with _sched_lock:
+            ent = _schedulers.get(id(target))
+        eng = ent[1] if (ent and ent[0] is target and isinstance(ent[1], _BatchEngine)) else None
+    if eng is not None and "max_seqs" in runtime:
+        eng.max_seqs = max(1, min(int(runtime["max_seqs"]), eng.seq_cap))
+
+def _hot_reconfigure_enabled() -> bool:
+    import os
+    return os.environ.get("AIFUNLAND_HOT_RECONFIGURE", "1") != "0"
+
+def _sibling_pipeline(key):
+    """A resident pipeline of the same model, device and decode variant compiled with other properties."""
+    for k, p in list(_pipe_cache.items()):
+        if k != key and k[:2] == key[:2] and k[3:] == key[3:]:
+            return k, p
+    return None
+
+def _input_bounds(config: dict | None) -> tuple:
+    """Compiled limits on prompt and response size (NPU MAX_PROMPT_LEN / MIN_RESPONSE_LEN)."""
+    cfg = config or {}
+    return tuple(int(cfg[k]) if cfg.get(k) else None for k in ("max_prompt_len", "min_response_len"))
+
+def _sibling_can_serve(pipe, config: dict | None) -> bool:
+    # context_budget sizes prompts to the requested max_prompt_len, which a
+    # sibling compiled with another limit could reject
+    return pipeline_info(pipe).get("input_bounds", (None, None)) == _input_bounds(config)
+
+def _retire_when_idle(key, pipe):
+    """Release a pipeline replaced by a recompile once its in-flight generations finish."""
+    def _run():
+        while _pipe_cache.get(key) is pipe and _pipe_busy(pipe):
+            time.sleep(0.05)
+        if _pipe_cache.get(key) is pipe:
+            release_pipeline(pipe)
+            _reconfig_stats["retired"] += 1
+    threading.Thread(target=_run, daemon=True).start()
+
+_recompile_lock = threading.Lock()
+_recompile_done = threading.Condition(_recompile_lock)
+_recompiling = {}
+
+def _wait_recompile(rkey, timeout: float = 600.0):
+    """Blocks while a background recompile is pending for this request key."""
+    end = time.monotonic() + timeout
+    with _recompile_done:
+        while any(rkey in rks for rks in _recompiling.values()):
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            _recompile_done.wait(left)
+
+def _start_recompile(rkey, key, model_dir: Path, device: str, config: dict | None, old_key=None):
+    with _recompile_lock:
+        waiting = _recompiling.get(key)
+        if waiting is not None:
+            waiting.add(rkey)
+            return
+        _recompiling[key] = {rkey}
+    def _bg():
+        t0 = time.perf_counter()
+        new_key = None
+        try:
+            _, new_key = _load_pipeline_uncached(model_dir, device, config, reconfigure=False)
+        except Exception:
+            pass
+        finally:
+            with _recompile_lock:
+                rkeys = _recompiling.get(key, set())
+                if new_key is not None:
+                    # requests keep their old pipeline until this single alias
+                    # update; in-flight generations finish on it
+                    rt = _runtime_settings(config)
+                    for rk in rkeys:
+                        _pipe_alias[rk] = (new_key, rt)
+                    _reconfig_stats["recompiles"] += 1
+                    _reconfig_stats["last_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+                else:
+                    _reconfig_stats["failed"] += 1
+                _recompiling.pop(key, None)
+                _recompile_done.notify_all()
+            old = _pipe_cache.get(old_key) if old_key is not None else None
+            if new_key is not None and old_key != new_key and old is not None:
+                _retire_when_idle(old_key, old)
+    _reconfig_stats["started"] += 1
+    threading.Thread(target=_bg, daemon=True).start()
+
+_reconfig_stats = {"started": 0, "recompiles": 0, "failed": 0, "retired": 0, "last_ms": None}
+
+def reconfigure_stats():
+    with _recompile_lock:
+        pending = len(_recompiling)
+    return {**_reconfig_stats, "pending": pending}
+
+def _scheduler_config(ov_genai, config: dict | None):
+    cfg = config or {}
+    sc = ov_genai.SchedulerConfig()
+    sc.max_num_seqs = _cb_seq_cap(cfg)
+    sc.max_num_batched_tokens = int(cfg.get("cb_max_batched_tokens") or 256)
+    sc.cache_size = int(cfg.get("cb_cache_gb") or 2)
+    sc.dynamic_split_fuse = True
+    try:
+        # lets session turns and repeated system prompts skip the shared prefix
+        sc.enable_prefix_caching = bool(cfg.get("cb_prefix_caching", True))
+    except Exception:
+        pass
+    return sc
 
 def load_t2i_pipeline(model_dir: Path, devices: dict | str, props: dict | None = None):
     import openvino_genai as ov_genai
@@ -530,6 +1176,7 @@ def load_t2i_pipeline(model_dir: Path, devices: dict | str, props: dict | None =
         key = (str(model_dir),) + chosen
         p = _t2i_cache.get(key)
         if p is None:
+            res_token = _residency_begin(model_dir)
             p = ov_genai.Text2ImagePipeline(str(model_dir))
             tried = []
             def attempt(dev_triplet):
@@ -557,20 +1204,77 @@ def load_t2i_pipeline(model_dir: Path, devices: dict | str, props: dict | None =
             if not ok:
                 p = ov_genai.Text2ImagePipeline(str(model_dir), str(un or te or vd or "CPU"))
             _t2i_cache[key] = p
+            _residency_commit("t2i", key, _t2i_cache, model_dir, res_token)
+        else:
+            _residency.touch("t2i", key)
         return p
     else:
         dev = str(devices or "CPU")
         key = (str(model_dir), dev)
         p = _t2i_cache.get(key)
         if p is None:
+            res_token = _residency_begin(model_dir)
             try:
                 p = ov_genai.Text2ImagePipeline(str(model_dir))
                 p.compile(dev, dev, dev, config=cfg)
             except Exception:
                 p = ov_genai.Text2ImagePipeline(str(model_dir), dev)
             _t2i_cache[key] = p
+            _residency_commit("t2i", key, _t2i_cache, model_dir, res_token)
+        else:
+            _residency.touch("t2i", key)
         return p
 
+def load_t2v_pipeline(model_dir: Path):
+    key = (str(model_dir),)
+    p = _t2v_cache.get(key)
+    if p is None:
+        from modelscope.pipelines import pipeline
+        from modelscope.utils.constant import Tasks
+        res_token = _residency_begin(model_dir)
+        p = pipeline(task=Tasks.text_to_video_synthesis, model=str(model_dir))
+        _t2v_cache[key] = p
+        _residency_commit("t2v", key, _t2v_cache, model_dir, res_token)
+    else:
+        _residency.touch("t2v", key)
+    return p
+
+def embedding_key(model_dir: Path, device: str = "CPU", config: dict | None = None):
+    """(model, device, pooling, normalize, max_length): everything that changes an embedding."""
+    cfg = config or {}
+    max_length = int(cfg["max_length"]) if cfg.get("max_length") else None
+    return (str(model_dir), device, str(cfg.get("pooling") or "cls").upper(), bool(cfg.get("normalize", True)), max_length)
+
+def load_embedding_pipeline(model_dir: Path, device: str = "CPU", config: dict | None = None):
+    """TextEmbeddingPipeline for an exported embedding model, cached and budgeted like the LLMs."""
+    key = embedding_key(model_dir, device, config)
+    _, _, pooling, normalize, max_length = key
+    p = _embed_cache.get(key)
+    if p is not None:
+        _residency.touch("embed", key)
+        return p
+    import openvino_genai as ov_genai
+    import os
+    from pathlib import Path as _P
+    props = {}
+    try:
+        _base = os.environ.get("AIFUNLAND_CACHE_DIR") or str(_P.cwd() / "tmp")
+        _cd = _P(_base) / "ov_cache"
+        _cd.mkdir(parents=True, exist_ok=True)
+        props["CACHE_DIR"] = str(_cd)
+    except Exception:
+        pass
+    ec = ov_genai.TextEmbeddingPipeline.Config()
+    ec.pooling_type = getattr(ov_genai.TextEmbeddingPipeline.PoolingType, pooling, ov_genai.TextEmbeddingPipeline.PoolingType.CLS)
+    ec.normalize = normalize
+    if max_length:
+        ec.max_length = max_length
+    res_token = _residency_begin(model_dir)
+    p = ov_genai.TextEmbeddingPipeline(str(model_dir), device, ec, **props)
+    _embed_cache[key] = p
+    _residency_commit("embed", key, _embed_cache, model_dir, res_token)
+    return p
+
 def t2i_generate(pipe, prompt: str, width: int | None = None, height: int | None = None, steps: int | None = None, guidance_scale: float | None = None):
     kwargs = {}
     if width:
@@ -585,40 +1289,120 @@ def t2i_generate(pipe, prompt: str, width: int | None = None, height: int | None
 
 def is_model_in_use(model_dir: Path) -> bool:
     s = str(model_dir)
-    for (md, _dev), _p in list(_pipe_cache.items()):
-        if md == s:
-            return True
+    for cache in (_pipe_cache, _t2i_cache, _t2v_cache, _embed_cache):
+        for k in list(cache.keys()):
+            if k[0] == s:
+                return True
     return False
 
 def release_model(model_dir: Path):
     s = str(model_dir)
-    for k in list(_pipe_cache.keys()):
-        if k[0] == s:
+    for kind, cache in (("llm", _pipe_cache), ("t2i", _t2i_cache), ("t2v", _t2v_cache), ("embed", _embed_cache)):
+        for k in list(cache.keys()):
+            if k[0] == s:
+                try:
+                    p = cache.pop(k, None)
+                    if p is not None:
+                        _forget_pipe(p)
+                except Exception:
+                    pass
+                _residency.discard(kind, k)
+    for rk in [rk for rk in list(_pipe_alias.keys()) if rk[0] == s]:
+        _pipe_alias.pop(rk, None)
+    with _load_lock:
+        for fk in [fk for fk in _load_last if fk[0] == s]:
+            if fk not in _load_inflight:
+                _load_last.pop(fk, None)
+
+def release_pipeline(pipe):
+    """Drop one cached LLM pipeline, leaving the model's other compiled copies resident."""
+    keys = [k for k, p in list(_pipe_cache.items()) if p is pipe]
+    for k in keys:
+        _pipe_cache.pop(k, None)
+        _residency.discard("llm", k)
+    for rk in [rk for rk, ent in list(_pipe_alias.items()) if ent[0] in keys]:
+        _pipe_alias.pop(rk, None)
+    if keys:
+        _forget_pipe(pipe)
+
+def is_model_loaded(model_dir: Path, device: str) -> bool:
+    s = str(model_dir)
+    return any(k[0] == s and k[1] == device for k in list(_pipe_cache.keys()))
+
+def _apply_generation_config(gen, config: dict, info: dict | None = None):
+    if "max_new_tokens" in config:
+        gen.max_new_tokens = int(config["max_new_tokens"])
+    if "temperature" in config:
+        gen.temperature = float(config["temperature"])
+    if "top_k" in config:
+        gen.top_k = int(config["top_k"])
+    if "top_p" in config:
+        gen.top_p = float(config["top_p"])
+    if "repetition_penalty" in config:
+        gen.repetition_penalty = float(config["repetition_penalty"])
+    if "apply_chat_template" in config:
+        try:
+            gen.apply_chat_template = bool(config["apply_chat_template"])
+        except Exception:
+            pass
+    if info and info.get("speculative"):
+        if config.get("assistant_confidence_threshold"):
+            gen.assistant_confidence_threshold = float(config["assistant_confidence_threshold"])
+            gen.num_assistant_tokens = 0
+        else:
+            gen.num_assistant_tokens = int(config.get("num_assistant_tokens") or 5)
+    elif info and info.get("prompt_lookup"):
+        gen.num_assistant_tokens = int(config.get("num_candidates") or config.get("num_assistant_tokens") or 5)
+        gen.max_ngram_size = int(config.get("max_ngram_size") or 3)
+    return gen
+
+def _perf_metrics(res, info: dict | None = None):
+    metrics = None
+    try:
+        pm = getattr(res, "perf_metrics", None)
+        if pm is not None:
+            metrics = {
+                "generate_ms": float(getattr(pm.get_generate_duration(), "mean", None) or 0.0),
+                "ttft_ms": float(getattr(pm.get_ttft(), "mean", None) or 0.0),
+                "tpot_ms": float(getattr(pm.get_tpot(), "mean", None) or 0.0),
+                "throughput_tps": float(getattr(pm.get_throughput(), "mean", None) or 0.0),
+            }
+    except Exception:
+        metrics = None
+    if info and ("speculative" in info):
+        metrics = metrics or {}
+        if info.get("speculative"):
+            metrics["draft_model"] = info["speculative"]
             try:
-                _pipe_cache[k] = None
+                ext = res.extended_perf_metrics
+                accepted = int(ext.get_num_accepted_tokens())
+                drafted = int(ext.draft_model_metrics.get_num_generated_tokens())
+                metrics["accepted_tokens"] = accepted
+                metrics["draft_tokens"] = drafted
+                metrics["acceptance_rate"] = (float(accepted) / drafted) if drafted else None
             except Exception:
                 pass
+        else:
+            metrics["speculative_fallback"] = info.get("speculative_fallback")
+    if info and ("prompt_lookup" in info):
+        metrics = metrics or {}
+        if info.get("prompt_lookup"):
+            metrics["decode_mode"] = "prompt_lookup"
             try:
-                del _pipe_cache[k]
+                accepted = int(res.extended_perf_metrics.get_num_accepted_tokens())
+                generated = int(res.perf_metrics.get_num_generated_tokens())
+                metrics["accepted_tokens"] = accepted
+                metrics["accepted_ratio"] = (float(accepted) / generated) if generated else None
             except Exception:
                 pass
-
-def is_model_loaded(model_dir: Path, device: str) -> bool:
-    return _pipe_cache.get((str(model_dir), device)) is not None
+        else:
+            metrics["prompt_lookup_fallback"] = info.get("prompt_lookup_fallback")
+    return metrics
 
 def generate(pipe, prompt: str, config: dict):
-    if config:
-        gen = pipe.get_generation_config()
-        if "max_new_tokens" in config:
-            gen.max_new_tokens = int(config["max_new_tokens"])
-        if "temperature" in config:
-            gen.temperature = float(config["temperature"])
-        if "top_k" in config:
-            gen.top_k = int(config["top_k"])
-        if "top_p" in config:
-            gen.top_p = float(config["top_p"])
-        if "repetition_penalty" in config:
-            gen.repetition_penalty = float(config["repetition_penalty"])
+    info = pipeline_info(pipe)
+    if config or info.get("speculative") or info.get("prompt_lookup"):
+        gen = _apply_generation_config(pipe.get_generation_config(), config or {}, info)
         try:
             try:
                 res = pipe.generate(prompt, gen)
@@ -642,43 +1426,12 @@ def generate(pipe, prompt: str, config: dict):
         text = res.text if hasattr(res, "text") else (res[0] if isinstance(res, (list, tuple)) and len(res) > 0 else str(res))
     except Exception:
         text = str(res)
-    metrics = None
-    try:
-        pm = getattr(res, "perf_metrics", None)
-        if pm is not None:
-            metrics = {
-                "generate_ms": float(getattr(pm.get_generate_duration(), "mean", None) or 0.0),
-                "ttft_ms": float(getattr(pm.get_ttft(), "mean", None) or 0.0),
-                "tpot_ms": float(getattr(pm.get_tpot(), "mean", None) or 0.0),
-                "throughput_tps": float(getattr(pm.get_throughput(), "mean", None) or 0.0),
-            }
-    except Exception:
-        metrics = None
-    return text, metrics
-
-
- 
-
-
- 
- 
-
- 
- 
+    return text, _perf_metrics(res, info)
 
 def generate_stream(pipe, prompt: str, config: dict, streamer):
-    if config:
-        gen = pipe.get_generation_config()
-        if "max_new_tokens" in config:
-            gen.max_new_tokens = int(config["max_new_tokens"])
-        if "temperature" in config:
-            gen.temperature = float(config["temperature"])
-        if "top_k" in config:
-            gen.top_k = int(config["top_k"])
-        if "top_p" in config:
-            gen.top_p = float(config["top_p"])
-        if "repetition_penalty" in config:
-            gen.repetition_penalty = float(config["repetition_penalty"])
+    info = pipeline_info(pipe)
+    if config or info.get("speculative") or info.get("prompt_lookup"):
+        gen = _apply_generation_config(pipe.get_generation_config(), config or {}, info)
         try:
             res = pipe.generate(prompt, gen, streamer=streamer)
         except RuntimeError as e:
@@ -704,52 +1457,635 @@ def generate_stream(pipe, prompt: str, config: dict, streamer):
         text = res.text if hasattr(res, "text") else (res[0] if isinstance(res, (list, tuple)) and len(res)>0 else str(res))
     except Exception:
         text = str(res)
-    metrics = None
-    try:
-        pm = getattr(res, "perf_metrics", None)
-        if pm is not None:
-            metrics = {
-                "generate_ms": float(getattr(pm.get_generate_duration(), "mean", None) or 0.0),
-                "ttft_ms": float(getattr(pm.get_ttft(), "mean", None) or 0.0),
-                "tpot_ms": float(getattr(pm.get_tpot(), "mean", None) or 0.0),
-                "throughput_tps": float(getattr(pm.get_throughput(), "mean", None) or 0.0),
+    return text, _perf_metrics(res, info)
+
+# Request scheduling. ContinuousBatchingPipeline instances get a _BatchEngine
+# that admits queued requests into the running batch on every step(); any other
+# pipeline is shared through a FIFO gate so callers are served in arrival order.
+
+_pipe_meta = {}
+
+def _set_pipe_meta(pipe, **kw):
+    ent = _pipe_meta.get(id(pipe))
+    if ent is None or ent[0] is not pipe:
+        ent = (pipe, {})
+        _pipe_meta[id(pipe)] = ent
+    ent[1].update(kw)
+
+def pipeline_info(pipe) -> dict:
+    ent = _pipe_meta.get(id(pipe))
+    if ent is None or ent[0] is not pipe:
+        return {}
+    return dict(ent[1])
+
+def _is_cb_pipeline(pipe) -> bool:
+    return type(pipe).__name__ == "ContinuousBatchingPipeline"
+
+def _stream_wants_stop(ret) -> bool:
+    if ret is None:
+        return False
+    if isinstance(ret, bool):
+        return ret
+    name = str(getattr(ret, "name", ret)).upper()
+    return ("STOP" in name) or ("CANCEL" in name)
+
+class _FairGate:
+    def __init__(self, label=None):
+        self.label = label or {}
+        self._cv = threading.Condition()
+        self._next = 0
+        self._serving = 0
+        self._busy = False
+
+    def __enter__(self):
+        with self._cv:
+            ticket = self._next
+            self._next += 1
+            while ticket != self._serving or self._busy:
+                self._cv.wait()
+            self._busy = True
+        return self
+
+    def __exit__(self, *exc):
+        with self._cv:
+            self._busy = False
+            self._serving += 1
+            self._cv.notify_all()
+        return False
+
+    def stats(self):
+        with self._cv:
+            active = 1 if self._busy else 0
+            return {
+                **self.label,
+                "kind": "serial",
+                "queue_depth": max(0, self._next - self._serving - active),
+                "active": active,
+                "max_batch": 1,
+                "occupancy": float(active),
             }
-    except Exception:
-        metrics = None
-    return text, metrics
 
-def web_search(query: str, max_results: int = 5):
-    items = []
+class _BatchEngine:
+    def __init__(self, pipe, max_seqs: int, label=None):
+        self.pipe = pipe
+        self.max_seqs = max(1, int(max_seqs))
+        self.seq_cap = self.max_seqs
+        self.label = label or {}
+        self._cv = threading.Condition()
+        self._pending = deque()
+        self._active = {}
+        self._ids = itertools.count()
+        self._steps = 0
+        self._batch_sum = 0
+        self._closed = False
+        try:
+            self._tok = pipe.get_tokenizer()
+        except Exception:
+            self._tok = None
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, config: dict, streamer=None):
+        req = self._enqueue(prompt, config, streamer)
+        text = None
+        if streamer is not None:
+            # streamer callbacks run on the caller's thread, so a slow consumer
+            # never holds up the step loop shared by the whole batch
+            sent = []
+            while True:
+                piece = req["pieces"].get()
+                if piece is None:
+                    break
+                if req["stop"]:
+                    continue
+                sent.append(piece)
+                try:
+                    req["stop"] = _stream_wants_stop(streamer(piece))
+                except Exception as e:
+                    req["stop"] = True
+                    req["stream_error"] = str(e)
+            if req["stop"]:
+                text = "".join(sent)
+        req["done"].wait()
+        if req["error"] or req.get("stream_error"):
+            raise RuntimeError(req["error"] or req["stream_error"])
+        return (req["text"] if text is None else text), req["metrics"]
+
+    def submit_many(self, prompts: list, config: dict):
+        """Queue all prompts at once and wait; returns [(text, metrics, error)] in input order."""
+        reqs = [self._enqueue(p, config, None) for p in prompts]
+        for r in reqs:
+            r["done"].wait()
+        return [(r["text"], r["metrics"], r["error"]) for r in reqs]
+
+    def _enqueue(self, prompt: str, config: dict, streamer=None):
+        req = {
+            "prompt": prompt,
+            "config": config or {},
+            "streamer": streamer,
+            "pieces": queue.SimpleQueue() if streamer is not None else None,
+            "stop": False,
+            "done": threading.Event(),
+            "ids": [],
+            "text": "",
+            "dec_prefix": 0,
+            "dec_read": 0,
+            "error": None,
+            "metrics": None,
+            "t_submit": time.perf_counter(),
+            "t_admit": None,
+            "t_first": None,
+        }
+        with self._cv:
+            self._pending.append(req)
+            self._cv.notify()
+        return req
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+    def stats(self):
+        with self._cv:
+            active = len(self._active)
+            return {
+                **self.label,
+                "kind": "continuous_batching",
+                "queue_depth": len(self._pending),
+                "active": active,
+                "max_batch": self.max_seqs,
+                "occupancy": float(active) / float(self.max_seqs),
+                "avg_batch": (float(self._batch_sum) / self._steps) if self._steps else None,
+                "steps": self._steps,
+            }
+
+    def _admit(self, req):
+        rid = next(self._ids)
+        try:
+            gen = _apply_generation_config(self.pipe.get_config(), req["config"])
+            req["handle"] = self.pipe.add_request(rid, req["prompt"], gen)
+            req["t_admit"] = time.perf_counter()
+            req["batch_size"] = len(self._active) + 1
+            self._active[rid] = req
+        except Exception as e:
+            self._finish(req, error=str(e))
+
+    def _decode(self, req, final=False):
+        """Text of the tokens read since the last call.
+
+        Only ids[dec_prefix:] are decoded; the already-emitted tokens in
+        ids[dec_prefix:dec_read] give the tokenizer the context it needs for
+        leading spaces, so each step costs O(new tokens), not O(sequence).
+        """
+        if self._tok is None:
+            return ""
+        ids = req["ids"]
+        prefix, read = req["dec_prefix"], req["dec_read"]
+        if len(ids) == read:
+            return ""
+        try:
+            before = self._tok.decode(ids[prefix:read]) if read > prefix else ""
+            text = self._tok.decode(ids[prefix:])
+        except Exception:
+            return ""
+        # hold back incomplete multi-byte sequences until the next token arrives
+        if (not final) and (text.endswith("�") or len(text) <= len(before)):
+            return ""
+        piece = text[len(before):]
+        req["dec_prefix"], req["dec_read"] = read, len(ids)
+        req["text"] += piece
+        return piece
+
+    def _emit(self, req, piece):
+        if piece and req["pieces"] is not None and not req["stop"]:
+            req["pieces"].put(piece)
+
+    def _drain(self, rid, req):
+        h = req["handle"]
+        stop = False
+        try:
+            while h.can_read():
+                for out in h.read().values():
+                    ids = list(getattr(out, "generated_ids", []) or [])
+                    if ids and req["t_first"] is None:
+                        req["t_first"] = time.perf_counter()
+                    req["ids"].extend(ids)
+            self._emit(req, self._decode(req))
+            stop = req["stop"]
+            status = str(h.get_status()).upper()
+        except Exception as e:
+            self._active.pop(rid, None)
+            self._finish(req, error=str(e))
+            return
+        if stop:
+            try:
+                h.drop()
+            except Exception:
+                pass
+        if stop or ("RUNNING" not in status):
+            self._active.pop(rid, None)
+            self._emit(req, self._decode(req, final=True))
+            self._finish(req)
+
+    def _finish(self, req, error=None):
+        t_end = time.perf_counter()
+        if error:
+            if "bad allocation" in error:
+                error = "Memory allocation failed (bad allocation)."
+            req["error"] = error
+        else:
+            n = len(req["ids"])
+            t_admit = req["t_admit"] or req["t_submit"]
+            gen_ms = (t_end - t_admit) * 1000.0
+            ttft_ms = ((req["t_first"] or t_end) - t_admit) * 1000.0
+            req["metrics"] = {
+                "generate_ms": gen_ms,
+                "ttft_ms": ttft_ms,
+                "tpot_ms": ((gen_ms - ttft_ms) / (n - 1)) if n > 1 else 0.0,
+                "throughput_tps": (n / (gen_ms / 1000.0)) if gen_ms > 0 else 0.0,
+                "queue_ms": (t_admit - req["t_submit"]) * 1000.0,
+                "batch_size": req.get("batch_size", 1),
+            }
+        if req["pieces"] is not None:
+            req["pieces"].put(None)
+        req["done"].set()
+
+    def _loop(self):
+        while True:
+            with self._cv:
+                while not self._pending and not self._active and not self._closed:
+                    self._cv.wait()
+                if self._closed and not self._pending and not self._active:
+                    self.pipe = None
+                    return
+                admit = []
+                while self._pending and (len(self._active) + len(admit)) < self.max_seqs:
+                    admit.append(self._pending.popleft())
+            for req in admit:
+                self._admit(req)
+            if not self._active:
+                continue
+            try:
+                self.pipe.step()
+            except Exception as e:
+                with self._cv:
+                    failed = list(self._active.values())
+                    self._active.clear()
+                for req in failed:
+                    self._finish(req, error=str(e))
+                continue
+            with self._cv:
+                self._steps += 1
+                self._batch_sum += len(self._active)
+                items = list(self._active.items())
+            for rid, req in items:
+                self._drain(rid, req)
+
+_sched_lock = threading.Lock()
+_schedulers = {}
+
+def _pipe_label(pipe):
+    for k, v in list(_pipe_cache.items()):
+        if v is pipe:
+            return {"model": Path(k[0]).name, "device": k[1]}
+    return {}
+
+def _scheduler_for(pipe):
+    with _sched_lock:
+        ent = _schedulers.get(id(pipe))
+        if ent is None or ent[0] is not pipe:
+            label = _pipe_label(pipe)
+            if _is_cb_pipeline(pipe):
+                sched = _BatchEngine(pipe, _CB_DEFAULT_MAX_SEQS, label)
+            else:
+                sched = _FairGate(label)
+            ent = (pipe, sched)
+            _schedulers[id(pipe)] = ent
+        return ent[1]
+
+def _drop_scheduler(pipe):
+    with _sched_lock:
+        ent = _schedulers.get(id(pipe))
+        if ent is not None and ent[0] is pipe:
+            del _schedulers[id(pipe)]
+            if isinstance(ent[1], _BatchEngine):
+                ent[1].close()
+
+def _forget_pipe(pipe):
+    _drop_scheduler(pipe)
+    _chat_owner.pop(id(pipe), None)
+    ent = _pipe_meta.get(id(pipe))
+    if ent is not None and ent[0] is pipe:
+        del _pipe_meta[id(pipe)]
+
+def submit_generation(pipe, prompt: str, config: dict, streamer=None):
+    if getattr(pipe, "_af_remote", False):
+        # the pipeline lives in a worker process, which runs its own scheduler
+        return pipe.submit(prompt, config, streamer)
+    sched = _scheduler_for(pipe)
+    if isinstance(sched, _BatchEngine):
+        return sched.submit(prompt, config, streamer)
+    with sched:
+        # a plain request must not land in (or inherit) a session's chat history
+        _release_chat(pipe)
+        if streamer is None:
+            return generate(pipe, prompt, config)
+        return generate_stream(pipe, prompt, config, streamer)
+
+def generate_batch(pipe, prompts: list, config: dict | None = None):
+    """Generate for a list of prompts in one batch.
+
+    Returns ([(text, error)], metrics) in input order. Continuous-batching
+    pipelines get every prompt queued on their engine at once; other
+    pipelines take one `generate([...])` call under their gate.
+    """
+    config = config or {}
+    sched = _scheduler_for(pipe)
+    t0 = time.perf_counter()
+    if isinstance(sched, _BatchEngine):
+        outs = [(text, err) for text, _, err in sched.submit_many(list(prompts), config)]
+    else:
+        with sched:
+            _release_chat(pipe)
+            try:
+                gen = _apply_generation_config(pipe.get_generation_config(), config, pipeline_info(pipe))
+                res = pipe.generate(list(prompts), gen)
+                texts = list(getattr(res, "texts", None) or [])
+                if len(texts) != len(prompts):
+                    raise RuntimeError("batch_size_mismatch")
+                outs = [(t, None) for t in texts]
+            except Exception:
+                # retry row by row so one bad prompt does not fail the batch
+                outs = []
+                for p in prompts:
+                    try:
+                        outs.append((generate(pipe, p, config)[0], None))
+                    except Exception as e:
+                        outs.append(("", str(e)))
+    ms = (time.perf_counter() - t0) * 1000.0
+    return outs, {"batch_ms": ms, "batch_size": len(prompts), "prompts_per_s": (len(prompts) / (ms / 1000.0)) if ms > 0 else None}
+
+def scheduler_stats():
+    with _sched_lock:
+        scheds = [ent[1] for ent in _schedulers.values()]
+    rows = []
+    for s in scheds:
+        try:
+            rows.append(s.stats())
+        except Exception:
+            pass
+    return {
+        "queue_depth": sum(r.get("queue_depth", 0) for r in rows),
+        "active": sum(r.get("active", 0) for r in rows),
+        "engines": rows,
+    }
+
+# Server-side chat sessions. On an LLMPipeline the session that last ran owns
+# the pipeline's chat state (start_chat/finish_chat), so its next turn only
+# prefills the new message; switching sessions replays the history once. On a
+# ContinuousBatchingPipeline the templated history is resubmitted and prefix
+# caching in the scheduler skips the already-computed prefix.
+
+_session_lock = threading.Lock()
+_chat_sessions = OrderedDict()
+_chat_owner = {}
+
+def _session_limits():
+    import os
     try:
-        from duckduckgo_search import DDGS
-        with DDGS() as ddgs:
-            for r in ddgs.text(query, max_results=max_results):
-                items.append({
-                    "title": r.get("title"),
-                    "url": r.get("href") or r.get("url"),
-                    "snippet": r.get("body")
-                })
-    except Exception:
+        max_n = int(os.environ.get("AIFUNLAND_MAX_SESSIONS") or 32)
+    except ValueError:
+        max_n = 32
+    try:
+        idle_s = float(os.environ.get("AIFUNLAND_SESSION_IDLE_S") or 1800)
+    except ValueError:
+        idle_s = 1800.0
+    return max(1, max_n), idle_s
+
+def _evict_sessions_locked(reserve: int = 0):
+    max_n, idle_s = _session_limits()
+    now = time.time()
+    for sid in [k for k, v in _chat_sessions.items() if now - v["last_used"] > idle_s]:
+        _chat_sessions.pop(sid, None)
+    while _chat_sessions and len(_chat_sessions) + reserve > max_n:
+        _chat_sessions.popitem(last=False)
+
+def create_chat_session(model_dir: Path, device: str, system: str | None = None):
+    import uuid
+    sid = uuid.uuid4().hex
+    now = time.time()
+    sess = {
+        "id": sid,
+        "model_dir": str(model_dir),
+        "device": device,
+        "system": system or "",
+        "history": [],
+        "created": now,
+        "last_used": now,
+        "turns": 0,
+        "gate": _FairGate(),
+    }
+    with _session_lock:
+        _evict_sessions_locked(reserve=1)
+        _chat_sessions[sid] = sess
+    return sess
+
+def get_chat_session(session_id: str):
+    with _session_lock:
+        _evict_sessions_locked()
+        sess = _chat_sessions.get(session_id)
+        if sess is not None:
+            sess["last_used"] = time.time()
+            _chat_sessions.move_to_end(session_id)
+        return sess
+
+def delete_chat_session(session_id: str) -> bool:
+    with _session_lock:
+        return _chat_sessions.pop(session_id, None) is not None
+
+def session_stats():
+    max_n, idle_s = _session_limits()
+    with _session_lock:
+        return {"count": len(_chat_sessions), "max_sessions": max_n, "idle_timeout_s": idle_s}
+
+def _flatten_history(system: str, history: list, prompt: str) -> str:
+    lines = [system] if system else []
+    for m in history:
+        lines.append(("User: " if m["role"] == "user" else "Assistant: ") + m["content"])
+    lines.append("User: " + prompt)
+    return "\n".join(lines)
+
+def _release_chat(pipe):
+    ent = _chat_owner.pop(id(pipe), None)
+    if ent is not None and ent[0] is pipe:
         try:
-            from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
-            w = DuckDuckGoSearchAPIWrapper()
-            for r in w.results(query, max_results=max_results):
-                items.append({
-                    "title": r.get("title"),
-                    "url": r.get("link"),
-                    "snippet": r.get("snippet") or r.get("body")
-                })
+            pipe.finish_chat()
         except Exception:
-            items = []
-    return items
+            pass
+
+def _templated_history(pipe, sess: dict, prompt: str, system: str | None = None) -> str:
+    system = sess["system"] if system is None else system
+    msgs = ([{"role": "system", "content": system}] if system else []) + list(sess["history"]) + [{"role": "user", "content": prompt}]
+    try:
+        return pipe.get_tokenizer().apply_chat_template(msgs, add_generation_prompt=True)
+    except Exception:
+        return None
+
+def _summary_pipeline(exclude=None):
+    import os
+    want = (os.environ.get("AIFUNLAND_SUMMARY_MODEL") or "").replace("/", "__")
+    with _residency._lock:
+        ents = [dict(e) for e in _residency._entries.values() if e["kind"] == "llm"]
+    best = None
+    for e in ents:
+        p = _pipe_cache.get(e["key"])
+        if p is None or p is exclude:
+            continue
+        if want and want not in Path(e["model_dir"]).name:
+            continue
+        if best is None or e["bytes"] < best[0]:
+            best = (e["bytes"], p)
+    return best[1] if best else None
+
+def context_summarizer(pipe):
+    """Summary callable backed by the smallest other resident LLM, or None."""
+    small = _summary_pipeline(exclude=pipe)
+    if small is None:
+        return None
+    def _run(text):
+        from backend.services.admission import run_admitted
+        # background summaries queue behind user requests
+        out, _ = run_admitted("maintenance", submit_generation, small, summary_prompt(text), {"max_new_tokens": 160, "temperature": 0.0})
+        s = str(out or "")
+        k = s.lower().find("</think>")
+        return s[k + 8:].strip() if k != -1 else s.strip()
+    return _run
+
+def _fit_session(sess: dict, pipe, prompt: str, config: dict):
+    """Trim the session history to the context budget; True when the chat state must be rebuilt."""
+    rebuild = False
+    pend = sess.get("summary_key")
+    if pend:
+        ready = summarizer.get_by_key(pend)
+        if ready:
+            sess["summary"] = ready
+            sess.pop("summary_key", None)
+            rebuild = True
+    hist, summary, info = fit_history(sess["system"], sess["history"], prompt, config, counter_for(pipe),
+                                      context_summarizer(pipe), prior_summary=sess.get("summary"))
+    key = info.pop("summary_key", None)
+    if info["dropped_turns"]:
+        with _session_lock:
+            # persist the trim so following turns stay incremental
+            sess["history"] = hist
+            if summary:
+                sess["summary"] = summary
+            if key:
+                sess["summary_key"] = key
+        rebuild = True
+    sess["context"] = info
+    return rebuild
 
-def augment_with_sources(prompt: str, sources: list[dict], lang: str = "zh"):
+def _session_system(sess: dict) -> str:
+    if not sess.get("summary"):
+        return sess["system"]
+    return ((sess["system"] + "\n") if sess["system"] else "") + summary_line(sess["summary"])
+
+def _record_turn(sess: dict, prompt: str, text):
+    answer = str(text or "")
+    k = answer.lower().find("</think>")
+    if k != -1:
+        answer = answer[k + 8:].strip()
+    with _session_lock:
+        sess["history"].append({"role": "user", "content": prompt})
+        sess["history"].append({"role": "assistant", "content": answer})
+        sess["turns"] += 1
+        sess["last_used"] = time.time()
+
+def session_generate(sess: dict, pipe, prompt: str, config: dict, streamer=None):
+    config = dict(config or {})
+    sched = _scheduler_for(pipe)
+    # history is trimmed, read and extended under a gate, so concurrent turns
+    # on one session run one after another instead of interleaving
+    if isinstance(sched, _BatchEngine):
+        with sess["gate"]:
+            _fit_session(sess, pipe, prompt, config)
+            system = _session_system(sess)
+            full = _templated_history(pipe, sess, prompt, system)
+            if full is not None:
+                config["apply_chat_template"] = False
+            else:
+                full = _flatten_history(system, sess["history"], prompt)
+            text, metrics = sched.submit(full, config, streamer)
+            mode = "prefix_cache"
+            _record_turn(sess, prompt, text)
+            turn = sess["turns"]
+    else:
+        with sched:
+            rebuild = _fit_session(sess, pipe, prompt, config)
+            system = _session_system(sess)
+            ent = _chat_owner.get(id(pipe))
+            owned = ent is not None and ent[0] is pipe and ent[1] == sess["id"] and ent[2] == sess["turns"] and not rebuild
+            if owned:
+                msg = prompt
+                mode = "incremental"
+            else:
+                _release_chat(pipe)
+                try:
+                    pipe.start_chat(system)
+                except TypeError:
+                    pipe.start_chat()
+                msg = _flatten_history("", sess["history"], prompt) if sess["history"] else prompt
+                mode = "full"
+            try:
+                if streamer is None:
+                    text, metrics = generate(pipe, msg, config)
+                else:
+                    text, metrics = generate_stream(pipe, msg, config, streamer)
+            except Exception:
+                _chat_owner.pop(id(pipe), None)
+                try:
+                    pipe.finish_chat()
+                except Exception:
+                    pass
+                raise
+            _chat_owner[id(pipe)] = (pipe, sess["id"], sess["turns"] + 1)
+            _record_turn(sess, prompt, text)
+            turn = sess["turns"]
+    metrics = dict(metrics or {})
+    metrics["prefill_mode"] = mode
+    metrics["session_turn"] = turn
+    metrics["context"] = sess.get("context")
+    return text, metrics
+
+def web_search(query: str, max_results: int = 5):
+    from backend.services.search import search_stage
+    return search_stage.search(query, max_results)
+
+def augment_with_sources(prompt: str, sources: list[dict], lang: str = "zh", origin: str = "web", query: str | None = None, budget: int | None = None, count=None, info: dict | None = None, kept: list | None = None):
+    """With a token budget the sources are deduplicated and packed by compress_sources(); its report lands in `info`.
+
+    `kept` receives the sources placed in the prompt, in their [n] order. When
+    the budget leaves nothing, the prompt is returned unchanged.
+    """
+    if budget is not None:
+        from backend.services.sources import compress_sources
+        sources, rep = compress_sources(sources, query or prompt, budget, count)
+        if info is not None:
+            info.update(rep)
+        if not sources:
+            return prompt
+    else:
+        sources = sources[:5]
+    if kept is not None:
+        kept.extend(sources)
     lines = []
     if lang == "zh":
-        lines.append("请基于以下网络检索资料进行分析并回答：")
+        lines.append("请基于以下本地知识库资料进行分析并回答：" if origin == "local" else "请基于以下网络检索资料进行分析并回答：")
     else:
-        lines.append("Please analyze and answer using the following web sources:")
-    for i, s in enumerate(sources[:5], 1):
+        lines.append("Please analyze and answer using the following local documents:" if origin == "local" else "Please analyze and answer using the following web sources:")
+    for i, s in enumerate(sources, 1):
         t = str(s.get("title") or "")
         u = str(s.get("url") or "")
         sn = str(s.get("snippet") or "")
@@ -11,10 +11,10 @@ RECOMMENDED_MODELS = {
     "chat": [
         {"id": "qwen/Qwen2.5-0.5B-Instruct", "name": "Qwen2.5-0.5B-Instruct", "desc": "通义千问超轻量级指令微调模型，适合低显存设备 (0.5B)"},
         {"id": "qwen/Qwen2.5-1.5B-Instruct", "name": "Qwen2.5-1.5B-Instruct", "desc": "通义千问轻量级模型，平衡性能与速度 (1.5B)"},
-        {"id": "qwen/Qwen2.5-3B-Instruct", "name": "Qwen2.5-3B-Instruct", "desc": "通义千问中等规模模型，逻辑推理能力强 (3B)"},
-        {"id": "qwen/Qwen2.5-7B-Instruct", "name": "Qwen2.5-7B-Instruct", "desc": "通义千问标准版，通用能力优秀 (7B)"},
+        {"id": "qwen/Qwen2.5-3B-Instruct", "name": "Qwen2.5-3B-Instruct", "desc": "通义千问中等规模模型，逻辑推理能力强 (3B)", "draft": "qwen/Qwen2.5-0.5B-Instruct"},
+        {"id": "qwen/Qwen2.5-7B-Instruct", "name": "Qwen2.5-7B-Instruct", "desc": "通义千问标准版，通用能力优秀 (7B)", "draft": "qwen/Qwen2.5-0.5B-Instruct"},
         {"id": "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B", "name": "DeepSeek-R1-Distill-Qwen-1.5B", "desc": "DeepSeek R1 蒸馏版，极高性价比的推理模型 (1.5B)"},
-        {"id": "deepseek-ai/DeepSeek-R1-Distill-Qwen-7B", "name": "DeepSeek-R1-Distill-Qwen-7B", "desc": "DeepSeek R1 蒸馏版，强大的思维链能力 (7B)"},
+        {"id": "deepseek-ai/DeepSeek-R1-Distill-Qwen-7B", "name": "DeepSeek-R1-Distill-Qwen-7B", "desc": "DeepSeek R1 蒸馏版，强大的思维链能力 (7B)", "draft": "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B"},
         {"id": "ZhipuAI/glm-4-9b-chat", "name": "GLM-4-9B-Chat", "desc": "智谱AI第四代开源模型，对话流畅 (9B)"},
     ],
     "t2i": [
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+# generation settings that change the text a model produces
+_GEN_KEYS = ("max_new_tokens", "temperature", "top_k", "top_p", "repetition_penalty", "apply_chat_template", "do_sample", "seed")
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+def normalize_prompt(prompt: str) -> str:
+    s = unicodedata.normalize("NFKC", str(prompt or ""))
+    return " ".join(s.split())
+
+def is_cacheable(config: dict | None) -> bool:
+    cfg = config or {}
+    flag = cfg.get("cache")
+    if flag is not None:
+        return bool(flag)
+    # without an explicit temperature the model's own generation_config may sample
+    if cfg.get("do_sample") or "temperature" not in cfg:
+        return False
+    try:
+        return float(cfg["temperature"]) == 0.0
+    except Exception:
+        return False
+
+def _gen_fingerprint(config: dict | None) -> str:
+    cfg = config or {}
+    eff = {k: cfg[k] for k in _GEN_KEYS if k in cfg}
+    return hashlib.sha1(json.dumps(eff, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+_PRUNE_EVERY = 64
+
+_NUM_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+def _numbers(text: str) -> tuple:
+    """Numbers in a prompt; embeddings barely move when one digit changes, the answer does."""
+    return tuple(_NUM_RE.findall(text))
+
+class ResponseCache:
+    """LRU + TTL cache of finished generations, with optional disk and similarity tiers."""
+
+    def __init__(self, max_entries: int | None = None, ttl_s: float | None = None, disk_dir: Path | None = None, max_disk_entries: int | None = None):
+        self._lock = threading.RLock()
+        self._mem = OrderedDict()
+        self.max_entries = int(max_entries if max_entries is not None else _env_float("AIFUNLAND_RESPONSE_CACHE_SIZE", 256))
+        self.ttl_s = float(ttl_s if ttl_s is not None else _env_float("AIFUNLAND_RESPONSE_CACHE_TTL_S", 3600))
+        self.disk_dir = disk_dir
+        self.max_disk_entries = int(max_disk_entries if max_disk_entries is not None else _env_float("AIFUNLAND_RESPONSE_CACHE_DISK_MAX", 4096))
+        self._disk_puts = 0
+        self._pruning = False
+        self.embedder = None
+        self.sim_threshold = _env_float("AIFUNLAND_RESPONSE_CACHE_SIM", 0.95)
+        self._vecs = OrderedDict()
+        self.counters = {"hits_memory": 0, "hits_disk": 0, "hits_semantic": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "disk_pruned": 0}
+
+    def key(self, model_id: str, prompt: str, config: dict | None) -> str:
+        raw = json.dumps([str(model_id), _gen_fingerprint(config), normalize_prompt(prompt)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def set_embedder(self, fn, threshold: float | None = None):
+        """fn(list[str]) -> 2D array from an embedding model; None disables the similarity tier."""
+        with self._lock:
+            self.embedder = fn
+            self._vecs.clear()
+            if threshold is not None:
+                self.sim_threshold = float(threshold)
+
+    def lookup(self, model_id: str, prompt: str, config: dict | None):
+        if not is_cacheable(config):
+            return None
+        k = self.key(model_id, prompt, config)
+        now = time.time()
+        with self._lock:
+            ent = self._mem.get(k)
+            if ent is not None:
+                if now - ent["t"] <= self.ttl_s:
+                    self._mem.move_to_end(k)
+                    self.counters["hits_memory"] += 1
+                    return self._hit(ent, "memory", now)
+                self._drop(k)
+                self.counters["expired"] += 1
+        ent = self._disk_get(k, now)
+        if ent is not None:
+            with self._lock:
+                self._put_mem(k, ent)
+                self.counters["hits_disk"] += 1
+            return self._hit(ent, "disk", now)
+        ent = self._similar(model_id, prompt, config, now)
+        if ent is not None:
+            return ent
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def store(self, model_id: str, prompt: str, config: dict | None, text: str, metrics: dict | None = None):
+        if not is_cacheable(config) or text is None:
+            return
+        k = self.key(model_id, prompt, config)
+        ent = {"t": time.time(), "text": str(text), "metrics": metrics or {}, "model": str(model_id), "gen": _gen_fingerprint(config)}
+        with self._lock:
+            self._put_mem(k, ent)
+            self.counters["stores"] += 1
+        self._disk_put(k, ent)
+        if self.embedder is not None:
+            try:
+                norm = normalize_prompt(prompt)
+                v = self._embed(norm)
+                with self._lock:
+                    self._vecs[k] = ((ent["model"], ent["gen"]), v, _numbers(norm))
+                    while len(self._vecs) > self.max_entries:
+                        self._vecs.popitem(last=False)
+            except Exception:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            self._vecs.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self.counters["hits_memory"] + self.counters["hits_disk"] + self.counters["hits_semantic"]
+            total = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._mem),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hit_rate": (hits / total) if total else None,
+                "disk": str(self.disk_dir) if self.disk_dir else None,
+                "max_disk_entries": self.max_disk_entries,
+                "semantic": self.embedder is not None,
+            }
+
+    def _hit(self, ent, tier, now):
+        return {"text": ent["text"], "metrics": dict(ent.get("metrics") or {}), "tier": tier, "age_s": round(now - ent["t"], 1)}
+
+    def _put_mem(self, k, ent):
+        self._mem[k] = ent
+        self._mem.move_to_end(k)
+        while len(self._mem) > self.max_entries:
+            old, _ = self._mem.popitem(last=False)
+            self._vecs.pop(old, None)
+            self.counters["evictions"] += 1
+
+    def _drop(self, k):
+        self._mem.pop(k, None)
+        self._vecs.pop(k, None)
+
+    def _disk_path(self, k):
+        return self.disk_dir / k[:2] / (k + ".json")
+
+    def _disk_get(self, k, now):
+        if self.disk_dir is None:
+            return None
+        p = self._disk_path(k)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                ent = json.load(f)
+        except Exception:
+            return None
+        if now - float(ent.get("t", 0)) > self.ttl_s:
+            try:
+                p.unlink()
+            except Exception:
+                pass
+            return None
+        return ent
+
+    def _disk_put(self, k, ent):
+        if self.disk_dir is None:
+            return
+        p = self._disk_path(k)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(ent, f, ensure_ascii=False)
+            os.replace(tmp, p)
+        except Exception:
+            return
+        with self._lock:
+            self._disk_puts += 1
+            # on the first store (leftovers from earlier runs) and every _PRUNE_EVERY stores after
+            due = self._disk_puts % _PRUNE_EVERY == 1 and not self._pruning
+            if due:
+                self._pruning = True
+        if due:
+            threading.Thread(target=self.prune_disk, daemon=True).start()
+
+    def prune_disk(self) -> int:
+        """Delete expired disk entries, then the oldest beyond max_disk_entries; returns how many went."""
+        removed = 0
+        try:
+            now = time.time()
+            files = []
+            for p in self.disk_dir.glob("*/*.json"):
+                try:
+                    files.append((p.stat().st_mtime, p))
+                except OSError:
+                    pass
+            files.sort()
+            live = [p for mt, p in files if now - mt <= self.ttl_s]
+            drop = [p for mt, p in files if now - mt > self.ttl_s] + live[:max(0, len(live) - self.max_disk_entries)]
+            for p in drop:
+                try:
+                    p.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+            with self._lock:
+                self.counters["disk_pruned"] += removed
+        finally:
+            with self._lock:
+                self._pruning = False
+        return removed
+
+    def _embed(self, text):
+        import numpy as np
+        v = np.asarray(self.embedder([text])[0], dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    def _similar(self, model_id, prompt, config, now):
+        if self.embedder is None:
+            return None
+        import numpy as np
+        scope = (str(model_id), _gen_fingerprint(config))
+        norm = normalize_prompt(prompt)
+        try:
+            q = self._embed(norm)
+        except Exception:
+            return None
+        # a near-duplicate must still ask about the same numbers
+        nums = _numbers(norm)
+        with self._lock:
+            cands = [(k, v) for k, (sc, v, n) in self._vecs.items() if sc == scope and n == nums]
+            if not cands:
+                return None
+            sims = np.stack([v for _, v in cands]) @ q
+            i = int(np.argmax(sims))
+            if float(sims[i]) < self.sim_threshold:
+                return None
+            ent = self._mem.get(cands[i][0])
+            if ent is None or now - ent["t"] > self.ttl_s:
+                return None
+            self._mem.move_to_end(cands[i][0])
+            self.counters["hits_semantic"] += 1
+            hit = self._hit(ent, "semantic", now)
+        hit["similarity"] = round(float(sims[i]), 4)
+        return hit
+
+def _default_cache():
+    c = ResponseCache()
+    if os.environ.get("AIFUNLAND_RESPONSE_CACHE_DISK", "0") == "1":
+        base = os.environ.get("AIFUNLAND_CACHE_DIR") or str(Path.cwd() / "tmp")
+        c.disk_dir = Path(base) / "response_cache"
+    # the similarity tier needs a real embedding model; the app installs it (AIFUNLAND_EMBED_MODEL)
+    return c
+
+response_cache = _default_cache()
+
+def replay_pieces(text: str, size: int = 32):
+    """Split cached text into pieces of `size` characters for SSE replay.
+
+    Counted in characters rather than words so CJK text, which has no spaces,
+    still replays as a stream of frames.
+    """
+    size = max(1, int(size))
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
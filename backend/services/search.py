@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from backend.services.response_cache import normalize_prompt
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+def ddgs_provider(query: str, max_results: int):
+    from duckduckgo_search import DDGS
+    items = []
+    with DDGS() as ddgs:
+        for r in ddgs.text(query, max_results=max_results):
+            items.append({"title": r.get("title"), "url": r.get("href") or r.get("url"), "snippet": r.get("body")})
+    return items
+
+def langchain_ddg_provider(query: str, max_results: int):
+    from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
+    w = DuckDuckGoSearchAPIWrapper()
+    return [{"title": r.get("title"), "url": r.get("link"), "snippet": r.get("snippet") or r.get("body")} for r in w.results(query, max_results=max_results)]
+
+def local_provider(query: str, max_results: int):
+    from backend.services.docindex import local_index
+    return local_index().search(query, k=max_results)
+
+BUILTIN_PROVIDERS = {"ddgs": ddgs_provider, "langchain": langchain_ddg_provider, "local": local_provider}
+
+def normalize_query(query: str) -> str:
+    return normalize_prompt(query).lower()
+
+class SearchStage:
+    """Queries every provider at once under a deadline; the first non-empty result set wins and is cached with a TTL."""
+
+    def __init__(self, providers: dict | None = None, deadline_ms: float | None = None, ttl_s: float | None = None, disk_dir: Path | None = None, max_entries: int = 512):
+        self._lock = threading.Lock()
+        self.providers = OrderedDict(providers or {})
+        self.deadline_ms = float(deadline_ms if deadline_ms is not None else _env_float("AIFUNLAND_SEARCH_DEADLINE_MS", 2500))
+        self.ttl_s = float(ttl_s if ttl_s is not None else _env_float("AIFUNLAND_SEARCH_CACHE_TTL_S", 86400))
+        self.disk_dir = disk_dir
+        self.max_entries = int(max_entries)
+        self._mem = OrderedDict()
+        # workers outlive a missed deadline; a small pool keeps stragglers from piling up
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+        self.counters = {"queries": 0, "hits_memory": 0, "hits_disk": 0, "timeouts": 0, "empty": 0, "errors": 0, "wins": {}}
+        self._lat = []
+
+    def register(self, name: str, fn):
+        """fn(query, max_results) -> list of {"title", "url", "snippet"}; None removes the provider."""
+        with self._lock:
+            if fn is None:
+                self.providers.pop(name, None)
+            else:
+                self.providers[name] = fn
+
+    def key(self, query: str, max_results: int) -> str:
+        # results differ by origin, so the provider set is part of the key
+        with self._lock:
+            provs = sorted(self.providers)
+        return hashlib.sha256(json.dumps([normalize_query(query), int(max_results), provs], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def search(self, query: str, max_results: int = 5, deadline_ms: float | None = None):
+        k = self.key(query, max_results)
+        now = time.time()
+        with self._lock:
+            self.counters["queries"] += 1
+            ent = self._mem.get(k)
+            if ent is not None and now - ent["t"] <= self.ttl_s:
+                self._mem.move_to_end(k)
+                self.counters["hits_memory"] += 1
+                return [dict(x) for x in ent["items"]]
+        ent = self._disk_get(k, now)
+        if ent is not None:
+            with self._lock:
+                self._put_mem(k, ent)
+                self.counters["hits_disk"] += 1
+            return [dict(x) for x in ent["items"]]
+        t0 = time.perf_counter()
+        items, winner = self._race(query, max_results, self.deadline_ms if deadline_ms is None else float(deadline_ms))
+        with self._lock:
+            self._lat.append((time.perf_counter() - t0) * 1000.0)
+            if len(self._lat) > 200:
+                self._lat = self._lat[-200:]
+            if winner:
+                self.counters["wins"][winner] = self.counters["wins"].get(winner, 0) + 1
+        if items:
+            ent = {"t": now, "q": normalize_query(query), "items": items}
+            with self._lock:
+                self._put_mem(k, ent)
+            self._disk_put(k, ent)
+        return items
+
+    def _race(self, query, max_results, deadline_ms):
+        with self._lock:
+            provs = list(self.providers.items())
+        if not provs:
+            return [], None
+        futs = {}
+        for name, fn in provs:
+            futs[self._pool.submit(fn, query, max_results)] = name
+        end = time.monotonic() + max(0.0, deadline_ms) / 1000.0
+        pending = set(futs)
+        while pending:
+            left = end - time.monotonic()
+            if left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    items = _clean(f.result(), max_results)
+                except Exception:
+                    with self._lock:
+                        self.counters["errors"] += 1
+                    continue
+                if items:
+                    for p in pending:
+                        p.cancel()
+                    return items, futs[f]
+        with self._lock:
+            self.counters["timeouts" if pending else "empty"] += 1
+        for p in pending:
+            p.cancel()
+        return [], None
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+
+    def stats(self):
+        with self._lock:
+            lat = sorted(self._lat)
+            return {
+                **self.counters,
+                "wins": dict(self.counters["wins"]),
+                "providers": list(self.providers),
+                "deadline_ms": self.deadline_ms,
+                "ttl_s": self.ttl_s,
+                "entries": len(self._mem),
+                "p50_ms": round(lat[len(lat) // 2], 1) if lat else None,
+                "max_ms": round(lat[-1], 1) if lat else None,
+            }
+
+    def _put_mem(self, k, ent):
+        self._mem[k] = ent
+        self._mem.move_to_end(k)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _disk_path(self, k):
+        return self.disk_dir / k[:2] / (k + ".json")
+
+    def _disk_get(self, k, now):
+        if self.disk_dir is None:
+            return None
+        p = self._disk_path(k)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                ent = json.load(f)
+        except Exception:
+            return None
+        if now - float(ent.get("t", 0)) > self.ttl_s:
+            try:
+                p.unlink()
+            except Exception:
+                pass
+            return None
+        return ent
+
+    def _disk_put(self, k, ent):
+        if self.disk_dir is None:
+            return
+        p = self._disk_path(k)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(ent, f, ensure_ascii=False)
+            os.replace(tmp, p)
+        except Exception:
+            pass
+
+def _clean(items, max_results):
+    out = []
+    for r in items or []:
+        if not isinstance(r, dict) or not (r.get("snippet") or r.get("title")):
+            continue
+        out.append({"title": r.get("title"), "url": r.get("url"), "snippet": r.get("snippet")})
+        if len(out) >= max_results:
+            break
+    return out
+
+def _default_stage():
+    names = [n.strip() for n in os.environ.get("AIFUNLAND_SEARCH_PROVIDERS", "ddgs,langchain").split(",") if n.strip()]
+    base = os.environ.get("AIFUNLAND_CACHE_DIR") or str(Path.cwd() / "tmp")
+    return SearchStage({n: BUILTIN_PROVIDERS[n] for n in names if n in BUILTIN_PROVIDERS}, disk_dir=Path(base) / "search_cache")
+
+search_stage = _default_stage()
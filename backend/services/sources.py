@@ -0,0 +1,127 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from backend.services.context import TokenCounter, context_budget
+from backend.services.docindex import terms
+
+_SENT_RE = re.compile(r"[^。！？!?\n]+?(?:[.!?](?=\s|$)|[。！？]|\n|$)")
+# header, question and instruction lines augment_with_sources wraps around the sources
+_FRAME_TOKENS = 48
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+def split_sentences(text: str) -> list:
+    return [m.group(0).strip() for m in _SENT_RE.finditer(str(text or "")) if m.group(0).strip()]
+
+def _shingles(text: str) -> set:
+    s = " ".join(str(text).lower().split())
+    return {s[i:i + 3] for i in range(max(1, len(s) - 2))}
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def sources_budget(config: dict | None, prompt_tokens: int):
+    """Token budget for the source text: config.sources_budget, else what the context budget leaves after the prompt, capped by AIFUNLAND_SOURCES_BUDGET."""
+    cfg = config or {}
+    if cfg.get("sources_budget") is not None:
+        try:
+            return max(0, int(cfg["sources_budget"]))
+        except Exception:
+            return None
+    cap = int(_env_float("AIFUNLAND_SOURCES_BUDGET", 768))
+    if cap <= 0:
+        return None
+    ctx = context_budget(cfg)
+    if ctx is None:
+        return cap
+    return max(0, min(cap, ctx - int(prompt_tokens) - _FRAME_TOKENS))
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "tokens_in": 0, "tokens_out": 0, "duplicates": 0}
+
+    def add(self, info):
+        with self._lock:
+            self.counters["requests"] += 1
+            self.counters["tokens_in"] += info["tokens_in"]
+            self.counters["tokens_out"] += info["tokens_out"]
+            self.counters["duplicates"] += info["duplicates"]
+
+    def stats(self):
+        with self._lock:
+            c = dict(self.counters)
+        c["tokens_saved"] = c["tokens_in"] - c["tokens_out"]
+        c["saved_ratio"] = (c["tokens_saved"] / c["tokens_in"]) if c["tokens_in"] else None
+        return c
+
+_stats = _Stats()
+
+def source_stats():
+    return _stats.stats()
+
+def compress_sources(sources: list, query: str, budget: int, count=None, dedup: float = 0.8, max_sources: int = 10):
+    """Pack the query-relevant sentences of the sources into `budget` tokens.
+
+    Near-duplicate sentences (3-gram Jaccard >= dedup) are kept once, the
+    ones matching the query are ranked by BM25 and packed greedily; kept
+    sentences stay in source order. Returns (sources, info) where info
+    reports tokens_in/tokens_out/tokens_saved as counted by `count`.
+    """
+    count = count or TokenCounter()
+    srcs = [s for s in (sources or [])[:max_sources] if isinstance(s, dict)]
+    sents, seen = [], []
+    dups = 0
+    for si, s in enumerate(srcs):
+        for j, text in enumerate(split_sentences(s.get("snippet"))):
+            sh = _shingles(text)
+            if any(_jaccard(sh, o) >= dedup for o in seen):
+                dups += 1
+                continue
+            seen.append(sh)
+            sents.append({"src": si, "pos": j, "text": text, "terms": Counter(terms(text)), "tokens": count(text)})
+    heads = [count(f"[{i}] {s.get('title') or ''} \n{s.get('url') or ''} ") for i, s in enumerate(srcs, 1)]
+    tokens_in = sum(heads) + sum(count(str(s.get("snippet") or "")) for s in srcs)
+    # BM25 over sentences as documents
+    n = len(sents)
+    avg = (sum(sum(x["terms"].values()) for x in sents) / n) if n else 1.0
+    df = Counter(t for x in sents for t in x["terms"])
+    qt = set(terms(query))
+    for x in sents:
+        dl = sum(x["terms"].values()) or 1
+        sc = 0.0
+        for t in qt:
+            tf = x["terms"].get(t, 0)
+            if tf:
+                idf = math.log(1.0 + (n - df[t] + 0.5) / (df[t] + 0.5))
+                sc += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * dl / avg))
+        x["score"] = sc
+    # sentences sharing no term with the query only pad the prompt; lead sentences stand in when nothing matches
+    pool = [x for x in sents if x["score"] > 0] or [x for x in sents if x["pos"] == 0]
+    picked, used, opened = [], 0, set()
+    for x in sorted(pool, key=lambda x: (-x["score"], x["src"], x["pos"])):
+        cost = x["tokens"] + (heads[x["src"]] if x["src"] not in opened else 0)
+        if used + cost > budget:
+            continue
+        picked.append(x)
+        used += cost
+        opened.add(x["src"])
+    out = []
+    for si, s in enumerate(srcs):
+        keep = sorted((x for x in picked if x["src"] == si), key=lambda x: x["pos"])
+        if keep:
+            out.append({**s, "snippet": " ".join(x["text"] for x in keep)})
+    tokens_out = sum(heads[i] for i in opened) + sum(x["tokens"] for x in picked)
+    info = {"budget": budget, "tokens_in": tokens_in, "tokens_out": tokens_out, "tokens_saved": max(0, tokens_in - tokens_out),
+            "sentences_in": n + dups, "sentences_kept": len(picked), "duplicates": dups, "sources_kept": len(out)}
+    _stats.add(info)
+    return out, info
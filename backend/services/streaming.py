@@ -0,0 +1,401 @@
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+_totals_lock = threading.Lock()
+_totals = {"streams": 0, "active": 0, "frames": 0, "tokens": 0, "bytes": 0}
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+def flush_window(config: dict | None):
+    cfg = config or {}
+    ms = cfg.get("sse_flush_ms")
+    n = cfg.get("sse_flush_tokens")
+    ms = _env_int("AIFUNLAND_SSE_FLUSH_MS", 30) if ms is None else int(ms)
+    n = _env_int("AIFUNLAND_SSE_FLUSH_TOKENS", 16) if n is None else int(n)
+    return max(0, ms), max(1, n)
+
+class Signal:
+    """threading.Event whose set() can also wake an asyncio loop through on_set() callbacks."""
+
+    def __init__(self):
+        self._ev = threading.Event()
+        self._lock = threading.Lock()
+        self._cbs = []
+
+    def set(self):
+        with self._lock:
+            self._ev.set()
+            cbs, self._cbs = self._cbs, []
+        for cb in cbs:
+            try:
+                cb()
+            except Exception:
+                pass
+
+    def clear(self):
+        self._ev.clear()
+
+    def is_set(self) -> bool:
+        return self._ev.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ev.wait(timeout)
+
+    def on_set(self, cb):
+        """Run cb once on the next set(), or now if already set."""
+        with self._lock:
+            if not self._ev.is_set():
+                self._cbs.append(cb)
+                return
+        cb()
+
+    def remove(self, cb):
+        with self._lock:
+            if cb in self._cbs:
+                self._cbs.remove(cb)
+
+class Park:
+    """Yielded by SSE generators instead of blocking: resume after `signal` is set or `timeout` s passed."""
+
+    __slots__ = ("signal", "timeout")
+
+    def __init__(self, signal: Signal, timeout: float | None = None):
+        self.signal = signal
+        self.timeout = timeout
+
+class ParkingStream:
+    """Response body for generators that yield Park: iterating blocks on each Park (WSGI);
+    the ASGI bridge reads `gen` directly and awaits the signals instead."""
+
+    def __init__(self, gen):
+        self.gen = gen
+
+    def __iter__(self):
+        for item in self.gen:
+            if isinstance(item, Park):
+                item.signal.wait(item.timeout)
+                continue
+            yield item
+
+    def close(self):
+        self.gen.close()
+
+class TokenChannel:
+    """Collects streamer pieces and hands them to the SSE loop in coalesced frames.
+
+    A frame is flushed when `window_ms` has passed since its first piece or when
+    it holds `max_tokens` pieces, whichever comes first; pieces that piled up
+    while the client was being written to go out together. `close()` flushes
+    the rest and ends iteration without polling.
+    """
+
+    def __init__(self, window_ms: int = 30, max_tokens: int = 16):
+        self.window = max(0, int(window_ms)) / 1000.0
+        self.max_tokens = max(1, int(max_tokens))
+        self._cv = threading.Condition()
+        self._items = []
+        self._first = None
+        self._closed = False
+        self._released = False
+        self.signal = Signal()
+        self.tokens = 0
+        self.frames = 0
+        self.bytes = 0
+        with _totals_lock:
+            _totals["streams"] += 1
+            _totals["active"] += 1
+
+    def put(self, text: str, event: str = "token"):
+        with self._cv:
+            if self._closed:
+                return
+            self._items.append((event, text))
+            self.tokens += 1
+            if len(self._items) == 1:
+                self._first = time.perf_counter()
+                self._cv.notify()
+                self.signal.set()
+            elif len(self._items) >= self.max_tokens:
+                self._cv.notify()
+                self.signal.set()
+
+    def close(self):
+        with self._cv:
+            if self._closed:
+                return
+            self._closed = True
+            self._cv.notify()
+            self.signal.set()
+
+    def chunks(self):
+        """Yield (event, text, pieces) batches until the channel is closed and drained.
+
+        Consecutive pieces of the same event are joined; order across events is kept.
+        """
+        try:
+            while True:
+                with self._cv:
+                    while not self._items and not self._closed:
+                        self._cv.wait()
+                    if not self._items:
+                        return
+                    deadline = self._first + self.window
+                    while len(self._items) < self.max_tokens and not self._closed:
+                        rem = deadline - time.perf_counter()
+                        if rem <= 0:
+                            break
+                        self._cv.wait(rem)
+                    items, self._items = self._items, []
+                for event, grp in itertools.groupby(items, key=lambda x: x[0]):
+                    texts = [t for _, t in grp]
+                    yield event, "".join(texts), len(texts)
+        finally:
+            self._release()
+
+    def poll(self):
+        """Non-blocking step of chunks(): (batches, None) when a frame is due,
+        ([], Park) when the caller should wait, (None, None) once closed and drained."""
+        with self._cv:
+            if not self._items:
+                if self._closed:
+                    return None, None
+                self.signal.clear()
+                return [], Park(self.signal)
+            if len(self._items) < self.max_tokens and not self._closed:
+                rem = self._first + self.window - time.perf_counter()
+                if rem > 0:
+                    self.signal.clear()
+                    return [], Park(self.signal, rem)
+            items, self._items = self._items, []
+        out = []
+        for event, grp in itertools.groupby(items, key=lambda x: x[0]):
+            texts = [t for _, t in grp]
+            out.append((event, "".join(texts), len(texts)))
+        return out, None
+
+    def parked_chunks(self):
+        """chunks() that yields Park instead of blocking; run it under a ParkingStream."""
+        try:
+            while True:
+                batches, park = self.poll()
+                if batches is None:
+                    return
+                if park is not None:
+                    yield park
+                    continue
+                yield from batches
+        finally:
+            self._release()
+
+    def frame(self, event: str, payload: dict) -> str:
+        s = "event: " + event + "\ndata: " + json.dumps(payload) + "\n\n"
+        n = len(s.encode("utf-8"))
+        self.frames += 1
+        self.bytes += n
+        with _totals_lock:
+            _totals["frames"] += 1
+            _totals["bytes"] += n
+        return s
+
+    def _release(self):
+        with _totals_lock:
+            if not self._released:
+                self._released = True
+                _totals["active"] -= 1
+                _totals["tokens"] += self.tokens
+
+    def stats(self):
+        return {
+            "tokens": self.tokens,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "tokens_per_frame": (self.tokens / self.frames) if self.frames else None,
+            "bytes_per_token": (self.bytes / self.tokens) if self.tokens else None,
+        }
+
+def sse_stats():
+    with _totals_lock:
+        st = dict(_totals)
+    st["bytes_per_token"] = (st["bytes"] / st["tokens"]) if st["tokens"] else None
+    st["tokens_per_frame"] = (st["tokens"] / st["frames"]) if st["frames"] else None
+    return st
+
+_OPEN_TAG = "<think>"
+_CLOSE_TAG = "</think>"
+
+def _partial_tag(s: str, tag: str) -> int:
+    """Length of the longest suffix of s that is a proper prefix of tag."""
+    for n in range(min(len(s), len(tag) - 1), 0, -1):
+        if s.endswith(tag[:n]):
+            return n
+    return 0
+
+class ThinkSplitter:
+    """Splits a token stream into reasoning and answer text as it arrives.
+
+    Work per piece is bounded by the piece length plus the tag length: only a
+    possible partial tag (at most 7 chars) is carried between pieces. An
+    opening `<think>` is honoured only before any answer text; models whose
+    template opens the block in the prompt start with `in_think=True`.
+    Kept reasoning is capped at `max_chars` (oldest text is dropped).
+    """
+
+    def __init__(self, in_think: bool = False, max_chars: int = 65536):
+        self.state = "think" if in_think else "start"
+        self.max_chars = max(0, int(max_chars))
+        self._carry = ""
+        self._kept = deque()
+        self._kept_len = 0
+        self.thinking_chars = 0
+
+    def feed(self, piece: str):
+        """Return a list of (event, text) with event "thinking" or "token"."""
+        out = []
+        s = self._carry + piece
+        self._carry = ""
+        while s:
+            if self.state == "answer":
+                out.append(("token", s))
+                break
+            if self.state == "start":
+                body = s.lstrip()
+                low = body[:len(_OPEN_TAG)].lower()
+                if low == _OPEN_TAG:
+                    self.state = "think"
+                    s = body[len(_OPEN_TAG):]
+                    continue
+                if not body or _OPEN_TAG.startswith(low):
+                    self._carry = s
+                    break
+                self.state = "answer"
+                continue
+            low = s.lower()
+            k = low.find(_CLOSE_TAG)
+            if k != -1:
+                self._think(out, s[:k])
+                self.state = "answer"
+                s = s[k + len(_CLOSE_TAG):]
+                continue
+            n = _partial_tag(low, _CLOSE_TAG)
+            if n:
+                self._carry = s[-n:]
+                s = s[:-n]
+            self._think(out, s)
+            break
+        return out
+
+    def flush(self):
+        """Emit anything held back as a possible tag once the stream ends."""
+        s, self._carry = self._carry, ""
+        if not s:
+            return []
+        if self.state == "think":
+            out = []
+            self._think(out, s)
+            return out
+        return [("token", s)]
+
+    def _think(self, out, text):
+        if not text:
+            return
+        out.append(("thinking", text))
+        self.thinking_chars += len(text)
+        if not self.max_chars:
+            return
+        self._kept.append(text)
+        self._kept_len += len(text)
+        while self._kept and self._kept_len - len(self._kept[0]) >= self.max_chars:
+            self._kept_len -= len(self._kept.popleft())
+
+    def reasoning(self) -> str:
+        s = "".join(self._kept)
+        return s[-self.max_chars:] if self.max_chars else ""
+
+    def stats(self):
+        kept = min(self._kept_len, self.max_chars)
+        return {"chars": self.thinking_chars, "kept": kept, "truncated": self.thinking_chars > kept}
+
+class CancelToken:
+    """Per-request stop flag checked by the streamer at every token."""
+
+    def __init__(self, request_id: str, max_new_tokens: int | None = None):
+        self.request_id = request_id
+        self.max_new_tokens = max_new_tokens
+        self.reason = None
+        self.pieces = 0
+        self.at_cancel = None
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "stop") -> bool:
+        if self._event.is_set():
+            return False
+        self.reason = reason
+        self.at_cancel = self.pieces
+        self._event.set()
+        return True
+
+    def reclaimed(self) -> int | None:
+        if not self.cancelled or not self.max_new_tokens:
+            return None
+        return max(0, int(self.max_new_tokens) - int(self.at_cancel or 0))
+
+    def report(self):
+        if not self.cancelled:
+            return None
+        return {"reason": self.reason, "generated_tokens": self.at_cancel, "reclaimed_tokens": self.reclaimed()}
+
+_cancel_lock = threading.Lock()
+_requests = {}
+_cancel_totals = {"requests": 0, "cancelled": 0, "disconnect": 0, "stop": 0, "generated_tokens": 0, "reclaimed_tokens": 0}
+
+def register_request(request_id: str, max_new_tokens: int | None = None) -> CancelToken:
+    """Token for a running request; an id already in use gets a fresh one (see tok.request_id)."""
+    with _cancel_lock:
+        if request_id in _requests:
+            request_id = uuid.uuid4().hex
+        tok = CancelToken(request_id, max_new_tokens)
+        _requests[request_id] = tok
+        _cancel_totals["requests"] += 1
+    return tok
+
+def cancel_request(request_id: str, reason: str = "stop") -> bool:
+    """Flag a running request; False when it is unknown or already finished."""
+    with _cancel_lock:
+        tok = _requests.get(request_id)
+    return bool(tok is not None and tok.cancel(reason))
+
+def finish_request(tok: CancelToken):
+    with _cancel_lock:
+        if _requests.get(tok.request_id) is tok:
+            del _requests[tok.request_id]
+        if tok.cancelled:
+            _cancel_totals["cancelled"] += 1
+            _cancel_totals[tok.reason if tok.reason in ("disconnect", "stop") else "stop"] += 1
+            _cancel_totals["generated_tokens"] += int(tok.at_cancel or 0)
+            _cancel_totals["reclaimed_tokens"] += int(tok.reclaimed() or 0)
+
+def cancel_stats():
+    with _cancel_lock:
+        return {**_cancel_totals, "active": len(_requests)}
+
+def streaming_status():
+    """(RUNNING, STOP, CANCEL) values for a GenAI streamer callback; booleans when GenAI is absent."""
+    try:
+        import openvino_genai as ov_genai
+        st = ov_genai.StreamingStatus
+        return st.RUNNING, st.STOP, getattr(st, "CANCEL", st.STOP)
+    except Exception:
+        return False, True, True
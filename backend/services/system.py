@@ -1,6 +1,7 @@
 import os
 import platform
 import subprocess
+import threading
 from pathlib import Path
 from functools import lru_cache
 
@@ -20,13 +21,99 @@ def _nvidia_info():
     except Exception:
         return []
 
-def _openvino_devices():
-    try:
-        from openvino import Core
-        core = Core()
-        return core.available_devices
-    except Exception:
+_core_lock = threading.RLock()
+_core = None
+_topology = None
+
+def get_core():
+    """Process-wide openvino.Core; creating one per request costs plugin discovery."""
+    global _core
+    if _core is None:
+        with _core_lock:
+            if _core is None:
+                from openvino import Core
+                _core = Core()
+    return _core
+
+def _is_igpu_name(name):
+    if not name:
+        return False
+    ln = name.lower()
+    if "(igpu)" in ln or " igpu" in ln:
+        return True
+    for k in ("integrated", "uhd", "iris", "hd graphics"):
+        if k in ln:
+            return True
+    return False
+
+def _ordered_gpu_list(avail, gpu_names):
+    gpu_devs = [d for d in avail if d.startswith("GPU")]
+    if not gpu_devs:
         return []
+    integrated = [d for d in gpu_devs if _is_igpu_name(gpu_names.get(d))]
+    if integrated:
+        try:
+            integrated.sort(key=lambda s: int(s.split(".")[1]) if "." in s and s.split(".")[1].isdigit() else 0)
+        except Exception:
+            pass
+        others = [d for d in gpu_devs if d not in integrated]
+        return integrated + others
+    if platform.system() == "Windows":
+        intel_names = [n for n in _windows_video_controllers() if "intel" in n.lower()]
+        if intel_names:
+            key = intel_names[0].lower()
+            matched = [d for d in gpu_devs if key in (gpu_names.get(d) or "").lower()]
+            if matched:
+                others = [d for d in gpu_devs if d not in matched]
+                return matched + others
+    intel_list = [d for d in gpu_devs if "intel" in (gpu_names.get(d) or "").lower()]
+    if intel_list:
+        others = [d for d in gpu_devs if d not in intel_list]
+        return intel_list + others
+    return gpu_devs
+
+def get_device_topology(refresh: bool = False):
+    """Available devices, iGPU-first GPU order and NPU architecture, probed once."""
+    global _topology
+    if _topology is not None and not refresh:
+        return _topology
+    with _core_lock:
+        if _topology is not None and not refresh:
+            return _topology
+        topo = {"available": [], "ordered_gpus": [], "gpu_names": {}, "npu_arch": None, "cpu_caps": []}
+        try:
+            core = get_core()
+            avail = list(core.available_devices)
+            topo["available"] = avail
+            for d in avail:
+                if d.startswith("GPU"):
+                    try:
+                        fn = core.get_property(d, "FULL_DEVICE_NAME")
+                        topo["gpu_names"][d] = str(fn) if fn is not None else ""
+                    except Exception:
+                        topo["gpu_names"][d] = ""
+            if "CPU" in avail:
+                try:
+                    topo["cpu_caps"] = [str(c) for c in core.get_property("CPU", "OPTIMIZATION_CAPABILITIES")]
+                except Exception:
+                    pass
+            if any(d.startswith("NPU") for d in avail):
+                try:
+                    topo["npu_arch"] = str(core.get_property("NPU", "DEVICE_ARCHITECTURE"))
+                except Exception:
+                    pass
+            topo["ordered_gpus"] = _ordered_gpu_list(avail, topo["gpu_names"])
+        except Exception:
+            pass
+        _topology = topo
+        return topo
+
+def refresh_device_topology():
+    _windows_video_controllers.cache_clear()
+    return get_device_topology(refresh=True)
+
+def _openvino_devices():
+    return list(get_device_topology().get("available") or [])
 
 @lru_cache(maxsize=1)
 def _cpu_model():
@@ -39,17 +126,125 @@ def _cpu_model():
                     continue
                 return s
         elif platform.system() == "Linux":
-            try:
-                with open("/proc/cpuinfo", "r", encoding="utf-8", errors="ignore") as f:
-                    for line in f:
-                        if "model name" in line:
-                            return line.split(":", 1)[1].strip()
-            except Exception:
-                pass
+            name = _proc_cpuinfo().get("model name")
+            if name:
+                return name
         return platform.processor() or platform.machine()
     except Exception:
         return platform.processor() or platform.machine()
 
+@lru_cache(maxsize=1)
+def _proc_cpuinfo() -> dict:
+    """Fields of the first processor block in /proc/cpuinfo; empty off Linux."""
+    info = {}
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if not line.strip():
+                    if info:
+                        break
+                    continue
+                k, _, v = line.partition(":")
+                info.setdefault(k.strip(), v.strip())
+    except Exception:
+        pass
+    return info
+
+# most capable first; each tier names the flags it needs
+_ISA_TIERS = (
+    ("amx_bf16", ("amx_bf16", "amx_tile", "avx512_bf16")),
+    ("avx512_bf16", ("avx512f", "avx512_bf16")),
+    ("avx512_vnni", ("avx512f", "avx512_vnni")),
+    ("avx512", ("avx512f",)),
+    ("avx2_vnni", ("avx2", "avx_vnni")),
+    ("avx2", ("avx2",)),
+)
+
+@lru_cache(maxsize=1)
+def cpu_isa() -> dict:
+    """The best matrix ISA tier of this CPU from the /proc/cpuinfo flags ("baseline" when unknown)."""
+    flags = set((_proc_cpuinfo().get("flags") or _proc_cpuinfo().get("Features") or "").split())
+    tier = "baseline"
+    for name, need in _ISA_TIERS:
+        if all(f in flags for f in need):
+            tier = name
+            break
+    known = sorted({f for _, need in _ISA_TIERS for f in need} & flags)
+    return {"isa": tier, "flags": known, "arch": platform.machine()}
+
+# per ISA tier: compute precision, KV-cache precision and dynamic-quantization group size
+CPU_PROFILES = {
+    "amx_bf16": {"INFERENCE_PRECISION_HINT": "bf16", "KV_CACHE_PRECISION": "u8", "DYNAMIC_QUANTIZATION_GROUP_SIZE": "32"},
+    "avx512_bf16": {"INFERENCE_PRECISION_HINT": "bf16", "KV_CACHE_PRECISION": "u8", "DYNAMIC_QUANTIZATION_GROUP_SIZE": "32"},
+    "avx512_vnni": {"INFERENCE_PRECISION_HINT": "f32", "KV_CACHE_PRECISION": "u8", "DYNAMIC_QUANTIZATION_GROUP_SIZE": "32"},
+    "avx512": {"INFERENCE_PRECISION_HINT": "f32", "KV_CACHE_PRECISION": "u8", "DYNAMIC_QUANTIZATION_GROUP_SIZE": "64"},
+    "avx2_vnni": {"INFERENCE_PRECISION_HINT": "f32", "KV_CACHE_PRECISION": "u8", "DYNAMIC_QUANTIZATION_GROUP_SIZE": "32"},
+    "avx2": {"INFERENCE_PRECISION_HINT": "f32", "KV_CACHE_PRECISION": "u8", "DYNAMIC_QUANTIZATION_GROUP_SIZE": "64"},
+    # unknown ISA (or non-x86): keep the plugin defaults
+    "baseline": {},
+}
+
+# request config keys that override single profile properties
+_PROFILE_OVERRIDES = {
+    "inference_precision": "INFERENCE_PRECISION_HINT",
+    "kv_cache_precision": "KV_CACHE_PRECISION",
+    "dq_group_size": "DYNAMIC_QUANTIZATION_GROUP_SIZE",
+}
+
+def cpu_profile(config: dict | None = None) -> dict:
+    """CPU compile properties for this host's ISA.
+
+    `config.cpu_profile` picks another tier ("off" sets nothing) and
+    `inference_precision`, `kv_cache_precision`, `dq_group_size` override
+    single properties. Returns {"name", "isa", "props"}.
+    """
+    config = config or {}
+    isa = cpu_isa()["isa"]
+    name = str(config.get("cpu_profile") or os.environ.get("AIFUNLAND_CPU_PROFILE") or isa).lower()
+    if name == "off":
+        props = {}
+    else:
+        if name not in CPU_PROFILES:
+            name = isa
+        props = dict(CPU_PROFILES[name])
+    for k, prop in _PROFILE_OVERRIDES.items():
+        v = config.get(k)
+        if v is not None and v != "":
+            props[prop] = str(v)
+    return {"name": name, "isa": isa, "props": props}
+
+def _parse_cpulist(text: str) -> list:
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def _usable_cpus() -> list:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except Exception:
+        return list(range(os.cpu_count() or 1))
+
+@lru_cache(maxsize=1)
+def numa_nodes() -> list:
+    """[{"node", "cpus"}] for the NUMA nodes this process may run on; one pseudo-node off Linux."""
+    usable = set(_usable_cpus())
+    nodes = []
+    try:
+        for d in sorted(Path("/sys/devices/system/node").glob("node[0-9]*"), key=lambda d: int(d.name[4:])):
+            cpus = [c for c in _parse_cpulist((d / "cpulist").read_text()) if c in usable]
+            if cpus:
+                nodes.append({"node": int(d.name[4:]), "cpus": cpus})
+    except Exception:
+        nodes = []
+    return nodes or [{"node": None, "cpus": sorted(usable)}]
+
 @lru_cache(maxsize=1)
 def _windows_video_controllers():
     try:
@@ -160,8 +355,7 @@ def get_info():
         genv = None
     arch = {}
     try:
-        from openvino import Core as _Core
-        _c = _Core()
+        _c = get_core()
         if "NPU" in devices:
             try:
                 a = _c.get_property("NPU", "DEVICE_ARCHITECTURE")
@@ -190,8 +384,7 @@ def get_info():
         "NPU_TILES": _os.environ.get("NPU_TILES"),
     }
     try:
-        from openvino import Core as _Core
-        _hc = _Core()
+        _hc = get_core()
         try:
             hp = _hc.get_property("HETERO", "MULTI_DEVICE_PRIORITIES")
             hints["HETERO_PRIORITIES"] = hp
@@ -221,6 +414,9 @@ def get_info():
         "machine": platform.machine(),
         "processor": platform.processor(),
         "cpu_count": os.cpu_count(),
+        "numa_nodes": [{"node": n["node"], "cpus": len(n["cpus"])} for n in numa_nodes()],
+        "cpu_isa": cpu_isa(),
+        "cpu_profile": cpu_profile(),
         "openvino_devices": devices,
         "nvidia_gpus": nvidia,
         "accelerators": accelerators,
@@ -0,0 +1,221 @@
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+_MODES = ("LATENCY", "THROUGHPUT", "CUMULATIVE_THROUGHPUT")
+# config key that sets the stream count per device class
+_STREAM_KEYS = {"NPU": "npu_streams", "GPU": "gpu_streams"}
+_STREAM_CHOICES = (1, 2)
+_BUCKETS = (256, 1024, 4096)
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+def device_class(device: str) -> str:
+    d = str(device or "")
+    if "NPU" in d:
+        return "NPU"
+    if "GPU" in d:
+        return "GPU"
+    return "CPU"
+
+def prompt_bucket(prompt: str | None) -> str:
+    """Coarse prompt-length bucket; ~4 UTF-8 bytes per token is close enough to pick a bucket."""
+    n = len(str(prompt or "").encode("utf-8")) // 4
+    for b in _BUCKETS:
+        if n <= b:
+            return str(b)
+    return "long"
+
+def objective_for(config: dict | None) -> str:
+    cfg = config or {}
+    obj = str(cfg.get("perf_objective") or "").lower()
+    if obj in ("ttft", "latency"):
+        return "ttft"
+    if obj in ("throughput", "tps"):
+        return "throughput"
+    try:
+        max_new = int(cfg.get("max_new_tokens") or 512)
+        num_req = int(cfg.get("num_requests") or 1)
+    except Exception:
+        return "ttft"
+    return "throughput" if (max_new >= 512 or num_req > 1) else "ttft"
+
+def stream_key(device: str) -> str | None:
+    return _STREAM_KEYS.get(device_class(device))
+
+def arm_name(mode: str, streams=None) -> str:
+    return f"{mode}/{int(streams)}" if streams else mode
+
+def arms_for(device: str, streams=None):
+    sk = stream_key(device)
+    if sk is None:
+        return [arm_name(m) for m in _MODES]
+    choices = (int(streams),) if streams else _STREAM_CHOICES
+    return [arm_name(m, s) for m in _MODES for s in choices]
+
+def arm_config(device: str, arm: str) -> dict:
+    """Config keys that make load_pipeline compile the given arm."""
+    mode, _, streams = arm.partition("/")
+    out = {"perf_mode": mode}
+    sk = stream_key(device)
+    if sk and streams:
+        out[sk] = int(streams)
+    return out
+
+def arm_of(pipe, device: str, fallback: str | None) -> str | None:
+    """The arm a pipeline was actually compiled with; hot reconfiguration may serve a sibling."""
+    props = getattr(pipe, "_af_props", None)
+    if not isinstance(props, dict) or props.get("PERFORMANCE_HINT") not in _MODES:
+        return fallback
+    streams = props.get("NUM_STREAMS") if stream_key(device) else None
+    try:
+        streams = int(streams) if streams else None
+    except Exception:
+        streams = None
+    return arm_name(props["PERFORMANCE_HINT"], streams)
+
+class PerfTuner:
+    """UCB bandit over perf hints and stream counts per (model, device, prompt bucket).
+
+    Every arm is a separately compiled pipeline, so the tuner stays on its
+    current arm until it has ``min_pulls`` samples and only switches when
+    another arm scores ``hysteresis`` higher. Untried arms are explored once.
+    """
+
+    def __init__(self, path: Path | None = None, alpha: float | None = None, explore: float | None = None, hysteresis: float | None = None, min_pulls: int | None = None):
+        self._lock = threading.Lock()
+        self.path = path
+        self.alpha = float(alpha if alpha is not None else _env_float("AIFUNLAND_TUNER_ALPHA", 0.3))
+        self.explore = float(explore if explore is not None else _env_float("AIFUNLAND_TUNER_EXPLORE", 0.02))
+        self.hysteresis = float(hysteresis if hysteresis is not None else _env_float("AIFUNLAND_TUNER_HYSTERESIS", 0.05))
+        self.min_pulls = int(min_pulls if min_pulls is not None else _env_float("AIFUNLAND_TUNER_MIN_PULLS", 3))
+        self._keys = {}
+        self._saved_at = 0.0
+        self.counters = {"choices": 0, "switches": 0, "explorations": 0, "observations": 0, "sibling_samples": 0}
+        self._load()
+
+    @staticmethod
+    def key(model_id: str, device: str, bucket: str) -> str:
+        return f"{model_id}|{device_class(device)}|{bucket}"
+
+    def _state(self, k, arms):
+        st = self._keys.get(k)
+        if st is None:
+            # start where the old heuristic started
+            cur = next((a for a in arms if a.startswith("CUMULATIVE_THROUGHPUT")), arms[0])
+            st = {"current": cur, "arms": {}, "switches": 0}
+            self._keys[k] = st
+        for a in arms:
+            st["arms"].setdefault(a, {"n": 0, "tries": 0, "ttft": None, "tps": None})
+        if st["current"] not in arms:
+            st["current"] = arms[0]
+        return st
+
+    def _rewards(self, st, arms, objective):
+        field = "ttft" if objective == "ttft" else "tps"
+        vals = {a: st["arms"][a][field] for a in arms if st["arms"][a]["n"] > 0 and st["arms"][a][field]}
+        if not vals:
+            return {}
+        if field == "ttft":
+            best = min(vals.values())
+            return {a: best / v for a, v in vals.items()}
+        best = max(vals.values())
+        return {a: v / best for a, v in vals.items()}
+
+    def choose(self, model_id: str, device: str, bucket: str, objective: str = "ttft", streams=None) -> str:
+        arms = arms_for(device, streams)
+        with self._lock:
+            st = self._state(self.key(model_id, device, bucket), arms)
+            cur = st["current"]
+            ca = st["arms"][cur]
+            pick = cur
+            # tries outrun samples while a sibling pipeline serves during recompilation
+            if ca["n"] >= self.min_pulls or ca["tries"] >= 2 * self.min_pulls:
+                untried = [a for a in arms if st["arms"][a]["n"] == 0 and st["arms"][a]["tries"] == 0]
+                if untried:
+                    pick = untried[0]
+                    self.counters["explorations"] += 1
+                else:
+                    rw = self._rewards(st, arms, objective)
+                    total = sum(st["arms"][a]["n"] for a in rw) or 1
+                    score = {a: r + self.explore * math.sqrt(math.log(total + 1) / st["arms"][a]["n"]) for a, r in rw.items()}
+                    if score:
+                        best = max(score, key=score.get)
+                        if best != cur and score[best] > score.get(cur, 0.0) + self.hysteresis:
+                            pick = best
+            if pick != cur:
+                st["current"] = pick
+                st["switches"] += 1
+                self.counters["switches"] += 1
+            st["arms"][pick]["tries"] += 1
+            self.counters["choices"] += 1
+        return pick
+
+    def observe(self, model_id: str, device: str, bucket: str, arm: str | None, ttft_ms=None, tps=None, chosen: str | None = None):
+        if not arm or (not ttft_ms and not tps):
+            return
+        with self._lock:
+            st = self._state(self.key(model_id, device, bucket), arms_for(device))
+            a = st["arms"].setdefault(arm, {"n": 0, "tries": 0, "ttft": None, "tps": None})
+            for field, v in (("ttft", ttft_ms), ("tps", tps)):
+                if v:
+                    v = float(v)
+                    a[field] = v if a[field] is None else (1.0 - self.alpha) * a[field] + self.alpha * v
+            a["n"] += 1
+            self.counters["observations"] += 1
+            if chosen and chosen != arm:
+                self.counters["sibling_samples"] += 1
+            due = time.time() - self._saved_at >= 5.0
+        if due:
+            self.save()
+
+    def stats(self):
+        with self._lock:
+            keys = {k: {"current": st["current"], "switches": st["switches"], "arms": {a: dict(v) for a, v in st["arms"].items() if v["n"] or v["tries"]}} for k, st in self._keys.items()}
+            return {**self.counters, "keys": keys, "state": str(self.path) if self.path else None}
+
+    def reset(self):
+        with self._lock:
+            self._keys.clear()
+        self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            data = json.dumps({"version": 1, "keys": self._keys})
+            self._saved_at = time.time()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == 1 and isinstance(data.get("keys"), dict):
+                self._keys = data["keys"]
+        except Exception:
+            pass
+
+def _default_tuner():
+    if os.environ.get("AIFUNLAND_TUNER_PERSIST", "1") == "0":
+        return PerfTuner()
+    base = os.environ.get("AIFUNLAND_CACHE_DIR") or str(Path.cwd() / "tmp")
+    return PerfTuner(Path(base) / "perf_tuner.json")
+
+perf_tuner = _default_tuner()
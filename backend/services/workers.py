@@ -0,0 +1,607 @@
+"""Process-per-model workers.
+
+With `AIFUNLAND_MODEL_WORKERS=1` every (model, device) pair is served by its
+own worker process. The front end sends requests over a multiprocessing pipe
+and receives streamed tokens through a shared-memory ring buffer per request,
+so token traffic never goes through pickling or the front end's GIL-bound
+routes. A worker that dies fails its in-flight requests and is restarted;
+model conversions can run in a throwaway process through `run_isolated`.
+
+`cpu_replicas` runs N workers for one CPU model, each pinned to its own
+core partition (whole NUMA nodes, or slices of them), behind a
+least-loaded router.
+"""
+import codecs
+import itertools
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_CTX = multiprocessing.get_context("spawn")
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+def enabled() -> bool:
+    return os.environ.get("AIFUNLAND_MODEL_WORKERS", "0").lower() in ("1", "true", "yes", "on")
+
+def _resolve(spec: str):
+    mod, _, attr = spec.partition(":")
+    import importlib
+    return getattr(importlib.import_module(mod), attr)
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+# Ring layout: head (bytes written) u64 | tail (bytes read) u64 | closed u8 | cancelled u8 | waiting u8 | pad, then data.
+_HDR = 64
+_OFF_HEAD, _OFF_TAIL, _OFF_CLOSED, _OFF_CANCEL, _OFF_WAIT = 0, 8, 16, 17, 18
+# upper bound on a reader's sleep should a wakeup ever be lost; wakeups normally come first
+_WAKE_TIMEOUT_S = 0.1
+_LEN = struct.Struct("<I")
+
+class ShmRing:
+    """Single-producer single-consumer byte ring in shared memory.
+
+    Records are length-prefixed; a record larger than half the ring is split,
+    so readers must decode incrementally. The writer sets `closed` when done,
+    the reader sets `cancelled` to ask the writer to stop. A reader about to
+    block sets `waiting`; the writer that clears it owes the reader a wakeup.
+    """
+
+    def __init__(self, name: str | None = None, size: int = 65536):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_HDR + size)
+            self.shm.buf[:_HDR] = bytes(_HDR)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.cap = self.shm.size - _HDR
+        self.buf = self.shm.buf
+
+    def _u64(self, off):
+        return struct.unpack_from("<Q", self.buf, off)[0]
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.buf[_OFF_CLOSED])
+
+    @property
+    def cancelled(self) -> bool:
+        return bool(self.buf[_OFF_CANCEL])
+
+    def close_writer(self):
+        self.buf[_OFF_CLOSED] = 1
+
+    def cancel(self):
+        self.buf[_OFF_CANCEL] = 1
+
+    def has_data(self) -> bool:
+        return self._u64(_OFF_HEAD) > self._u64(_OFF_TAIL)
+
+    def want_wakeup(self):
+        self.buf[_OFF_WAIT] = 1
+
+    def take_wakeup(self) -> bool:
+        """Writer side: True (once) when the reader is waiting for data."""
+        if self.buf[_OFF_WAIT]:
+            self.buf[_OFF_WAIT] = 0
+            return True
+        return False
+
+    def _copy_in(self, pos, data):
+        off = pos % self.cap
+        first = min(len(data), self.cap - off)
+        self.buf[_HDR + off:_HDR + off + first] = data[:first]
+        if first < len(data):
+            self.buf[_HDR:_HDR + len(data) - first] = data[first:]
+
+    def _copy_out(self, pos, n):
+        off = pos % self.cap
+        first = min(n, self.cap - off)
+        out = bytes(self.buf[_HDR + off:_HDR + off + first])
+        if first < n:
+            out += bytes(self.buf[_HDR:_HDR + n - first])
+        return out
+
+    def write(self, data: bytes, timeout: float = 30.0) -> bool:
+        """Append a record; False when the reader cancelled or stayed full past `timeout`."""
+        step = max(1, self.cap // 2 - _LEN.size)
+        for i in range(0, max(1, len(data)), step):
+            part = data[i:i + step]
+            need = _LEN.size + len(part)
+            end = time.monotonic() + timeout
+            delay = 0.0005
+            while self._u64(_OFF_HEAD) + need - self._u64(_OFF_TAIL) > self.cap:
+                if self.cancelled or time.monotonic() > end:
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 0.01)
+            head = self._u64(_OFF_HEAD)
+            self._copy_in(head, _LEN.pack(len(part)) + part)
+            # publish only after the payload is in place
+            struct.pack_into("<Q", self.buf, _OFF_HEAD, head + need)
+        return not self.cancelled
+
+    def read(self) -> list:
+        out = []
+        tail = self._u64(_OFF_TAIL)
+        head = self._u64(_OFF_HEAD)
+        while tail < head:
+            n = _LEN.unpack(self._copy_out(tail, _LEN.size))[0]
+            out.append(self._copy_out(tail + _LEN.size, n))
+            tail += _LEN.size + n
+        struct.pack_into("<Q", self.buf, _OFF_TAIL, tail)
+        return out
+
+    def close(self, unlink: bool = False):
+        self.buf = None
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+        if unlink:
+            try:
+                self.shm.unlink()
+            except Exception:
+                pass
+
+# ---- worker process side ----
+
+def _serve(msg, loader, runner, send, model_dir, device, fixed):
+    ring = ShmRing(msg["ring"]) if msg.get("ring") else None
+    try:
+        config = {**(msg.get("config") or {}), **fixed}
+        pipe = loader(Path(model_dir), device, config)
+        streamer = None
+        if ring is not None:
+            def streamer(piece):
+                if ring.cancelled:
+                    return True
+                ok = ring.write(str(piece).encode("utf-8"))
+                if ring.take_wakeup():
+                    send({"op": "data", "id": msg["id"]})
+                return not ok
+        text, metrics = runner(pipe, msg["prompt"], config, streamer)
+        send({"op": "done", "id": msg["id"], "text": text if isinstance(text, str) else str(text), "metrics": metrics})
+    except Exception as e:
+        send({"op": "error", "id": msg["id"], "error": str(e)})
+    finally:
+        if ring is not None:
+            ring.close_writer()
+            ring.close()
+
+def _apply_budget(mb):
+    """Set this worker's share of the memory budget; read by the residency manager on first use."""
+    os.environ["AIFUNLAND_MEM_BUDGET_MB"] = str(mb)
+    import sys
+    mod = sys.modules.get("backend.services.inference")
+    if mod is not None:
+        mod.set_memory_budget(mb)
+
+def _worker_main(conn, model_dir, device, config, loader_spec, runner_spec, threads, cpus=None, budget_mb=None):
+    if budget_mb:
+        os.environ["AIFUNLAND_MEM_BUDGET_MB"] = str(budget_mb)
+    if cpus:
+        # pin before the runtime starts its threads; first-touch allocations then stay on the local node
+        try:
+            os.sched_setaffinity(0, cpus)
+        except Exception:
+            pass
+    loader = _resolve(loader_spec)
+    runner = _resolve(runner_spec)
+    lock = threading.Lock()
+
+    def send(msg):
+        with lock:
+            conn.send(msg)
+
+    try:
+        loader(Path(model_dir), device, config or {})
+    except Exception as e:
+        send({"op": "load_failed", "error": str(e)})
+        return
+    send({"op": "ready", "pid": os.getpid()})
+    # settings owned by the worker (its core partition) apply to every request
+    fixed = {k: config[k] for k in ("cpu_threads",) if k in (config or {})}
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="worker")
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg.get("op") == "stop":
+            break
+        if msg.get("op") == "budget":
+            _apply_budget(msg["mb"])
+        if msg.get("op") == "generate":
+            pool.submit(_serve, msg, loader, runner, send, model_dir, device, fixed)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+# ---- front end side ----
+
+def cpu_partitions(n: int, nodes: list | None = None) -> list:
+    """Split the usable cores into n disjoint sets: whole NUMA nodes when n <= nodes, else equal slices of each node."""
+    if nodes is None:
+        from backend.services.system import numa_nodes
+        nodes = numa_nodes()
+    n = max(1, int(n))
+    if n <= len(nodes):
+        parts = [{"node": None, "cpus": []} for _ in range(n)]
+        for i, nd in enumerate(nodes):
+            part = parts[i * n // len(nodes)]
+            part["cpus"] = part["cpus"] + list(nd["cpus"])
+            part["node"] = nd["node"] if part["node"] is None else part["node"]
+        return parts
+    parts = []
+    for i, nd in enumerate(nodes):
+        # spread the replicas over the nodes as evenly as possible
+        k = n // len(nodes) + (1 if i < n % len(nodes) else 0)
+        cpus = list(nd["cpus"])
+        for j in range(k):
+            chunk = cpus[j * len(cpus) // k:(j + 1) * len(cpus) // k]
+            if chunk:
+                parts.append({"node": nd["node"], "cpus": chunk})
+    return parts
+
+class RemotePipe:
+    """Stands in for a pipeline that lives in one or more worker processes (replicas)."""
+
+    _af_remote = True
+
+    def __init__(self, pool, keys):
+        self._pool = pool
+        self._keys = list(keys)
+        self._af_device = self._keys[0][1]
+        self._af_device_real = self._keys[0][1]
+
+    @property
+    def replicas(self) -> int:
+        return len(self._keys)
+
+    def submit(self, prompt: str, config: dict, streamer=None):
+        return self._pool.generate(self._pool._pick(self._keys), prompt, config, streamer)
+
+class _Worker:
+    def __init__(self, pool, key, config, budget_mb=None):
+        self.pool = pool
+        self.budget_mb = budget_mb
+        self.key = key
+        self.config = dict(config or {})
+        self.pending = {}
+        self.wakeups = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.state = "starting"
+        self.error = None
+        self.stopping = False
+        self.pid = None
+        self.part = pool._parts.get(key)
+        cfg = dict(self.config)
+        if self.part:
+            cfg["cpu_threads"] = len(self.part["cpus"])
+        parent, child = _CTX.Pipe()
+        self.conn = parent
+        self.proc = _CTX.Process(target=_worker_main, name=f"aifunland-worker-{Path(key[0]).name}",
+                                 args=(child, key[0], key[1], cfg, pool.loader, pool.runner, pool.threads,
+                                       self.part["cpus"] if self.part else None, budget_mb), daemon=True)
+        self.proc.start()
+        child.close()
+        threading.Thread(target=self._reader, daemon=True).start()
+
+    @property
+    def alive(self) -> bool:
+        return self.state in ("starting", "ready")
+
+    def send(self, msg):
+        with self.lock:
+            self.conn.send(msg)
+
+    def _reader(self):
+        while True:
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            op = msg.get("op")
+            if op == "ready":
+                self.pid = msg.get("pid")
+                self.state = "ready"
+                self.ready.set()
+            elif op == "load_failed":
+                self.state = "failed"
+                self.error = msg.get("error")
+                self.ready.set()
+            elif op == "data":
+                ev = self.wakeups.get(msg["id"])
+                if ev is not None:
+                    ev.set()
+            elif op in ("done", "error"):
+                with self.lock:
+                    fut = self.pending.pop(msg["id"], None)
+                if fut is not None and not fut.done():
+                    if op == "done":
+                        fut.set_result((msg["text"], msg["metrics"]))
+                    else:
+                        fut.set_exception(RuntimeError(msg["error"]))
+        self.proc.join(1.0)
+        was = self.state
+        if was in ("starting", "ready"):
+            self.state = "stopped" if self.stopping else "crashed"
+        if self.error is None and self.state == "crashed":
+            self.error = f"worker exited with code {self.proc.exitcode}"
+        self.ready.set()
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(WorkerCrashed(self.error or "worker stopped"))
+        if self.state == "crashed" and was == "ready":
+            self.pool._on_crash(self)
+
+    def stop(self):
+        self.stopping = True
+        try:
+            self.send({"op": "stop"})
+        except Exception:
+            pass
+        self.proc.join(5.0)
+        if self.proc.is_alive():
+            self.proc.kill()
+
+class WorkerPool:
+    """Routes requests to one worker process per (model_dir, device) and restarts crashed ones."""
+
+    def __init__(self, loader: str = "backend.services.inference:load_pipeline", runner: str = "backend.services.inference:submit_generation",
+                 threads: int | None = None, max_restarts: int | None = None, load_timeout_s: float | None = None, ring_kb: int | None = None):
+        self.loader = loader
+        self.runner = runner
+        self.threads = max(1, threads if threads is not None else _env_int("AIFUNLAND_WORKER_THREADS", 8))
+        self.max_restarts = max(0, max_restarts if max_restarts is not None else _env_int("AIFUNLAND_WORKER_MAX_RESTARTS", 5))
+        self.load_timeout_s = load_timeout_s if load_timeout_s is not None else _env_int("AIFUNLAND_WORKER_LOAD_TIMEOUT_S", 600)
+        self.ring_size = max(4, ring_kb if ring_kb is not None else _env_int("AIFUNLAND_WORKER_RING_KB", 64)) * 1024
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._pipes = {}
+        self._parts = {}
+        self._restarts = {}
+        self._rr = itertools.count()
+        self._ids = itertools.count(1)
+        self.counters = {"requests": 0, "crashes": 0, "restarts": 0, "streamed_bytes": 0}
+
+    def _restart_allowed_locked(self, key) -> bool:
+        now = time.monotonic()
+        hist = [t for t in self._restarts.get(key, []) if now - t < 60.0]
+        self._restarts[key] = hist
+        return len(hist) < self.max_restarts
+
+    def _start(self, key, config) -> _Worker:
+        with self._lock:
+            w = self._workers.get(key)
+            if w is None or not w.alive:
+                if w is not None:
+                    if not self._restart_allowed_locked(key):
+                        raise WorkerCrashed(f"worker for {key[0]} keeps crashing: {w.error}")
+                    self._restarts[key].append(time.monotonic())
+                    self.counters["restarts"] += 1
+                live = sum(1 for x in self._workers.values() if x.alive)
+                w = _Worker(self, key, config, self._share_mb(live + 1))
+                self._workers[key] = w
+                grew = True
+            else:
+                grew = False
+        if grew:
+            self.rebalance()
+        return w
+
+    @staticmethod
+    def _share_mb(workers: int) -> float:
+        from backend.services.inference import _residency
+        return round(_residency.total_budget() / (workers + 1) / (1024 * 1024), 1)
+
+    def rebalance(self):
+        """Split the memory budget evenly between the front end and each live worker."""
+        from backend.services.inference import _residency
+        with self._lock:
+            live = [w for w in self._workers.values() if w.alive]
+        _residency.set_shares(len(live) + 1)
+        mb = self._share_mb(len(live))
+        for w in live:
+            if w.budget_mb != mb:
+                w.budget_mb = mb
+                try:
+                    w.send({"op": "budget", "mb": mb})
+                except Exception:
+                    pass
+
+    def _ensure(self, key, config) -> _Worker:
+        return self._ready(self._start(key, config))
+
+    def _ready(self, w) -> _Worker:
+        if not w.ready.wait(self.load_timeout_s):
+            raise RuntimeError("worker load timed out")
+        if w.state != "ready":
+            raise RuntimeError(w.error or "worker failed to start")
+        return w
+
+    def _on_crash(self, w):
+        with self._lock:
+            self.counters["crashes"] += 1
+            if self._workers.get(w.key) is not w or not self._restart_allowed_locked(w.key):
+                return
+            self._restarts[w.key].append(time.monotonic())
+            self.counters["restarts"] += 1
+            logger.warning(f"model worker for {w.key[0]} on {w.key[1]} crashed ({w.error}); restarting")
+            self._workers[w.key] = _Worker(self, w.key, w.config, w.budget_mb)
+
+    def pipeline(self, model_dir, device: str, config: dict | None = None, replicas: int = 1) -> RemotePipe:
+        """Proxy for the model's worker; with replicas > 1 on CPU, one worker per core partition."""
+        config = {k: v for k, v in (config or {}).items() if k != "cpu_replicas"}
+        if replicas > 1 and device == "CPU":
+            parts = cpu_partitions(replicas)
+            keys = [(str(model_dir), device, f"r{i}") for i in range(len(parts))]
+            with self._lock:
+                for k, part in zip(keys, parts):
+                    self._parts[k] = part
+        else:
+            keys = [(str(model_dir), device)]
+        # replicas compile side by side
+        for w in [self._start(k, config) for k in keys]:
+            self._ready(w)
+        pkey = tuple(keys)
+        with self._lock:
+            pipe = self._pipes.get(pkey)
+            if pipe is None:
+                pipe = self._pipes[pkey] = RemotePipe(self, keys)
+            return pipe
+
+    def _pick(self, keys):
+        """Least-loaded replica by in-flight requests; round robin among ties."""
+        if len(keys) == 1:
+            return keys[0]
+        with self._lock:
+            loads = []
+            for k in keys:
+                w = self._workers.get(k)
+                busy = len(w.pending) if w is not None and w.state == "ready" else float("inf")
+                loads.append(busy)
+        low = min(loads)
+        ties = [k for k, n in zip(keys, loads) if n == low]
+        return ties[next(self._rr) % len(ties)]
+
+    def generate(self, key, prompt: str, config: dict, streamer=None):
+        from backend.services.inference import _stream_wants_stop
+        w = self._ensure(key, config)
+        ring = ShmRing(size=self.ring_size) if streamer is not None else None
+        rid = next(self._ids)
+        fut = Future()
+        wake = threading.Event()
+        fut.add_done_callback(lambda f: wake.set())
+        with w.lock:
+            w.pending[rid] = fut
+            if ring is not None:
+                w.wakeups[rid] = wake
+        self.counters["requests"] += 1
+        try:
+            w.send({"op": "generate", "id": rid, "prompt": prompt, "config": config, "ring": ring.name if ring else None})
+            if ring is None:
+                return fut.result()
+            dec = codecs.getincrementaldecoder("utf-8")("replace")
+            while True:
+                # read the flags before the data so a close is never seen ahead of its last record
+                finished = ring.closed or fut.done()
+                recs = ring.read()
+                for rec in recs:
+                    self.counters["streamed_bytes"] += len(rec)
+                    piece = dec.decode(rec)
+                    if piece and not ring.cancelled and _stream_wants_stop(streamer(piece)):
+                        ring.cancel()
+                if recs:
+                    continue
+                if finished:
+                    break
+                # block until the worker's reader thread relays a "data" wakeup (or the request ends)
+                wake.clear()
+                ring.want_wakeup()
+                if ring.has_data() or ring.closed or fut.done():
+                    continue
+                wake.wait(_WAKE_TIMEOUT_S)
+            tail = dec.decode(b"", final=True)
+            if tail and not ring.cancelled:
+                streamer(tail)
+            return fut.result()
+        finally:
+            with w.lock:
+                w.pending.pop(rid, None)
+                w.wakeups.pop(rid, None)
+            if ring is not None:
+                ring.close(unlink=True)
+
+    def stop(self, model_dir=None):
+        with self._lock:
+            keys = [k for k in self._workers if model_dir is None or k[0] == str(model_dir)]
+            ws = [self._workers.pop(k) for k in keys]
+            for pk in [pk for pk in self._pipes if any(k in keys for k in pk)]:
+                self._pipes.pop(pk, None)
+        for w in ws:
+            w.stop()
+        self.rebalance()
+
+    def memory_stats(self):
+        """Per-worker budget share and resident memory, for residency_stats()."""
+        with self._lock:
+            ws = list(self._workers.items())
+        return [{"model": Path(k[0]).name, "device": k[1], "replica": k[2] if len(k) > 2 else None, "pid": w.pid,
+                 "state": w.state, "budget_bytes": int(w.budget_mb * 1024 * 1024) if w.budget_mb else None,
+                 "rss_bytes": _proc_rss(w.pid)} for k, w in ws]
+
+    def stats(self):
+        with self._lock:
+            workers = [{"model": Path(k[0]).name, "device": k[1], "replica": k[2] if len(k) > 2 else None,
+                        "numa_node": w.part["node"] if w.part else None, "cpus": len(w.part["cpus"]) if w.part else None,
+                        "state": w.state, "pid": w.pid, "inflight": len(w.pending), "error": w.error}
+                       for k, w in self._workers.items()]
+        return {"enabled": enabled(), "workers": workers, **self.counters}
+
+def _proc_rss(pid):
+    if not pid:
+        return None
+    try:
+        import psutil
+        return int(psutil.Process(pid).memory_info().rss)
+    except Exception:
+        pass
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def active_pool():
+    """The worker pool if one has been started, without starting it."""
+    return _pool
+
+def worker_pool() -> WorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+def _isolated_main(conn, fn, args, kwargs):
+    try:
+        conn.send(("ok", fn(*args, **kwargs)))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+
+def run_isolated(fn, *args, **kwargs):
+    """fn(*args) in a throwaway process when workers are enabled, so a crashing conversion cannot take serving down."""
+    if not enabled():
+        return fn(*args, **kwargs)
+    parent, child = _CTX.Pipe(duplex=False)
+    p = _CTX.Process(target=_isolated_main, args=(child, fn, args, kwargs), daemon=True)
+    p.start()
+    child.close()
+    try:
+        status, value = parent.recv()
+    except EOFError:
+        p.join()
+        raise RuntimeError(f"conversion process exited with code {p.exitcode}")
+    p.join()
+    if status != "ok":
+        raise RuntimeError(value)
+    return value
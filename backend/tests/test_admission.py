@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+
+from backend.services.admission import AdmissionController, AdmissionRejected
+
+
+class AdmissionTests(unittest.TestCase):
+    def test_priority_order_when_slot_frees(self):
+        ctl = AdmissionController(slots=1)
+        busy = ctl.request("maintenance")
+        self.assertTrue(busy.wait(0))
+        order = []
+        def run(ticket, name):
+            ticket.wait(2.0)
+            order.append(name)
+            # hand the slot on so the next class can run
+            ticket.release()
+        ths = []
+        for c in ("warmup", "batch", "interactive"):
+            th = threading.Thread(target=run, args=(ctl.request(c), c), daemon=True)
+            th.start()
+            ths.append(th)
+        time.sleep(0.05)
+        self.assertEqual(order, [])
+        busy.release()
+        for th in ths:
+            th.join(2.0)
+        self.assertEqual(order, ["interactive", "batch", "warmup"])
+
+    def test_release_while_queued_wakes_waiter(self):
+        ctl = AdmissionController(slots=1)
+        busy = ctl.request("interactive")
+        busy.wait()
+        queued = ctl.request("batch")
+        res = []
+        th = threading.Thread(target=lambda: res.append(queued.wait()), daemon=True)
+        th.start()
+        time.sleep(0.05)
+        queued.release()
+        th.join(1.0)
+        self.assertFalse(th.is_alive())
+        self.assertEqual(res, [False])
+
+    def test_class_caps_leave_room_for_interactive(self):
+        ctl = AdmissionController(slots=2)
+        m1 = ctl.request("maintenance")
+        m2 = ctl.request("maintenance")
+        self.assertTrue(m1.wait(0))
+        self.assertFalse(m2.wait(0.02))
+        self.assertTrue(ctl.request("interactive").wait(0))
+        m1.release()
+        self.assertTrue(m2.wait(0.5))
+
+    def test_fair_share_between_clients(self):
+        ctl = AdmissionController(slots=2, client_max=1, client_queue=2)
+        a1 = ctl.request("interactive", "a")
+        a2 = ctl.request("interactive", "a")
+        self.assertTrue(a1.wait(0))
+        self.assertFalse(a2.wait(0.02))
+        b1 = ctl.request("interactive", "b")
+        self.assertTrue(b1.wait(0))
+        ctl.request("interactive", "a")
+        with self.assertRaises(AdmissionRejected) as cm:
+            ctl.request("interactive", "a")
+        self.assertEqual(cm.exception.reason, "client_queue_full")
+
+    def test_unreachable_deadline_rejected_early(self):
+        ctl = AdmissionController(slots=1)
+        t = ctl.request("interactive")
+        t.wait()
+        time.sleep(0.05)
+        t.release()
+        busy = ctl.request("interactive")
+        busy.wait()
+        with self.assertRaises(AdmissionRejected) as cm:
+            ctl.request("interactive", deadline_ms=5)
+        self.assertEqual(cm.exception.reason, "deadline_unreachable")
+        self.assertIsNotNone(cm.exception.retry_after_s)
+        ok = ctl.request("interactive", deadline_ms=5000)
+        busy.release()
+        self.assertTrue(ok.wait(0.5))
+
+    def test_deadline_expires_in_queue(self):
+        ctl = AdmissionController(slots=1)
+        busy = ctl.request("interactive")
+        busy.wait()
+        late = ctl.request("interactive", deadline_ms=30)
+        with self.assertRaises(AdmissionRejected) as cm:
+            late.wait()
+        self.assertEqual(cm.exception.reason, "deadline_expired")
+        self.assertEqual(ctl.stats()["queued"]["interactive"], 0)
+
+    def test_queue_wait_is_measured(self):
+        ctl = AdmissionController(slots=1)
+        busy = ctl.request("interactive")
+        busy.wait()
+        nxt = ctl.request("batch")
+        threading.Timer(0.05, busy.release).start()
+        nxt.wait(1.0)
+        self.assertGreaterEqual(nxt.wait_ms, 40)
+        st = ctl.stats()
+        self.assertGreaterEqual(st["queue_wait"]["batch"]["avg_ms"], 40)
+        self.assertEqual(st["active"]["batch"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
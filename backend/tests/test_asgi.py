@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+import unittest
+
+from backend.asgi import AsgiApp, build_environ
+from backend.services.streaming import Park, ParkingStream, Signal, TokenChannel
+from backend.utils.tasks import task_store
+
+
+async def _call(app, path, query=b"", method="GET", body=b"", disconnect=None):
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "headers": [(b"content-type", b"application/json")]}
+    sent = []
+    first = {"done": False}
+
+    async def receive():
+        if not first["done"]:
+            first["done"] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        if disconnect is not None:
+            await disconnect.wait()
+        else:
+            await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(msg):
+        sent.append(msg)
+
+    await app(scope, receive, send)
+    status = sent[0]["status"]
+    return status, b"".join(m.get("body", b"") for m in sent[1:]).decode("utf-8")
+
+
+class AsgiTests(unittest.TestCase):
+    def setUp(self):
+        from backend.app import app
+        self.app = AsgiApp(app, workers=2, max_connections=100)
+
+    def test_plain_route(self):
+        status, body = asyncio.run(_call(self.app, "/api/perf"))
+        self.assertEqual(status, 200)
+        self.assertIn("admission", json.loads(body))
+
+    def test_idle_task_streams_hold_no_worker(self):
+        async def run():
+            tids = [task_store.create("unit") for _ in range(30)]
+            streams = [asyncio.ensure_future(_call(self.app, f"/api/tasks/stream/{t}")) for t in tids]
+            await asyncio.sleep(0.2)
+            self.assertEqual(self.app.stats()["parked"], 30)
+            # 30 open streams, 2 workers: plain requests still get through
+            status, _ = await asyncio.wait_for(_call(self.app, "/api/perf"), 2.0)
+            self.assertEqual(status, 200)
+            self.assertLess(threading.active_count(), 30)
+            for t in tids:
+                task_store.complete(t, result="ok")
+            return await asyncio.wait_for(asyncio.gather(*streams), 5.0)
+        results = asyncio.run(run())
+        self.assertTrue(all('"completed"' in body for _, body in results))
+        self.assertEqual(self.app.stats()["streams"], 0)
+
+    def test_disconnect_closes_generator(self):
+        closed = threading.Event()
+        sig = Signal()
+
+        def gen():
+            try:
+                yield "data: 1\n\n"
+                yield Park(sig)
+                yield "data: 2\n\n"
+            finally:
+                closed.set()
+
+        async def run():
+            gone = asyncio.Event()
+            sent = []
+
+            async def receive():
+                await gone.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(msg):
+                sent.append(msg)
+
+            task = asyncio.ensure_future(self.app._drive(gen(), receive, send))
+            await asyncio.sleep(0.05)
+            gone.set()
+            await asyncio.wait_for(task, 2.0)
+            return sent
+
+        sent = asyncio.run(run())
+        self.assertTrue(closed.is_set())
+        self.assertEqual([m["body"] for m in sent], [b"data: 1\n\n"])
+
+    def test_environ(self):
+        env = build_environ({"method": "POST", "path": "/api/x", "query_string": b"a=1", "headers": [(b"x-client-id", b"c1"), (b"content-type", b"application/json")]}, b"{}")
+        self.assertEqual(env["HTTP_X_CLIENT_ID"], "c1")
+        self.assertEqual(env["CONTENT_LENGTH"], "2")
+        self.assertEqual(env["QUERY_STRING"], "a=1")
+
+
+class ParkedChannelTests(unittest.TestCase):
+    def test_parked_chunks_match_chunks(self):
+        chan = TokenChannel(window_ms=0, max_tokens=4)
+        def producer():
+            for i in range(10):
+                chan.put(str(i))
+            chan.close()
+        threading.Timer(0.02, producer).start()
+        out = "".join(text for _, text, _ in ParkingStream(chan.parked_chunks()))
+        self.assertEqual(out, "0123456789")
+
+    def test_poll_parks_on_empty(self):
+        chan = TokenChannel(window_ms=50, max_tokens=4)
+        batches, park = chan.poll()
+        self.assertEqual(batches, [])
+        self.assertIsNone(park.timeout)
+        chan.put("a")
+        self.assertTrue(park.signal.is_set())
+        batches, park = chan.poll()
+        self.assertEqual(batches, [])
+        self.assertGreater(park.timeout, 0)
+        chan.close()
+        self.assertEqual(chan.poll()[0], [("token", "a", 1)])
+        self.assertEqual(chan.poll(), (None, None))
+
+if __name__ == "__main__":
+    unittest.main()
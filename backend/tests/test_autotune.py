@@ -0,0 +1,94 @@
+import json
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from backend.services import autotune, inference
+from backend.utils.tasks import task_store
+
+
+class AutotuneTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model = Path(self.tmp.name)
+        self.loaded = []
+        self.host = autotune.host_id()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _fake_load(self, model_dir, device, cfg, reconfigure=True):
+        self.assertFalse(reconfigure)
+        self.assertTrue(cfg.get("autotune_candidate"))
+        self.loaded.append(dict(cfg.get("device_props") or {}))
+        return types.SimpleNamespace(_af_props=dict(cfg.get("device_props") or {}))
+
+    @staticmethod
+    def _fake_generate(pipe, prompt, cfg):
+        props = pipe._af_props
+        tps = 10.0
+        if props.get("INFERENCE_NUM_THREADS") == "4":
+            tps += 5.0
+        if props.get("NUM_STREAMS") == "2":
+            tps -= 3.0
+        if props.get("INFERENCE_PRECISION_HINT") == "bf16":
+            tps += 2.0
+        return "ok", {"ttft_ms": 1000.0 / tps, "tpot_ms": 1000.0 / tps, "throughput_tps": tps}
+
+    def _sweep(self, config=None):
+        topo = {"cpu_caps": ["FP32", "BF16"]}
+        tid = task_store.create("autotune")
+        with patch.object(inference, "load_pipeline", self._fake_load), \
+             patch.object(inference, "submit_generation", self._fake_generate), \
+             patch("backend.services.system.get_device_topology", lambda *a, **k: topo), \
+             patch("os.cpu_count", lambda: 8):
+            autotune.run_autotune(tid, self.model, "CPU", config or {"prompt_lengths": [16, 64]})
+        return task_store.get(tid)
+
+    def test_sweep_writes_best_profile(self):
+        t = self._sweep()
+        self.assertEqual(t["status"], "completed", t.get("error"))
+        props = t["result"]["props"]
+        self.assertEqual(props, {"INFERENCE_NUM_THREADS": "4", "INFERENCE_PRECISION_HINT": "bf16"})
+        self.assertEqual(self.loaded[0], {})
+        data = json.loads((self.model / autotune.PROFILE_NAME).read_text(encoding="utf-8"))
+        prof = data["profiles"][f"{autotune.host_id()}/CPU"]
+        self.assertEqual(prof["prompt_lengths"], [16, 64])
+        self.assertGreater(prof["best"]["throughput_tps"], prof["baseline"]["throughput_tps"])
+        self.assertIn("64", prof["results"][0]["by_length"])
+
+    def test_sweep_keeps_serving_pipeline_resident(self):
+        live = object()
+        key = (str(self.model), "CPU", "live")
+        inference._pipe_cache[key] = live
+        try:
+            self.assertEqual(self._sweep()["status"], "completed")
+            self.assertIs(inference._pipe_cache.get(key), live)
+        finally:
+            inference._pipe_cache.pop(key, None)
+
+    def test_profile_is_applied_per_device_and_host(self):
+        self._sweep()
+        self.assertEqual(autotune.device_profile(self.model, "CPU")["INFERENCE_PRECISION_HINT"], "bf16")
+        self.assertEqual(autotune.device_profile(self.model, "GPU.0"), {})
+        self.assertEqual(autotune.device_profile(self.model, "HETERO:GPU,CPU"), {})
+        with patch.object(autotune, "host_id", lambda: "otherhost"):
+            self.assertEqual(autotune.device_profile(self.model, "CPU"), {})
+
+    def test_explicit_config_wins(self):
+        autotune.write_profile(self.model, "NPU", {"props": {"NPU_TILES": "4", "NUM_REQUESTS": "8"}})
+        got = autotune.device_profile(self.model, "NPU", {"npu_tiles": 2})
+        self.assertEqual(got, {"NUM_REQUESTS": "8"})
+
+    def test_sweep_space(self):
+        dims = dict(autotune.sweep_space("NPU", {"npu_arch": "4000"}))
+        self.assertEqual(dims["NPU_TILES"], ["2", "4"])
+        with patch("os.cpu_count", lambda: 2):
+            dims = dict(autotune.sweep_space("CPU", {}))
+        self.assertNotIn("INFERENCE_NUM_THREADS", dims)
+        self.assertNotIn("INFERENCE_PRECISION_HINT", dims)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+from backend.services import batch, inference
+from backend.utils.tasks import task_store
+
+
+class _BatchPipe:
+    def __init__(self):
+        self.calls = []
+
+    def get_generation_config(self):
+        return types.SimpleNamespace()
+
+    def generate(self, prompts, gen=None, streamer=None):
+        self.calls.append(list(prompts))
+        return types.SimpleNamespace(texts=[p.upper() for p in prompts])
+
+
+class BatchJobTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.inp = self.root / "in.jsonl"
+        with open(self.inp, "w", encoding="utf-8") as f:
+            for i in range(7):
+                f.write(json.dumps({"id": "p%d" % i, "prompt": "q%d" % i}) + "\n")
+        self.out = self.root / "out.jsonl"
+        self.pipe = _BatchPipe()
+        self.loaded = []
+        self._orig = inference.load_pipeline
+        inference.load_pipeline = lambda d, dev, cfg, reconfigure=True: (self.loaded.append((cfg, reconfigure)), self.pipe)[1]
+
+    def tearDown(self):
+        inference.load_pipeline = self._orig
+        inference._drop_scheduler(self.pipe)
+        self.tmp.cleanup()
+
+    def _rows(self):
+        return [json.loads(l) for l in self.out.read_text(encoding="utf-8").splitlines()]
+
+    def test_batches_and_throughput_hint(self):
+        tid = task_store.create("batch")
+        batch.run_batch_job(tid, self.root, "CPU", self.inp, self.out, {"max_new_tokens": 4}, batch_size=3)
+        t = task_store.get(tid)
+        self.assertEqual(t["status"], "completed")
+        self.assertEqual([len(c) for c in self.pipe.calls], [3, 3, 1])
+        self.assertEqual(self.loaded[0], ({"max_new_tokens": 4, "perf_mode": "THROUGHPUT", "prefill_igpu_decode_npu": False}, False))
+        rows = self._rows()
+        self.assertEqual([r["index"] for r in rows], list(range(7)))
+        self.assertEqual(rows[2], {"index": 2, "id": "p2", "output": "Q2"})
+
+    def test_resume_skips_done_rows_and_torn_line(self):
+        with open(self.out, "w", encoding="utf-8") as f:
+            for i in range(4):
+                f.write(json.dumps({"index": i, "id": "p%d" % i, "output": "old"}) + "\n")
+            f.write('{"index": 4, "id": "p4", "out')
+        self.assertEqual(batch.resume_offset(self.out), 4)
+        tid = task_store.create("batch")
+        batch.run_batch_job(tid, self.root, "HETERO:GPU,CPU", self.inp, self.out, {}, batch_size=8)
+        self.assertEqual(self.pipe.calls, [["q4", "q5", "q6"]])
+        self.assertEqual(self.loaded[0][0]["perf_mode"], "CUMULATIVE_THROUGHPUT")
+        self.assertEqual([r["index"] for r in self._rows()], list(range(7)))
+        self.assertEqual(task_store.get(tid)["result"]["resumed_from"], 4)
+
+class BatchApiPathTests(unittest.TestCase):
+    def setUp(self):
+        import os
+        from unittest import mock
+        from backend import app as app_mod
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        (root / "models" / "unit").mkdir(parents=True)
+        for p in (mock.patch.object(app_mod, "MODELS_DIR", root / "models"),
+                  mock.patch.dict(os.environ, {"AIFUNLAND_CACHE_DIR": str(root / "cache")})):
+            p.start()
+            self.addCleanup(p.stop)
+        self.client = app_mod.app.test_client()
+        self.job = root / "cache" / "jobs" / "j1"
+        self.job.mkdir(parents=True)
+        (self.job / "mine.jsonl").write_text('{"prompt": "q"}\n', encoding="utf-8")
+        (root / "secret.jsonl").write_text('{"prompt": "s"}\n', encoding="utf-8")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _post(self, **kw):
+        return self.client.post("/api/jobs/batch", json={"model_id": "unit", "job_id": "j1", **kw})
+
+    def test_paths_outside_job_dir_are_rejected(self):
+        for kw in ({"input_path": "../../../secret.jsonl"}, {"input_path": str(Path(self.tmp.name) / "secret.jsonl")},
+                   {"input_path": "mine.jsonl", "output_path": "/tmp/out.jsonl"}, {"input_path": "mine.jsonl", "output_path": "../x.jsonl"}):
+            r = self._post(**kw)
+            self.assertEqual(r.status_code, 400, kw)
+            self.assertEqual(r.get_json()["error"], "invalid_parameter")
+
+    def test_relative_paths_resolve_in_job_dir(self):
+        from unittest import mock
+        with mock.patch("threading.Thread") as th:
+            r = self._post(input_path="mine.jsonl", output_path="sub/out.jsonl")
+        self.assertEqual(r.status_code, 200)
+        args = th.call_args.kwargs["args"]
+        self.assertEqual(args[5], (self.job / "mine.jsonl").resolve())
+        self.assertEqual(args[6], (self.job / "sub" / "out.jsonl").resolve())
+
+if __name__ == "__main__":
+    unittest.main()
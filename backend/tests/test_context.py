@@ -0,0 +1,158 @@
+import threading
+import types
+import unittest
+from pathlib import Path
+
+from backend.services import context, inference
+
+
+class _Tokenizer:
+    # one token per whitespace-separated word
+    def encode(self, text):
+        return types.SimpleNamespace(input_ids=types.SimpleNamespace(shape=(1, len(text.split()))))
+
+
+def _flat(n_turns, words=10):
+    lines = ["You are a context-aware assistant."]
+    for i in range(n_turns):
+        lines.append("User: " + " ".join(["q%d" % i] * words))
+        lines.append("Assistant: " + " ".join(["a%d" % i] * words))
+    lines.append("User: latest question")
+    return "\n".join(lines)
+
+
+class ContextWindowTests(unittest.TestCase):
+    def setUp(self):
+        self.count = context.TokenCounter(_Tokenizer())
+
+    def test_short_prompt_is_untouched(self):
+        p = _flat(2)
+        out, info = context.fit_prompt(p, {"context_budget": 1000}, self.count)
+        self.assertEqual(out, p)
+        self.assertEqual(info["trimmed_tokens"], 0)
+
+    def test_oldest_turns_are_dropped_to_budget(self):
+        p = _flat(10)
+        out, info = context.fit_prompt(p, {"context_budget": 100}, self.count)
+        self.assertGreater(info["trimmed_tokens"], 0)
+        self.assertLessEqual(info["prompt_tokens"], 100)
+        self.assertNotIn("q0", out)
+        self.assertIn("a9", out)
+        self.assertTrue(out.startswith("You are a context-aware assistant."))
+        self.assertTrue(out.endswith("User: latest question"))
+
+    def test_npu_budget_follows_max_prompt_len(self):
+        self.assertEqual(context.context_budget({"max_prompt_len": 512}), 480)
+        self.assertIsNone(context.context_budget({"context_budget": 0}))
+
+    def test_summary_replaces_dropped_turns_once_ready(self):
+        done = threading.Event()
+        def summarize(text):
+            done.set()
+            return "earlier we talked about q0"
+        p = _flat(10)
+        _, info = context.fit_prompt(p, {"context_budget": 100}, self.count, summarize)
+        self.assertEqual(info["summary"], "pending")
+        self.assertTrue(done.wait(5))
+        for _ in range(100):
+            if not context.summarizer.stats()["pending"]:
+                break
+            threading.Event().wait(0.01)
+        out, info = context.fit_prompt(p, {"context_budget": 100}, self.count, summarize)
+        self.assertEqual(info["summary"], "used")
+        self.assertIn("Summary of earlier conversation: earlier we talked about q0", out)
+
+    def test_summaries_extend_from_the_last_boundary(self):
+        from unittest import mock
+        texts = []
+        def summarize(text):
+            texts.append(text)
+            return "summary %d" % len(texts)
+        def settle():
+            for _ in range(500):
+                if not context.summarizer.stats()["pending"]:
+                    return
+                threading.Event().wait(0.01)
+        with mock.patch.object(context, "summarizer", context.Summarizer()):
+            context.fit_prompt(_flat(10), {"context_budget": 100}, self.count, summarize)
+            settle()
+            # same drop point next turn: the summary is reused, nothing is regenerated
+            _, info = context.fit_prompt(_flat(10) + "\nAssistant: ok", {"context_budget": 100}, self.count, summarize)
+            self.assertEqual(info["summary"], "used")
+            out, info = context.fit_prompt(_flat(16), {"context_budget": 100}, self.count, summarize)
+            self.assertEqual(info["summary"], "partial")
+            self.assertIn("summary 1", out)
+            settle()
+        self.assertEqual(len(texts), 2)
+        self.assertIn("q0", texts[0])
+        self.assertTrue(texts[1].startswith("Summary of earlier conversation: summary 1"))
+        self.assertNotIn("q0", texts[1])
+
+    def test_counter_is_thread_safe(self):
+        count = context.TokenCounter(_Tokenizer(), max_items=8)
+        def run(base):
+            for i in range(2000):
+                count("w " * ((base + i) % 40 + 1))
+        threads = [threading.Thread(target=run, args=(b,)) for b in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLessEqual(len(count._memo), 8)
+        self.assertEqual(count("w " * 5), 5)
+
+    def test_history_is_trimmed_in_pairs(self):
+        hist = []
+        for i in range(6):
+            hist += [{"role": "user", "content": "u " * 10}, {"role": "assistant", "content": "a " * 10}]
+        kept, summary, info = context.fit_history("", hist, "next", {"context_budget": 60}, self.count)
+        self.assertEqual(len(kept) % 2, 0)
+        self.assertEqual(kept[0]["role"], "user")
+        self.assertEqual(info["dropped_turns"], len(hist) - len(kept))
+        self.assertIsNone(summary)
+
+
+class _ChatPipe:
+    def __init__(self):
+        self.calls = []
+        self.chat_starts = 0
+
+    def get_tokenizer(self):
+        return _Tokenizer()
+
+    def get_generation_config(self):
+        return types.SimpleNamespace()
+
+    def start_chat(self, system=""):
+        self.chat_starts += 1
+
+    def finish_chat(self):
+        pass
+
+    def generate(self, prompt, gen=None, streamer=None):
+        self.calls.append(prompt)
+        return types.SimpleNamespace(text="w " * 20)
+
+
+class SessionContextTests(unittest.TestCase):
+    def tearDown(self):
+        with inference._session_lock:
+            inference._chat_sessions.clear()
+
+    def test_session_over_budget_restarts_chat_with_trimmed_history(self):
+        pipe = _ChatPipe()
+        sess = inference.create_chat_session(Path("m"), "CPU")
+        cfg = {"context_budget": 70}
+        modes = []
+        for i in range(4):
+            _, m = inference.session_generate(sess, pipe, "question %d" % i, cfg)
+            modes.append(m["prefill_mode"])
+        self.assertEqual(modes[:2], ["full", "incremental"])
+        self.assertIn("full", modes[2:])
+        self.assertGreater(sum(1 for m in modes if m == "full"), 1)
+        self.assertLessEqual(len(sess["history"]), 6)
+        self.assertGreater(m["context"]["budget"], 0)
+        inference._drop_scheduler(pipe)
+
+if __name__ == "__main__":
+    unittest.main()
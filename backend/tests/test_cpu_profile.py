@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+
+from backend.services import system
+from backend.services.system import cpu_isa, cpu_profile
+
+
+SPR = "fpu sse2 avx2 avx512f avx512_vnni avx512_bf16 amx_bf16 amx_tile amx_int8 avx_vnni"
+ICL = "fpu sse2 avx2 avx512f avx512_vnni"
+ADL = "fpu sse2 avx2 avx_vnni"
+
+
+class CpuProfileTests(unittest.TestCase):
+    def _isa(self, flags):
+        cpu_isa.cache_clear()
+        self.addCleanup(cpu_isa.cache_clear)
+        p = mock.patch.object(system, "_proc_cpuinfo", return_value={"model name": "x", "flags": flags})
+        p.start()
+        self.addCleanup(p.stop)
+
+    def test_isa_tiers(self):
+        for flags, tier in ((SPR, "amx_bf16"), (ICL, "avx512_vnni"), (ADL, "avx2_vnni"), ("fpu sse2", "baseline")):
+            self._isa(flags)
+            self.assertEqual(cpu_isa()["isa"], tier)
+
+    def test_sapphire_rapids_gets_bf16_and_u8_kv(self):
+        self._isa(SPR)
+        prof = cpu_profile()
+        self.assertEqual(prof["name"], "amx_bf16")
+        self.assertEqual(prof["props"]["INFERENCE_PRECISION_HINT"], "bf16")
+        self.assertEqual(prof["props"]["KV_CACHE_PRECISION"], "u8")
+
+    def test_request_overrides(self):
+        self._isa(SPR)
+        prof = cpu_profile({"inference_precision": "f32", "dq_group_size": 0})
+        self.assertEqual(prof["props"]["INFERENCE_PRECISION_HINT"], "f32")
+        self.assertEqual(prof["props"]["DYNAMIC_QUANTIZATION_GROUP_SIZE"], "0")
+        self.assertEqual(cpu_profile({"cpu_profile": "avx2"})["props"]["INFERENCE_PRECISION_HINT"], "f32")
+        self.assertEqual(cpu_profile({"cpu_profile": "off"})["props"], {})
+        self.assertEqual(cpu_profile({"cpu_profile": "bogus"})["name"], "amx_bf16")
+
+    def test_unknown_isa_keeps_plugin_defaults(self):
+        self._isa("fp asimd")
+        self.assertEqual(cpu_profile()["props"], {})
+
+    def test_reported_in_system_info(self):
+        from backend.app import app
+        j = app.test_client().get("/api/system/info").get_json()
+        self.assertIn("isa", j["cpu_isa"])
+        self.assertEqual(j["cpu_profile"]["isa"], j["cpu_isa"]["isa"])
+
+if __name__ == "__main__":
+    unittest.main()
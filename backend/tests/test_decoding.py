@@ -0,0 +1,119 @@
+import json
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+from backend.services import inference
+
+
+def _ir_dir(root, name, vocab):
+    d = root / name
+    d.mkdir()
+    (d / "openvino_model.xml").write_text("<net/>")
+    (d / "tokenizer.json").write_text(json.dumps({"model": {"vocab": vocab}, "added_tokens": []}))
+    return d
+
+
+class _Counter:
+    def __init__(self, n):
+        self.n = n
+
+    def get_num_generated_tokens(self):
+        return self.n
+
+
+class _Result:
+    def __init__(self, text, accepted=None, drafted=None):
+        self.text = text
+        if accepted is not None:
+            self.extended_perf_metrics = types.SimpleNamespace(
+                get_num_accepted_tokens=lambda: accepted,
+                draft_model_metrics=_Counter(drafted),
+            )
+
+
+class _Pipe:
+    def __init__(self, res):
+        self.res = res
+        self.gen = None
+
+    def get_generation_config(self):
+        return types.SimpleNamespace(num_assistant_tokens=0)
+
+    def generate(self, prompt, gen=None, streamer=None):
+        self.gen = gen
+        return self.res
+
+
+class SpeculativeDecodingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_draft_with_same_vocab_is_accepted(self):
+        target = _ir_dir(self.root, "org__big", {"a": 0, "b": 1})
+        _ir_dir(self.root, "org__small", {"a": 0, "b": 1})
+        d, note = inference._resolve_draft_model(self.root, "org/small", target)
+        self.assertEqual(d.name, "org__small")
+        self.assertIsNone(note)
+
+    def test_tokenizer_mismatch_falls_back(self):
+        target = _ir_dir(self.root, "org__big", {"a": 0, "b": 1})
+        _ir_dir(self.root, "other__small", {"x": 0})
+        d, note = inference._resolve_draft_model(self.root, "other/small", target)
+        self.assertIsNone(d)
+        self.assertEqual(note, "tokenizer_mismatch")
+
+    def test_missing_draft_falls_back(self):
+        target = _ir_dir(self.root, "org__big", {"a": 0})
+        d, note = inference._resolve_draft_model(self.root, "org/none", target)
+        self.assertIsNone(d)
+        self.assertEqual(note, "draft_not_found")
+
+    def test_acceptance_rate_reported(self):
+        pipe = _Pipe(_Result("ok", accepted=30, drafted=40))
+        inference._set_pipe_meta(pipe, speculative="org__small")
+        try:
+            text, metrics = inference.generate(pipe, "hi", {"num_assistant_tokens": 4})
+        finally:
+            inference._forget_pipe(pipe)
+        self.assertEqual(text, "ok")
+        self.assertEqual(pipe.gen.num_assistant_tokens, 4)
+        self.assertAlmostEqual(metrics["acceptance_rate"], 0.75)
+        self.assertEqual(metrics["draft_model"], "org__small")
+
+    def test_fallback_reason_reported(self):
+        pipe = _Pipe(_Result("ok"))
+        inference._set_pipe_meta(pipe, speculative=None, speculative_fallback="tokenizer_mismatch")
+        try:
+            _, metrics = inference.generate(pipe, "hi", {"num_assistant_tokens": 4})
+        finally:
+            inference._forget_pipe(pipe)
+        self.assertEqual(metrics["speculative_fallback"], "tokenizer_mismatch")
+        self.assertEqual(pipe.gen.num_assistant_tokens, 0)
+
+
+class PromptLookupTests(unittest.TestCase):
+    def test_lookup_config_and_ratio(self):
+        res = types.SimpleNamespace(
+            text="copied",
+            extended_perf_metrics=types.SimpleNamespace(get_num_accepted_tokens=lambda: 12),
+            perf_metrics=types.SimpleNamespace(get_num_generated_tokens=lambda: 16),
+        )
+        pipe = _Pipe(res)
+        inference._set_pipe_meta(pipe, prompt_lookup=True)
+        try:
+            _, metrics = inference.generate(pipe, "hi", {"max_ngram_size": 4, "num_candidates": 8})
+        finally:
+            inference._forget_pipe(pipe)
+        self.assertEqual(pipe.gen.max_ngram_size, 4)
+        self.assertEqual(pipe.gen.num_assistant_tokens, 8)
+        self.assertEqual(metrics["decode_mode"], "prompt_lookup")
+        self.assertAlmostEqual(metrics["accepted_ratio"], 0.75)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from backend.services.docindex import DocIndex, chunk_text, terms
+
+
+class DocIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.docs = root / "docs"
+        self.docs.mkdir()
+        (self.docs / "npu.md").write_text("# NPU guide\n\nThe NPU runs static shapes. Set MAX_PROMPT_LEN for long prompts.\n\nTiles and turbo tune NPU throughput.", encoding="utf-8")
+        (self.docs / "cpu.txt").write_text("CPU inference uses threads and streams.\n\nBF16 helps on Sapphire Rapids.", encoding="utf-8")
+        (self.docs / "zh.txt").write_text("量化模型可以降低内存占用。", encoding="utf-8")
+        (self.docs / "skip.bin").write_bytes(b"\x00\x01")
+        self.idx = DocIndex(root / "index")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bm25_ranks_matching_chunk_first(self):
+        r = self.idx.ingest(self.docs)
+        self.assertEqual(r["files"], 3)
+        hits = self.idx.search("npu tiles turbo", k=3)
+        self.assertEqual(hits[0]["title"], "NPU guide")
+        self.assertIn("Tiles", hits[0]["snippet"])
+        self.assertEqual(set(hits[0]), {"title", "url", "snippet", "score"})
+        self.assertEqual(self.idx.search("内存", k=1)[0]["title"], "zh")
+        self.assertEqual(self.idx.search("nothing matches this"), [])
+
+    def test_incremental_reindex_by_mtime(self):
+        self.idx.ingest(self.docs)
+        self.assertEqual(self.idx.ingest(self.docs)["files"], 0)
+        p = self.docs / "cpu.txt"
+        p.write_text("CPU inference now prefers AMX kernels.", encoding="utf-8")
+        st = p.stat()
+        os.utime(p, (st.st_atime, st.st_mtime + 5))
+        r = self.idx.ingest(self.docs)
+        self.assertEqual(r["files"], 1)
+        self.assertEqual(self.idx.search("amx")[0]["title"], "cpu")
+        self.assertEqual(self.idx.search("sapphire"), [])
+        (self.docs / "zh.txt").unlink()
+        self.assertEqual(self.idx.ingest(self.docs)["removed"], 1)
+        self.assertEqual(self.idx.search("内存"), [])
+
+    def test_reopen_and_compact(self):
+        self.idx.ingest(self.docs)
+        (self.docs / "more.txt").write_text("Streams and threads again.", encoding="utf-8")
+        self.idx.ingest(self.docs)
+        self.assertEqual(self.idx.stats()["segments"], 2)
+        self.idx.compact()
+        again = DocIndex(self.idx.root)
+        st = again.stats()
+        self.assertEqual(st["segments"], 1)
+        self.assertEqual(st["documents"], 4)
+        self.assertEqual(again.search("npu tiles")[0]["title"], "NPU guide")
+
+    def test_compaction_waits_for_running_search(self):
+        self.idx.ingest(self.docs)
+        (self.docs / "more.txt").write_text("Turbo mode on the NPU.", encoding="utf-8")
+        self.idx.ingest(self.docs)
+        segs = self.idx._acquire()
+        self.idx.compact()
+        old = [s for s in segs if s.retired]
+        self.assertTrue(old)
+        # a search that started before the compaction can still read its chunks
+        self.assertTrue(all(s.dir.exists() for s in old))
+        self.assertIn("snippet", old[0].chunk(0))
+        self.idx._release(segs)
+        self.assertFalse(any(s.dir.exists() for s in old))
+        self.assertEqual(self.idx.search("turbo", k=5)[0]["title"], "more")
+
+    def test_chunking_and_terms(self):
+        parts = list(chunk_text("a" * 50 + ". " + "b" * 50 + "\n\n" + "c" * 30, max_chars=60))
+        self.assertTrue(all(len(p) <= 60 for p in parts))
+        self.assertEqual(terms("Hello 世界和平"), ["hello", "世界", "界和", "和平"])
+
+    def test_query_latency_on_large_segment(self):
+        words = ["w%d" % i for i in range(5000)]
+        chunks = 20000
+        big = self.docs / "big"
+        big.mkdir()
+        with open(big / "big.txt", "w", encoding="utf-8") as f:
+            for i in range(chunks):
+                f.write(" ".join(words[(i * 7 + j * 13) % 5000] for j in range(40)) + "\n\n")
+        idx = DocIndex(Path(self.tmp.name) / "big_index", chunk_chars=300)
+        idx.ingest(big)
+        idx.search("w1 w2 w3")
+        t0 = time.perf_counter()
+        for _ in range(20):
+            idx.search("w1 w2 w3 w4")
+        self.assertLess((time.perf_counter() - t0) / 20 * 1000.0, 50.0)
+
+if __name__ == "__main__":
+    unittest.main()
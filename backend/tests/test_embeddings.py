@@ -0,0 +1,98 @@
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from backend.services import inference
+from backend.services.embeddings import EmbeddingService, quantize_int8
+
+
+class _EmbedPipe:
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        return [[float(len(t)), 1.0, -2.0] for t in texts]
+
+
+class EmbeddingServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.pipe = _EmbedPipe(delay=0.01)
+        self._patch = patch.object(inference, "load_embedding_pipeline", lambda d, dev, cfg: self.pipe)
+        self._patch.start()
+
+    def tearDown(self):
+        self._patch.stop()
+
+    def test_concurrent_requests_share_one_call(self):
+        svc = EmbeddingService(max_batch=64, max_wait_ms=50)
+        out = {}
+        def worker(i):
+            out[i] = svc.embed(Path("m"), ["t%d" % i, "x" * i])
+        ths = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in ths:
+            t.start()
+        for t in ths:
+            t.join()
+        self.assertLessEqual(len(self.pipe.calls), 2)
+        self.assertEqual(out[3].shape, (2, 3))
+        self.assertEqual(out[5][1][0], 5.0)
+        self.assertGreater(svc.stats()["avg_batch"], 2)
+
+    def test_max_batch_splits_large_request(self):
+        svc = EmbeddingService(max_batch=4, max_wait_ms=0)
+        vecs = svc.embed(Path("m"), ["a%d" % i for i in range(10)])
+        self.assertEqual(vecs.shape, (10, 3))
+        self.assertEqual([len(c) for c in self.pipe.calls], [4, 4, 2])
+
+    def test_lru_cache_skips_model(self):
+        svc = EmbeddingService(max_wait_ms=0, cache_size=2)
+        svc.embed(Path("m"), ["a", "bb"])
+        svc.embed(Path("m"), ["bb", "a"])
+        self.assertEqual(len(self.pipe.calls), 1)
+        self.assertEqual(svc.stats()["cache_hits"], 2)
+        svc.embed(Path("m"), ["ccc"])
+        svc.embed(Path("m"), ["a"])
+        self.assertEqual(len(self.pipe.calls), 2)
+        svc.embed(Path("m"), ["bb"])
+        self.assertEqual(len(self.pipe.calls), 3)
+
+    def test_pipeline_options_get_their_own_batcher_and_cache(self):
+        pipes = {}
+        def load(d, dev, cfg):
+            return pipes.setdefault(inference.embedding_key(d, dev, cfg), _EmbedPipe())
+        svc = EmbeddingService(max_wait_ms=0)
+        with patch.object(inference, "load_embedding_pipeline", load):
+            svc.embed(Path("m"), ["a"], config={"max_length": 8})
+            svc.embed(Path("m"), ["a"], config={"max_length": 16})
+            svc.embed(Path("m"), ["a"], config={"max_length": 16, "pooling": "mean"})
+            svc.embed(Path("m"), ["a"], config={"max_length": 16})
+        self.assertEqual(len(pipes), 3)
+        self.assertEqual([len(p.calls) for p in pipes.values()], [1, 1, 1])
+        self.assertEqual(svc.stats()["cache_hits"], 1)
+
+    def test_errors_reach_caller(self):
+        class Bad:
+            def embed_documents(self, texts):
+                raise RuntimeError("boom")
+        svc = EmbeddingService(max_wait_ms=0)
+        with patch.object(inference, "load_embedding_pipeline", lambda d, dev, cfg: Bad()):
+            with self.assertRaises(RuntimeError):
+                svc.embed(Path("other"), ["a"])
+
+    def test_int8_roundtrip(self):
+        v = np.array([[0.5, -1.0, 0.25], [0.0, 0.0, 0.0]], dtype=np.float32)
+        q, scale = quantize_int8(v)
+        self.assertEqual(q.dtype, np.int8)
+        self.assertEqual(int(q[0][1]), -127)
+        np.testing.assert_allclose(q[0] * scale[0], v[0], atol=0.01)
+        self.assertTrue((q[1] == 0).all())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import threading
+import unittest
+from pathlib import Path
+
+from backend.services import inference
+
+
+class ReconfigureTests(unittest.TestCase):
+    def tearDown(self):
+        inference.release_model(Path("m-rc"))
+
+    def test_fingerprint_tracks_compile_properties(self):
+        a = inference._config_fingerprint({"PERFORMANCE_HINT": "LATENCY", "NUM_STREAMS": "1"}, {}, False)
+        b = inference._config_fingerprint({"NUM_STREAMS": "1", "PERFORMANCE_HINT": "LATENCY"}, {"temperature": 0.2}, False)
+        c = inference._config_fingerprint({"PERFORMANCE_HINT": "THROUGHPUT", "NUM_STREAMS": "1"}, {}, False)
+        d = inference._config_fingerprint({"PERFORMANCE_HINT": "LATENCY", "NUM_STREAMS": "1"}, {"max_prompt_len": 1024}, False)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+        self.assertNotEqual(a, d)
+
+    def test_lower_max_seqs_is_applied_at_runtime(self):
+        cfg4 = inference._config_fingerprint({}, {"cb_max_seqs": 4}, True)
+        cfg8 = inference._config_fingerprint({}, {"cb_max_seqs": 8}, True)
+        cfg12 = inference._config_fingerprint({}, {"cb_max_seqs": 12}, True)
+        self.assertEqual(cfg4, cfg8)
+        self.assertNotEqual(cfg8, cfg12)
+        engine = object.__new__(inference._BatchEngine)
+        engine.max_seqs, engine.seq_cap = 8, 8
+        inference._apply_runtime_settings(engine, {"max_seqs": 3})
+        self.assertEqual(engine.max_seqs, 3)
+        inference._apply_runtime_settings(engine, {"max_seqs": 64})
+        self.assertEqual(engine.max_seqs, 8)
+
+    def test_background_recompile_swaps_alias(self):
+        old_key = ("m-rc", "CPU", "aaaa")
+        new_key = ("m-rc", "CPU", "bbbb")
+        old_pipe, new_pipe = object(), object()
+        inference._pipe_cache[old_key] = old_pipe
+        self.assertEqual(inference._sibling_pipeline(new_key), (old_key, old_pipe))
+        # a generation still running on the old pipeline
+        busy = inference._scheduler_for(old_pipe)
+        busy.__enter__()
+        rkey = inference._request_key(Path("m-rc"), "CPU", {"perf_mode": "THROUGHPUT"})
+        inference._pipe_alias[rkey] = (old_key, None)
+        gate = threading.Event()
+        def fake_load(model_dir, device, config=None, reconfigure=True):
+            self.assertFalse(reconfigure)
+            gate.wait(5)
+            inference._pipe_cache[new_key] = new_pipe
+            return new_pipe, new_key
+        orig = inference._load_pipeline_uncached
+        inference._load_pipeline_uncached = fake_load
+        try:
+            inference._start_recompile(rkey, new_key, Path("m-rc"), "CPU", {"perf_mode": "THROUGHPUT"}, old_key=old_key)
+            inference._start_recompile(rkey, new_key, Path("m-rc"), "CPU", {"perf_mode": "THROUGHPUT"}, old_key=old_key)
+            self.assertIs(inference._cached_pipeline(rkey), old_pipe)
+            self.assertEqual(inference.reconfigure_stats()["pending"], 1)
+            gate.set()
+            for _ in range(200):
+                if not inference.reconfigure_stats()["pending"]:
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            inference._load_pipeline_uncached = orig
+        self.assertIs(inference._cached_pipeline(rkey), new_pipe)
+        # the old pipeline stays until its generation finishes, then is released
+        threading.Event().wait(0.2)
+        self.assertIs(inference._pipe_cache.get(old_key), old_pipe)
+        busy.__exit__(None, None, None)
+        for _ in range(200):
+            if old_key not in inference._pipe_cache:
+                break
+            threading.Event().wait(0.01)
+        self.assertNotIn(old_key, inference._pipe_cache)
+        self.assertIs(inference._pipe_cache.get(new_key), new_pipe)
+
+    def test_sibling_with_other_input_bounds_is_not_a_stand_in(self):
+        npu = object()
+        inference._set_pipe_meta(npu, input_bounds=inference._input_bounds({"max_prompt_len": 1024}))
+        self.assertTrue(inference._sibling_can_serve(npu, {"max_prompt_len": 1024, "perf_mode": "THROUGHPUT"}))
+        self.assertFalse(inference._sibling_can_serve(npu, {"max_prompt_len": 4096}))
+        self.assertFalse(inference._sibling_can_serve(npu, {}))
+        self.assertFalse(inference._sibling_can_serve(object(), {"min_response_len": 256}))
+        self.assertTrue(inference._sibling_can_serve(object(), {"perf_mode": "LATENCY"}))
+
+    def test_exact_load_waits_for_pending_recompile(self):
+        old_key = ("m-rc", "CPU", "aaaa")
+        new_key = ("m-rc", "CPU", "bbbb")
+        old_pipe, new_pipe = object(), object()
+        cfg = {"perf_mode": "THROUGHPUT"}
+        rkey = inference._request_key(Path("m-rc"), "CPU", cfg)
+        inference._pipe_cache[old_key] = old_pipe
+        inference._pipe_alias[rkey] = (old_key, None)
+        with inference._recompile_lock:
+            inference._recompiling[new_key] = {rkey}
+        calls = []
+        def fake_load(model_dir, device, config=None, reconfigure=True):
+            calls.append(reconfigure)
+            inference._pipe_cache[new_key] = new_pipe
+            return new_pipe, new_key
+        orig = inference._load_pipeline_uncached
+        inference._load_pipeline_uncached = fake_load
+        got = []
+        try:
+            th = threading.Thread(target=lambda: got.append(inference.load_pipeline(Path("m-rc"), "CPU", cfg, reconfigure=False)))
+            th.start()
+            th.join(0.1)
+            self.assertTrue(th.is_alive())
+            with inference._recompile_done:
+                inference._recompiling.pop(new_key, None)
+                inference._recompile_done.notify_all()
+            th.join(2.0)
+        finally:
+            inference._load_pipeline_uncached = orig
+        self.assertEqual(got, [new_pipe])
+        self.assertEqual(calls, [False])
+        self.assertIs(inference.load_pipeline(Path("m-rc"), "CPU", cfg), new_pipe)
+
+if __name__ == "__main__":
+    unittest.main()
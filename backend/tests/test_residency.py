@@ -0,0 +1,144 @@
+import tempfile
+import threading
+import types
+import unittest
+from pathlib import Path
+
+from backend.services import inference
+
+
+class ResidencyTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.mgr = inference._ResidencyManager()
+        self.mgr.set_budget(3000)
+        self.cache = {}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _model(self, name, size):
+        d = self.root / name
+        d.mkdir()
+        (d / "openvino_model.bin").write_bytes(b"\0" * size)
+        return d
+
+    def _load(self, name, size, load_ms=100.0):
+        d = self._model(name, size)
+        est = self.mgr.estimate(d)
+        self.mgr.reserve(est)
+        key = (str(d), "CPU")
+        self.cache[key] = types.SimpleNamespace(name=name)
+        self.mgr.add("llm", key, self.cache, d, est, None, load_ms)
+        return key
+
+    def test_estimate_uses_ir_bin_sizes(self):
+        d = self._model("m", 1234)
+        self.assertEqual(self.mgr.estimate(d), 1234)
+
+    def test_lru_eviction_over_budget(self):
+        a = self._load("a", 1000)
+        b = self._load("b", 1000)
+        self.mgr.touch("llm", a)
+        self.mgr._entries[("llm", b)]["last_used"] -= 60
+        c = self._load("c", 1500)
+        self.assertIn(a, self.cache)
+        self.assertNotIn(b, self.cache)
+        self.assertIn(c, self.cache)
+        self.assertLessEqual(self.mgr.used(), 3000)
+        self.assertEqual(self.mgr.evictions, 1)
+
+    def test_busy_pipeline_is_not_evicted(self):
+        a = self._load("a", 2000)
+        gate = inference._scheduler_for(self.cache[a])
+        gate.__enter__()
+        try:
+            self._load("b", 2000)
+            self.assertIn(a, self.cache)
+        finally:
+            gate.__exit__(None, None, None)
+            inference._drop_scheduler(self.cache[a])
+
+    def test_release_model_clears_t2i(self):
+        d = self._model("sd", 10)
+        inference._t2i_cache[(str(d), "CPU")] = object()
+        self.assertTrue(inference.is_model_in_use(d))
+        inference.release_model(d)
+        self.assertFalse(inference.is_model_in_use(d))
+
+class LoadCacheTests(unittest.TestCase):
+    def test_hot_path_skips_slow_loader(self):
+        key = ("m-hot", "CPU")
+        pipe = object()
+        inference._pipe_cache[key] = pipe
+        inference._pipe_alias[inference._request_key(Path("m-hot"), "CPU", {"perf_mode": "LATENCY"})] = (key, None)
+        hits = inference._load_stats["hits"]
+        orig = inference._load_pipeline_uncached
+        inference._load_pipeline_uncached = lambda *a, **k: self.fail("slow path taken")
+        try:
+            got = inference.load_pipeline(Path("m-hot"), "CPU", {"perf_mode": "LATENCY", "temperature": 0.3})
+        finally:
+            inference._load_pipeline_uncached = orig
+            inference.release_model(Path("m-hot"))
+        self.assertIs(got, pipe)
+        self.assertEqual(inference._load_stats["hits"], hits + 1)
+        self.assertEqual(inference._pipe_alias, {k: v for k, v in inference._pipe_alias.items() if k[0] != "m-hot"})
+
+    def test_compile_keys_change_request_key(self):
+        a = inference._request_key(Path("m"), "CPU", {"perf_mode": "LATENCY", "temperature": 0.1})
+        b = inference._request_key(Path("m"), "CPU", {"perf_mode": "LATENCY", "temperature": 0.9})
+        c = inference._request_key(Path("m"), "CPU", {"perf_mode": "THROUGHPUT"})
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_concurrent_loads_compile_once(self):
+        gate = threading.Event()
+        calls = []
+        def slow_load(model_dir, device, config=None):
+            calls.append(model_dir)
+            gate.wait(5)
+            key = (str(model_dir), device)
+            inference._pipe_cache[key] = object()
+            return inference._pipe_cache[key], key
+        orig = inference._load_pipeline_uncached
+        inference._load_pipeline_uncached = slow_load
+        got = []
+        try:
+            ths = [threading.Thread(target=lambda: got.append(inference.load_pipeline(Path("m-sf"), "CPU", {}))) for _ in range(3)]
+            for t in ths:
+                t.start()
+            for _ in range(200):
+                if calls:
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual(inference.load_status(Path("m-sf"), "CPU")["state"], "compiling")
+            gate.set()
+            for t in ths:
+                t.join(timeout=5)
+        finally:
+            inference._load_pipeline_uncached = orig
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(got), 3)
+        self.assertTrue(all(p is got[0] for p in got))
+        self.assertEqual(inference.load_status(Path("m-sf"), "CPU")["state"], "ready")
+        inference.release_model(Path("m-sf"))
+        self.assertEqual(inference.load_status(Path("m-sf"), "CPU")["state"], "unloaded")
+
+    def test_failed_load_is_reported(self):
+        def bad_load(model_dir, device, config=None):
+            raise RuntimeError("bad allocation")
+        orig = inference._load_pipeline_uncached
+        inference._load_pipeline_uncached = bad_load
+        try:
+            job = inference.load_pipeline_async(Path("m-bad"), "CPU", {})
+            self.assertTrue(job.wait(5))
+        finally:
+            inference._load_pipeline_uncached = orig
+        st = inference.load_status(Path("m-bad"), "CPU")
+        self.assertEqual(st["state"], "failed")
+        self.assertIn("bad allocation", st["error"])
+        inference.release_model(Path("m-bad"))
+
+if __name__ == "__main__":
+    unittest.main()
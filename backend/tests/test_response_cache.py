@@ -0,0 +1,113 @@
+import hashlib
+import tempfile
+import unittest
+from pathlib import Path
+
+from backend.services.response_cache import ResponseCache, is_cacheable, replay_pieces
+
+
+def _ngram_embed(texts, dim=512):
+    # stands in for an embedding model: character 3-gram hashing
+    import numpy as np
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, t in enumerate(texts):
+        s = " " + t.lower() + " "
+        for j in range(max(1, len(s) - 2)):
+            out[i, int.from_bytes(hashlib.md5(s[j:j + 3].encode("utf-8")).digest()[:4], "little") % dim] += 1.0
+    return out
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_entries=2, ttl_s=60)
+        self.cfg = {"temperature": 0, "max_new_tokens": 64}
+
+    def test_only_deterministic_requests_are_cached(self):
+        self.assertTrue(is_cacheable({"temperature": 0}))
+        self.assertFalse(is_cacheable({}))
+        self.assertFalse(is_cacheable({"temperature": 0.7}))
+        self.assertTrue(is_cacheable({"temperature": 0.7, "cache": True}))
+        self.assertFalse(is_cacheable({"temperature": 0, "cache": False}))
+
+    def test_exact_hit_ignores_whitespace(self):
+        self.cache.store("m", "What is  OpenVINO?", self.cfg, "a toolkit", {"ttft_ms": 5})
+        hit = self.cache.lookup("m", " What is OpenVINO? ", self.cfg)
+        self.assertEqual(hit["text"], "a toolkit")
+        self.assertEqual(hit["tier"], "memory")
+        self.assertIsNone(self.cache.lookup("m", "What is OpenVINO?", {**self.cfg, "max_new_tokens": 32}))
+        self.assertIsNone(self.cache.lookup("other", "What is OpenVINO?", self.cfg))
+
+    def test_lru_and_ttl(self):
+        for p in ("a", "b", "c"):
+            self.cache.store("m", p, self.cfg, p.upper())
+        self.assertIsNone(self.cache.lookup("m", "a", self.cfg))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.cache._mem[self.cache.key("m", "c", self.cfg)]["t"] -= 120
+        self.assertIsNone(self.cache.lookup("m", "c", self.cfg))
+        self.assertEqual(self.cache.stats()["expired"], 1)
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.cache.disk_dir = Path(d)
+            self.cache.store("m", "q", self.cfg, "answer")
+            fresh = ResponseCache(ttl_s=60, disk_dir=Path(d))
+            hit = fresh.lookup("m", "q", self.cfg)
+            self.assertEqual((hit["text"], hit["tier"]), ("answer", "disk"))
+            self.assertEqual(fresh.lookup("m", "q", self.cfg)["tier"], "memory")
+
+    def test_disk_tier_is_capped(self):
+        import os
+        import time
+        with tempfile.TemporaryDirectory() as d:
+            cache = ResponseCache(max_entries=10, ttl_s=60, disk_dir=Path(d), max_disk_entries=3)
+            for i in range(6):
+                cache.store("m", "q%d" % i, self.cfg, "A%d" % i)
+                # distinct ages, oldest first
+                os.utime(cache._disk_path(cache.key("m", "q%d" % i, self.cfg)), (time.time() - 30 + i, time.time() - 30 + i))
+            stale = cache._disk_path(cache.key("m", "q5", self.cfg))
+            os.utime(stale, (time.time() - 120, time.time() - 120))
+            for _ in range(200):
+                if not cache._pruning:
+                    break
+                time.sleep(0.01)
+            cache.prune_disk()
+            left = sorted(p.name for p in Path(d).glob("*/*.json"))
+            self.assertEqual(len(left), 3)
+            self.assertFalse(stale.exists())
+            fresh = ResponseCache(ttl_s=60, disk_dir=Path(d))
+            self.assertEqual(fresh.lookup("m", "q4", self.cfg)["text"], "A4")
+            self.assertIsNone(fresh.lookup("m", "q0", self.cfg))
+
+    def test_semantic_tier_matches_near_duplicates(self):
+        self.cache.set_embedder(_ngram_embed, threshold=0.85)
+        self.cache.store("m", "How do I install the OpenVINO runtime on Windows?", self.cfg, "pip install openvino")
+        hit = self.cache.lookup("m", "How do I install the OpenVINO runtime on windows", self.cfg)
+        self.assertEqual(hit["tier"], "semantic")
+        self.assertIsNone(self.cache.lookup("m", "Explain continuous batching", self.cfg))
+
+    def test_semantic_tier_requires_the_same_numbers(self):
+        self.cache.set_embedder(_ngram_embed, threshold=0.9)
+        self.cache.store("m", "Compute 1234 * 5678 and show the steps", self.cfg, "7006652")
+        self.assertIsNone(self.cache.lookup("m", "Compute 1234 * 5679 and show the steps", self.cfg))
+        self.assertEqual(self.cache.lookup("m", "compute 1234 * 5678 and show the steps.", self.cfg)["text"], "7006652")
+
+    def test_no_semantic_tier_without_an_embedder(self):
+        import os
+        from unittest import mock
+        from backend.services import response_cache
+        with mock.patch.dict(os.environ, {"AIFUNLAND_RESPONSE_CACHE_SEMANTIC": "1"}):
+            self.assertIsNone(response_cache._default_cache().embedder)
+
+    def test_replay_pieces_round_trip(self):
+        text = "one two  three " * 10
+        self.assertEqual("".join(replay_pieces(text, size=4)), text)
+
+    def test_replay_pieces_chunks_cjk_text(self):
+        text = "连续批处理把多个请求合并到同一步推理中" * 5
+        pieces = list(replay_pieces(text, size=8))
+        self.assertGreater(len(pieces), 1)
+        self.assertTrue(all(len(p) <= 8 for p in pieces))
+        self.assertEqual("".join(pieces), text)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import threading
+import types
+import unittest
+
+from backend.services import inference
+
+
+class _Handle:
+    def __init__(self, ids):
+        self._ids = list(ids)
+        self._dropped = False
+        self.avail = 0
+
+    def can_read(self):
+        return self.avail > 0 and bool(self._ids) and not self._dropped
+
+    def read(self):
+        self.avail -= 1
+        return {0: types.SimpleNamespace(generated_ids=[self._ids.pop(0)])}
+
+    def get_status(self):
+        return "GenerationStatus.RUNNING" if (self._ids and not self._dropped) else "GenerationStatus.FINISHED"
+
+    def drop(self):
+        self._dropped = True
+
+
+class _Tokenizer:
+    def __init__(self):
+        self.longest = 0
+
+    def decode(self, ids):
+        self.longest = max(self.longest, len(ids))
+        return "".join(chr(ord("a") + i % 26) for i in ids)
+
+
+class ContinuousBatchingPipeline:
+    def __init__(self):
+        self.handles = []
+        self.max_batch = 0
+        self.gate = threading.Event()
+
+    def get_tokenizer(self):
+        self.tok = _Tokenizer()
+        return self.tok
+
+    def get_config(self):
+        return types.SimpleNamespace()
+
+    def add_request(self, rid, prompt, gen):
+        h = _Handle(range(int(getattr(gen, "max_new_tokens", 3))))
+        self.handles.append(h)
+        return h
+
+    def step(self):
+        self.gate.wait(5)
+        live = [h for h in self.handles if h.get_status().endswith("RUNNING")]
+        self.max_batch = max(self.max_batch, len(live))
+        for h in live:
+            h.avail += 1
+
+
+class SchedulerTests(unittest.TestCase):
+    def test_batch_engine_shares_steps(self):
+        pipe = ContinuousBatchingPipeline()
+        results = []
+        def run():
+            results.append(inference.submit_generation(pipe, "hi", {"max_new_tokens": 4}))
+        ths = [threading.Thread(target=run) for _ in range(4)]
+        engine = inference._scheduler_for(pipe)
+        for t in ths:
+            t.start()
+        # hold the first step until every request has been queued
+        for _ in range(500):
+            if len(engine._pending) + len(engine._active) >= 4:
+                break
+            threading.Event().wait(0.01)
+        pipe.gate.set()
+        for t in ths:
+            t.join(timeout=5)
+        self.assertEqual(len(results), 4)
+        for text, metrics in results:
+            self.assertEqual(text, "abcd")
+            self.assertIn("queue_ms", metrics)
+        self.assertGreater(pipe.max_batch, 1)
+        rows = [r for r in inference.scheduler_stats()["engines"] if r["kind"] == "continuous_batching"]
+        self.assertTrue(rows and rows[0]["steps"] > 0)
+        inference._drop_scheduler(pipe)
+
+    def test_streamer_stop_drops_request(self):
+        pipe = ContinuousBatchingPipeline()
+        pipe.gate.set()
+        seen = []
+        def streamer(piece):
+            seen.append(piece)
+            return True
+        text, _ = inference.submit_generation(pipe, "hi", {"max_new_tokens": 6}, streamer)
+        self.assertEqual(seen, ["a"])
+        self.assertEqual(text, "a")
+        inference._drop_scheduler(pipe)
+
+    def test_decode_is_incremental(self):
+        pipe = ContinuousBatchingPipeline()
+        pipe.gate.set()
+        pieces = []
+        text, _ = inference.submit_generation(pipe, "hi", {"max_new_tokens": 200}, pieces.append)
+        self.assertEqual(len(text), 200)
+        self.assertEqual("".join(pieces), text)
+        self.assertLessEqual(pipe.tok.longest, 2)
+        inference._drop_scheduler(pipe)
+
+    def test_slow_streamer_does_not_stall_the_batch(self):
+        pipe = ContinuousBatchingPipeline()
+        pipe.gate.set()
+        release = threading.Event()
+        def slow(piece):
+            release.wait(5)
+        th = threading.Thread(target=inference.submit_generation, args=(pipe, "slow", {"max_new_tokens": 50}, slow))
+        th.start()
+        # the other request finishes while the slow consumer is still blocked
+        text, _ = inference.submit_generation(pipe, "fast", {"max_new_tokens": 20}, lambda p: None)
+        self.assertEqual(len(text), 20)
+        self.assertTrue(th.is_alive())
+        release.set()
+        th.join(5)
+        inference._drop_scheduler(pipe)
+
+    def test_serial_gate_for_plain_pipeline(self):
+        pipe = types.SimpleNamespace()
+        state = {"inside": 0, "max": 0}
+        lock = threading.Lock()
+        def fake_generate(p, prompt, config):
+            with lock:
+                state["inside"] += 1
+                state["max"] = max(state["max"], state["inside"])
+            with lock:
+                state["inside"] -= 1
+            return prompt, None
+        orig = inference.generate
+        inference.generate = fake_generate
+        try:
+            ths = [threading.Thread(target=inference.submit_generation, args=(pipe, "p", {})) for _ in range(6)]
+            for t in ths:
+                t.start()
+            for t in ths:
+                t.join(timeout=5)
+        finally:
+            inference.generate = orig
+            inference._drop_scheduler(pipe)
+        self.assertEqual(state["max"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
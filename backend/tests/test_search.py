@@ -0,0 +1,105 @@
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from backend.services.search import SearchStage
+
+
+def _results(tag, n=3):
+    return [{"title": f"{tag}{i}", "url": f"http://{tag}/{i}", "snippet": f"{tag} snippet {i}"} for i in range(n)]
+
+
+class SearchStageTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _provider(self, tag, delay=0.0, items=None, error=None):
+        def fn(query, max_results):
+            self.calls.append(tag)
+            time.sleep(delay)
+            if error:
+                raise error
+            return _results(tag, max_results) if items is None else items
+        return fn
+
+    def test_fastest_good_provider_wins(self):
+        stage = SearchStage({"slow": self._provider("slow", 0.5), "fast": self._provider("fast", 0.01)}, deadline_ms=2000)
+        t0 = time.perf_counter()
+        items = stage.search("npu tiles", 2)
+        self.assertLess(time.perf_counter() - t0, 0.3)
+        self.assertEqual([x["title"] for x in items], ["fast0", "fast1"])
+        self.assertEqual(stage.stats()["wins"], {"fast": 1})
+
+    def test_failed_or_empty_provider_falls_through(self):
+        stage = SearchStage({"bad": self._provider("bad", error=RuntimeError("down")), "none": self._provider("none", items=[]), "ok": self._provider("ok", 0.05)}, deadline_ms=2000)
+        self.assertEqual(stage.search("q", 1)[0]["title"], "ok0")
+        self.assertEqual(stage.stats()["errors"], 1)
+
+    def test_deadline_bounds_latency(self):
+        stage = SearchStage({"hang": self._provider("hang", 1.0)}, deadline_ms=100)
+        t0 = time.perf_counter()
+        self.assertEqual(stage.search("q"), [])
+        self.assertLess(time.perf_counter() - t0, 0.5)
+        self.assertEqual(stage.stats()["timeouts"], 1)
+
+    def test_cache_by_normalized_query_and_ttl(self):
+        disk = Path(self.tmp.name)
+        stage = SearchStage({"p": self._provider("p")}, deadline_ms=1000, disk_dir=disk)
+        stage.search("OpenVINO  NPU", 3)
+        stage.search("openvino npu", 3)
+        self.assertEqual(self.calls, ["p"])
+        self.assertEqual(stage.stats()["hits_memory"], 1)
+        again = SearchStage({"p": self._provider("p")}, deadline_ms=1000, disk_dir=disk)
+        self.assertEqual(len(again.search("openvino npu", 3)), 3)
+        self.assertEqual(again.stats()["hits_disk"], 1)
+        expired = SearchStage({"p": self._provider("p")}, deadline_ms=1000, ttl_s=0, disk_dir=disk)
+        time.sleep(0.01)
+        expired.search("openvino npu", 3)
+        self.assertEqual(self.calls, ["p", "p"])
+
+    def test_cache_is_per_provider_set(self):
+        disk = Path(self.tmp.name)
+        web = SearchStage({"web": self._provider("web")}, deadline_ms=1000, disk_dir=disk)
+        web.search("npu", 2)
+        local = SearchStage({"local": self._provider("local")}, deadline_ms=1000, disk_dir=disk)
+        self.assertEqual(local.search("npu", 2)[0]["title"], "local0")
+        self.assertEqual(local.stats()["hits_disk"], 0)
+        # adding a provider changes the set: the web-only entry is not reused
+        web.register("local", self._provider("local"))
+        web.search("npu", 2)
+        self.assertEqual(web.stats()["hits_memory"] + web.stats()["hits_disk"], 0)
+
+    def test_register_local_provider(self):
+        stage = SearchStage({}, deadline_ms=500)
+        self.assertEqual(stage.search("q"), [])
+        stage.register("local", lambda q, n: [{"title": "doc", "url": "file:///doc", "snippet": q}])
+        self.assertEqual(stage.search("hello")[0]["snippet"], "hello")
+        stage.register("local", None)
+        self.assertEqual(stage.stats()["providers"], [])
+
+    def test_overlaps_model_loading(self):
+        from unittest.mock import patch
+        from backend import app as app_mod
+        started = threading.Event()
+        def fake_search(q, max_results=5):
+            started.set()
+            time.sleep(0.2)
+            return _results("w", 2)
+        with patch("backend.services.inference.web_search", fake_search):
+            t0 = time.perf_counter()
+            fut = app_mod._start_sources({"web_search": True}, "hi")
+            self.assertTrue(started.wait(1.0))
+            time.sleep(0.2)  # stands in for load_pipeline
+            sources, origin = fut.result()
+        self.assertLess(time.perf_counter() - t0, 0.35)
+        self.assertEqual((len(sources), origin), (2, "web"))
+        self.assertIsNone(app_mod._start_sources({}, "hi"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import types
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from backend.services import inference
+
+
+class _ChatPipe:
+    def __init__(self):
+        self.calls = []
+        self.chat_starts = 0
+
+    def get_generation_config(self):
+        return types.SimpleNamespace()
+
+    def start_chat(self, system=""):
+        self.chat_starts += 1
+
+    def finish_chat(self):
+        pass
+
+    def generate(self, prompt, gen=None, streamer=None):
+        self.calls.append(prompt)
+        return types.SimpleNamespace(text="answer %d" % len(self.calls))
+
+
+class SessionTests(unittest.TestCase):
+    def tearDown(self):
+        with inference._session_lock:
+            inference._chat_sessions.clear()
+
+    def test_follow_up_turn_prefills_only_new_message(self):
+        pipe = _ChatPipe()
+        sess = inference.create_chat_session(Path("m"), "CPU")
+        _, m1 = inference.session_generate(sess, pipe, "first", {})
+        _, m2 = inference.session_generate(sess, pipe, "second", {})
+        self.assertEqual(m1["prefill_mode"], "full")
+        self.assertEqual(m2["prefill_mode"], "incremental")
+        self.assertEqual(pipe.calls, ["first", "second"])
+        self.assertEqual(pipe.chat_starts, 1)
+        self.assertEqual(len(sess["history"]), 4)
+        inference._drop_scheduler(pipe)
+
+    def test_switching_sessions_replays_history(self):
+        pipe = _ChatPipe()
+        a = inference.create_chat_session(Path("m"), "CPU")
+        b = inference.create_chat_session(Path("m"), "CPU")
+        inference.session_generate(a, pipe, "a1", {})
+        inference.session_generate(b, pipe, "b1", {})
+        _, m = inference.session_generate(a, pipe, "a2", {})
+        self.assertEqual(m["prefill_mode"], "full")
+        self.assertIn("a1", pipe.calls[-1])
+        self.assertIn("a2", pipe.calls[-1])
+        inference._drop_scheduler(pipe)
+
+    def test_concurrent_turns_do_not_interleave(self):
+        import threading
+        import time
+        pipe = _ChatPipe()
+        sess = inference.create_chat_session(Path("m"), "CPU")
+        inference.session_generate(sess, pipe, "q0", {})
+        metrics = []
+        ths = [threading.Thread(target=lambda i=i: metrics.append(inference.session_generate(sess, pipe, "q%d" % i, {})[1]))
+               for i in (1, 2)]
+        # hold the history update of the first turn; the second must not start on stale history
+        with inference._session_lock:
+            for t in ths:
+                t.start()
+            time.sleep(0.2)
+        for t in ths:
+            t.join(timeout=5)
+        self.assertEqual(sess["turns"], 3)
+        self.assertEqual([m["role"] for m in sess["history"]], ["user", "assistant"] * 3)
+        self.assertEqual([m["prefill_mode"] for m in metrics], ["incremental", "incremental"])
+        self.assertEqual(pipe.chat_starts, 1)
+        inference._drop_scheduler(pipe)
+
+    def test_stream_session_turn_runs_in_process_with_workers(self):
+        import tempfile
+        from backend.app import app
+        pipe = _ChatPipe()
+        with tempfile.TemporaryDirectory() as d:
+            sess = inference.create_chat_session(Path(d), "CPU")
+            with patch.dict("os.environ", {"AIFUNLAND_MODEL_WORKERS": "1", "AIFUNLAND_CPU_REPLICAS": "2"}), \
+                 patch("backend.app.load_pipeline", lambda *a, **k: pipe), \
+                 patch("backend.app.model_workers.worker_pool", side_effect=AssertionError("session turn sent to a worker")):
+                resp = app.test_client().get("/api/infer/stream?session_id=%s&prompt=hi&config={}" % sess["id"])
+                body = b"".join(resp.response).decode("utf-8")
+        self.assertIn("event: final", body)
+        self.assertEqual(sess["turns"], 1)
+        self.assertEqual(pipe.chat_starts, 1)
+        inference._drop_scheduler(pipe)
+
+    def test_session_count_is_bounded(self):
+        with patch.dict("os.environ", {"AIFUNLAND_MAX_SESSIONS": "2"}):
+            s1 = inference.create_chat_session(Path("m"), "CPU")
+            inference.create_chat_session(Path("m"), "CPU")
+            inference.create_chat_session(Path("m"), "CPU")
+            self.assertIsNone(inference.get_chat_session(s1["id"]))
+            self.assertEqual(inference.session_stats()["count"], 2)
+
+    def test_idle_sessions_expire(self):
+        s1 = inference.create_chat_session(Path("m"), "CPU")
+        s1["last_used"] -= 10
+        with patch.dict("os.environ", {"AIFUNLAND_SESSION_IDLE_S": "5"}):
+            self.assertIsNone(inference.get_chat_session(s1["id"]))
+
+if __name__ == "__main__":
+    unittest.main()
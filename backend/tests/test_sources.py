@@ -0,0 +1,82 @@
+import unittest
+
+from backend.services.context import TokenCounter
+from backend.services.inference import augment_with_sources
+from backend.services.sources import compress_sources, sources_budget, split_sentences
+
+
+FILLER = "The weather was pleasant and the committee met on Tuesday to discuss unrelated budget items. "
+
+SOURCES = [
+    {"title": "NPU guide", "url": "http://a", "snippet": FILLER * 3 + "Set MAX_PROMPT_LEN to raise the NPU prompt limit. " + FILLER},
+    {"title": "Mirror", "url": "http://b", "snippet": "Set MAX_PROMPT_LEN to raise the NPU prompt limit! " + FILLER * 2},
+    {"title": "Tiles", "url": "http://c", "snippet": "NPU tiles split the compute across engines. " + FILLER * 2},
+]
+
+
+class SourceCompressionTests(unittest.TestCase):
+    def test_packs_relevant_sentences_into_budget(self):
+        count = TokenCounter()
+        out, info = compress_sources(SOURCES, "npu prompt limit MAX_PROMPT_LEN", 60, count)
+        text = " ".join(s["snippet"] for s in out)
+        self.assertIn("MAX_PROMPT_LEN", text)
+        self.assertNotIn("weather", text)
+        self.assertLessEqual(info["tokens_out"], 60)
+        self.assertGreater(info["tokens_saved"], 100)
+        self.assertEqual(info["tokens_saved"], info["tokens_in"] - info["tokens_out"])
+
+    def test_near_duplicates_are_kept_once(self):
+        out, info = compress_sources(SOURCES, "npu prompt limit weather", 1000)
+        self.assertGreaterEqual(info["duplicates"], 2)
+        text = " ".join(s["snippet"] for s in out)
+        self.assertEqual(text.count("MAX_PROMPT_LEN"), 1)
+        self.assertEqual(text.count("weather"), 1)
+
+    def test_budget_counts_with_tokenizer(self):
+        class Tok:
+            def encode(self, text):
+                class R:
+                    pass
+                class Ids:
+                    shape = (1, len(text.split()))
+                r = R()
+                r.input_ids = Ids()
+                return r
+        out, info = compress_sources(SOURCES, "npu tiles", 12, TokenCounter(Tok()))
+        self.assertLessEqual(info["tokens_out"], 12)
+        self.assertEqual(out[0]["title"], "Tiles")
+
+    def test_sources_budget(self):
+        self.assertEqual(sources_budget({"sources_budget": 100}, 50), 100)
+        self.assertEqual(sources_budget({"max_prompt_len": 512}, 200), 512 - 32 - 200 - 48)
+        self.assertEqual(sources_budget({"max_prompt_len": 512}, 600), 0)
+
+    def test_augment_with_budget_reports_info(self):
+        info = {}
+        text = augment_with_sources("How do I raise the NPU prompt limit?", SOURCES, lang="en", budget=40, info=info)
+        self.assertIn("MAX_PROMPT_LEN", text)
+        self.assertNotIn("weather", text)
+        self.assertGreater(info["tokens_saved"], 0)
+        raw = augment_with_sources("q", SOURCES, lang="en")
+        self.assertIn("weather", raw)
+
+    def test_kept_sources_match_prompt_numbering(self):
+        kept = []
+        text = augment_with_sources("How do I raise the NPU prompt limit?", SOURCES, lang="en", budget=40, kept=kept)
+        self.assertTrue(kept)
+        self.assertIn("[1] " + kept[0]["title"], text)
+        self.assertIn(kept[0]["snippet"], text)
+        self.assertNotIn("weather", " ".join(s["snippet"] for s in kept))
+
+    def test_zero_budget_skips_augmentation(self):
+        kept = []
+        self.assertEqual(augment_with_sources("q", SOURCES, lang="en", budget=0, kept=kept), "q")
+        self.assertEqual(kept, [])
+
+    def test_cjk_sentences(self):
+        self.assertEqual(split_sentences("量化降低内存。NPU需要静态形状！ok"), ["量化降低内存。", "NPU需要静态形状！", "ok"])
+        out, _ = compress_sources([{"title": "zh", "url": "", "snippet": "天气很好。量化模型可以降低内存占用。"}], "内存", 30)
+        self.assertEqual(out[0]["snippet"], "量化模型可以降低内存占用。")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -40,7 +40,7 @@ class StreamingTests(unittest.TestCase):
                 {"title": "A", "url": "http://a.com", "snippet": "sa"},
                 {"title": "B", "url": "http://b.com", "snippet": "sb"},
             ]
-        def fake_augment(prompt, src, lang="zh"):
+        def fake_augment(prompt, src, lang="zh", origin="web", **kw):
             return prompt + "\n" + "\n".join([s["title"] for s in src])
         with patch("backend.services.inference.web_search", fake_web_search), patch("backend.services.inference.augment_with_sources", fake_augment), patch("backend.app.load_pipeline", lambda a,b,c: object()), patch("backend.services.inference.generate_stream", lambda p, q, c, s: ("ok", {})):
             client = app.test_client()
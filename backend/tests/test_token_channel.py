@@ -0,0 +1,142 @@
+import threading
+import time
+import unittest
+
+from backend.services.streaming import ThinkSplitter, TokenChannel, flush_window, sse_stats
+from backend.services.streaming import cancel_request, cancel_stats, finish_request, register_request
+
+
+class TokenChannelTests(unittest.TestCase):
+    def test_size_window_coalesces_tokens(self):
+        chan = TokenChannel(window_ms=5000, max_tokens=4)
+        def produce():
+            for i in range(4):
+                chan.put(str(i))
+            time.sleep(0.3)
+            for i in range(4, 10):
+                chan.put(str(i))
+            chan.close()
+        threading.Thread(target=produce).start()
+        t0 = time.perf_counter()
+        it = chan.chunks()
+        _, first, n = next(it)
+        self.assertLess(time.perf_counter() - t0, 2.0)
+        chunks = [first] + [c for _, c, _ in it]
+        self.assertEqual((first, n), ("0123", 4))
+        self.assertEqual("".join(chunks), "0123456789")
+        frames = [chan.frame("token", {"text": c}) for c in chunks]
+        self.assertTrue(frames[0].startswith("event: token\ndata: "))
+        st = chan.stats()
+        self.assertEqual(st["tokens"], 10)
+        self.assertEqual(st["frames"], len(chunks))
+        self.assertAlmostEqual(st["bytes_per_token"], sum(len(f) for f in frames) / 10.0)
+
+    def test_time_window_flushes_slow_producer(self):
+        chan = TokenChannel(window_ms=20, max_tokens=100)
+        def produce():
+            for piece in ("a", "b"):
+                chan.put(piece)
+                time.sleep(0.1)
+            chan.close()
+        threading.Thread(target=produce).start()
+        t0 = time.perf_counter()
+        chunks = [c for _, c, _ in chan.chunks()]
+        self.assertEqual(chunks, ["a", "b"])
+        self.assertLess(time.perf_counter() - t0, 2.0)
+
+    def test_close_ends_stream_without_tokens(self):
+        chan = TokenChannel()
+        active = sse_stats()["active"]
+        chan.close()
+        self.assertEqual(list(chan.chunks()), [])
+        self.assertEqual(sse_stats()["active"], active - 1)
+
+    def test_flush_window_from_config(self):
+        self.assertEqual(flush_window({"sse_flush_ms": 0, "sse_flush_tokens": 1}), (0, 1))
+    def test_events_keep_order(self):
+        chan = TokenChannel(window_ms=0)
+        chan.put("x", "thinking")
+        chan.put("y", "thinking")
+        chan.put("z")
+        chan.close()
+        self.assertEqual(list(chan.chunks()), [("thinking", "xy", 2), ("token", "z", 1)])
+
+
+def _run(splitter, pieces):
+    out = []
+    for p in pieces:
+        out.extend(splitter.feed(p))
+    out.extend(splitter.flush())
+    joined = {}
+    for ev, text in out:
+        joined[ev] = joined.get(ev, "") + text
+    return joined
+
+
+class ThinkSplitterTests(unittest.TestCase):
+    def test_close_tag_split_across_pieces(self):
+        got = _run(ThinkSplitter(in_think=True), ["Let me ", "think</", "Thi", "nk>\n\nAnswer", " here"])
+        self.assertEqual(got["thinking"], "Let me think")
+        self.assertEqual(got["token"], "\n\nAnswer here")
+
+    def test_open_tag_at_start(self):
+        got = _run(ThinkSplitter(), ["  <thi", "nk>plan", "</think>", "done"])
+        self.assertEqual(got, {"thinking": "plan", "token": "done"})
+
+    def test_plain_answer_passes_through(self):
+        got = _run(ThinkSplitter(), ["a <think> tag", " in text"])
+        self.assertEqual(got, {"token": "a <think> tag in text"})
+
+    def test_partial_tag_at_end_is_flushed(self):
+        got = _run(ThinkSplitter(in_think=True), ["unfinished </thi"])
+        self.assertEqual(got, {"thinking": "unfinished </thi"})
+
+    def test_kept_reasoning_is_capped(self):
+        sp = ThinkSplitter(in_think=True, max_chars=10)
+        for _ in range(100):
+            sp.feed("abcdef")
+        self.assertEqual(len(sp.reasoning()), 10)
+        st = sp.stats()
+        self.assertEqual(st["chars"], 600)
+        self.assertTrue(st["truncated"])
+        self.assertLessEqual(sp._kept_len, 16)
+
+
+class CancelTests(unittest.TestCase):
+    def test_stop_reports_reclaimed_tokens(self):
+        before = cancel_stats()
+        tok = register_request("unit-stop", max_new_tokens=100)
+        tok.pieces = 12
+        self.assertTrue(cancel_request("unit-stop"))
+        self.assertFalse(cancel_request("unit-stop"))
+        self.assertTrue(tok.cancelled)
+        self.assertEqual(tok.report(), {"reason": "stop", "generated_tokens": 12, "reclaimed_tokens": 88})
+        finish_request(tok)
+        after = cancel_stats()
+        self.assertEqual(after["stop"] - before["stop"], 1)
+        self.assertEqual(after["reclaimed_tokens"] - before["reclaimed_tokens"], 88)
+        self.assertEqual(after["active"], before["active"])
+        self.assertFalse(cancel_request("unit-stop"))
+
+    def test_duplicate_id_gets_a_fresh_one(self):
+        first = register_request("unit-dup")
+        second = register_request("unit-dup")
+        self.assertEqual(first.request_id, "unit-dup")
+        self.assertNotEqual(second.request_id, "unit-dup")
+        self.assertTrue(cancel_request(second.request_id))
+        self.assertFalse(first.cancelled)
+        self.assertTrue(cancel_request("unit-dup"))
+        self.assertTrue(first.cancelled)
+        finish_request(first)
+        finish_request(second)
+
+    def test_disconnect_keeps_first_reason(self):
+        tok = register_request("unit-drop")
+        tok.cancel("disconnect")
+        tok.cancel("stop")
+        self.assertEqual(tok.reason, "disconnect")
+        self.assertIsNone(tok.reclaimed())
+        finish_request(tok)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+from backend.services.tuner import PerfTuner, arm_config, arm_of, arms_for, objective_for, prompt_bucket
+
+
+def _drive(tuner, speed, n, objective="throughput", device="CPU"):
+    """Run n requests where speed[arm] is the tokens/s (or TTFT) that arm delivers."""
+    picks = []
+    for _ in range(n):
+        arm = tuner.choose("m", device, "256", objective)
+        picks.append(arm)
+        if objective == "throughput":
+            tuner.observe("m", device, "256", arm, tps=speed[arm])
+        else:
+            tuner.observe("m", device, "256", arm, ttft_ms=speed[arm])
+    return picks
+
+
+class PerfTunerTests(unittest.TestCase):
+    def test_converges_to_best_throughput_arm(self):
+        t = PerfTuner(min_pulls=2)
+        picks = _drive(t, {"LATENCY": 5.0, "THROUGHPUT": 12.0, "CUMULATIVE_THROUGHPUT": 8.0}, 40)
+        self.assertEqual(picks[-10:], ["THROUGHPUT"] * 10)
+        self.assertLessEqual(t.stats()["switches"], 4)
+
+    def test_ttft_objective_prefers_lowest_ttft(self):
+        t = PerfTuner(min_pulls=2)
+        picks = _drive(t, {"LATENCY": 300.0, "THROUGHPUT": 900.0, "CUMULATIVE_THROUGHPUT": 700.0}, 30, "ttft")
+        self.assertEqual(picks[-5:], ["LATENCY"] * 5)
+
+    def test_close_arms_do_not_oscillate(self):
+        t = PerfTuner(min_pulls=2, hysteresis=0.05)
+        picks = _drive(t, {"LATENCY": 10.0, "THROUGHPUT": 10.2, "CUMULATIVE_THROUGHPUT": 9.9}, 60)
+        tail = picks[20:]
+        self.assertEqual(len(set(tail)), 1)
+
+    def test_keys_are_independent(self):
+        t = PerfTuner(min_pulls=1)
+        for _ in range(10):
+            a = t.choose("m", "CPU", "256", "throughput")
+            t.observe("m", "CPU", "256", a, tps={"LATENCY": 1.0, "THROUGHPUT": 9.0, "CUMULATIVE_THROUGHPUT": 2.0}[a])
+        self.assertEqual(t.choose("m", "CPU", "256", "throughput"), "THROUGHPUT")
+        self.assertEqual(t.choose("m", "CPU", "long", "throughput"), "CUMULATIVE_THROUGHPUT")
+        self.assertEqual(t.choose("other", "CPU", "256", "throughput"), "CUMULATIVE_THROUGHPUT")
+
+    def test_state_persists(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = Path(d) / "perf_tuner.json"
+            t = PerfTuner(path, min_pulls=1)
+            _drive(t, {"LATENCY": 1.0, "THROUGHPUT": 9.0, "CUMULATIVE_THROUGHPUT": 2.0}, 10)
+            t.save()
+            t2 = PerfTuner(path, min_pulls=1)
+            self.assertEqual(t2.choose("m", "CPU", "256", "throughput"), "THROUGHPUT")
+
+    def test_sibling_pipeline_is_credited(self):
+        t = PerfTuner(min_pulls=1)
+        pipe = types.SimpleNamespace(_af_props={"PERFORMANCE_HINT": "LATENCY", "NUM_STREAMS": "1"})
+        ran = arm_of(pipe, "NPU", "THROUGHPUT/2")
+        self.assertEqual(ran, "LATENCY/1")
+        t.observe("m", "NPU", "256", ran, ttft_ms=100.0, chosen="THROUGHPUT/2")
+        st = t.stats()
+        self.assertEqual(st["sibling_samples"], 1)
+        self.assertEqual(st["keys"]["m|NPU|256"]["arms"]["LATENCY/1"]["n"], 1)
+        self.assertEqual(arm_of(object(), "CPU", "LATENCY"), "LATENCY")
+
+    def test_helpers(self):
+        self.assertEqual(len(arms_for("GPU.0")), 6)
+        self.assertEqual(arms_for("NPU", streams=2), ["LATENCY/2", "THROUGHPUT/2", "CUMULATIVE_THROUGHPUT/2"])
+        self.assertEqual(arm_config("NPU", "THROUGHPUT/2"), {"perf_mode": "THROUGHPUT", "npu_streams": 2})
+        self.assertEqual(arm_config("CPU", "LATENCY"), {"perf_mode": "LATENCY"})
+        self.assertEqual(prompt_bucket("x" * 100), "256")
+        self.assertEqual(prompt_bucket("x" * 100000), "long")
+        self.assertEqual(objective_for({"max_new_tokens": 64}), "ttft")
+        self.assertEqual(objective_for({"max_new_tokens": 64, "perf_objective": "tps"}), "throughput")
+
+if __name__ == "__main__":
+    unittest.main()
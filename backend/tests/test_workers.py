@@ -0,0 +1,199 @@
+import os
+import time
+import unittest
+
+from backend.services.workers import ShmRing, WorkerCrashed, WorkerPool, cpu_partitions
+
+_SPEC = "backend.tests.test_workers"
+
+
+def fake_load(model_dir, device, config):
+    if model_dir.name == "bad":
+        raise RuntimeError("cannot compile")
+    return {"model": model_dir.name, "pid": os.getpid()}
+
+
+def fake_run(pipe, prompt, config, streamer=None):
+    if prompt == "crash":
+        os._exit(3)
+    time.sleep(float(config.get("sleep", 0)))
+    pieces = [f"{i}量 " for i in range(int(config.get("n", 5)))]
+    sent = []
+    for p in pieces:
+        time.sleep(float(config.get("gap", 0)))
+        if streamer is not None and streamer(p):
+            break
+        sent.append(p)
+    return "".join(sent), {"pid": pipe["pid"], "tokens": len(sent), "cpus": sorted(os.sched_getaffinity(0)),
+                           "cpu_threads": config.get("cpu_threads"), "budget_mb": os.environ.get("AIFUNLAND_MEM_BUDGET_MB")}
+
+
+class ShmRingTests(unittest.TestCase):
+    def test_wraps_and_splits_large_records(self):
+        ring = ShmRing(size=64)
+        try:
+            peer = ShmRing(ring.name)
+            got = b""
+            for i in range(20):
+                self.assertTrue(peer.write(b"abcdefghij"))
+                got += b"".join(ring.read())
+            big = bytes(range(100))
+            import threading
+            th = threading.Thread(target=peer.write, args=(big,))
+            th.start()
+            out = b""
+            while len(out) < 100:
+                out += b"".join(ring.read())
+            th.join()
+            self.assertEqual(got, b"abcdefghij" * 20)
+            self.assertEqual(out, big)
+            ring.cancel()
+            self.assertFalse(peer.write(b"x" * 200, timeout=0.1))
+            peer.close()
+        finally:
+            ring.close(unlink=True)
+
+
+class CpuPartitionTests(unittest.TestCase):
+    NODES = [{"node": 0, "cpus": list(range(0, 8))}, {"node": 1, "cpus": list(range(8, 16))}]
+
+    def test_one_replica_per_node(self):
+        parts = cpu_partitions(2, self.NODES)
+        self.assertEqual([p["node"] for p in parts], [0, 1])
+        self.assertEqual(parts[1]["cpus"], list(range(8, 16)))
+
+    def test_fewer_replicas_merge_nodes(self):
+        self.assertEqual(cpu_partitions(1, self.NODES)[0]["cpus"], list(range(16)))
+
+    def test_more_replicas_split_nodes(self):
+        parts = cpu_partitions(4, self.NODES)
+        self.assertEqual([p["node"] for p in parts], [0, 0, 1, 1])
+        self.assertEqual([len(p["cpus"]) for p in parts], [4, 4, 4, 4])
+        flat = [c for p in parts for c in p["cpus"]]
+        self.assertEqual(sorted(flat), list(range(16)))
+
+
+class WorkerPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(loader=f"{_SPEC}:fake_load", runner=f"{_SPEC}:fake_run", threads=2, max_restarts=2, load_timeout_s=60)
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_stream_through_shared_memory(self):
+        from pathlib import Path
+        pipe = self.pool.pipeline(Path("/models/a"), "CPU")
+        pieces = []
+        text, metrics = pipe.submit("hi", {"n": 50}, pieces.append)
+        self.assertEqual("".join(pieces), text)
+        self.assertEqual(metrics["tokens"], 50)
+        self.assertNotEqual(metrics["pid"], os.getpid())
+        # routed by model: a second model gets its own process
+        other = self.pool.pipeline(Path("/models/b"), "CPU").submit("hi", {})[1]
+        self.assertNotEqual(other["pid"], metrics["pid"])
+
+    def test_reader_is_woken_by_the_worker(self):
+        from pathlib import Path
+        from unittest import mock
+        pipe = self.pool.pipeline(Path("/models/a"), "CPU")
+        stamps = []
+        # no sleep-polling on the front end, and a lost wakeup would stall for 30s
+        with mock.patch("backend.services.workers._WAKE_TIMEOUT_S", 30), \
+             mock.patch("backend.services.workers.time.sleep", side_effect=AssertionError("front end polled")):
+            t0 = time.monotonic()
+            text, _ = pipe.submit("hi", {"n": 5, "gap": 0.05}, lambda p: stamps.append(time.monotonic()))
+        self.assertEqual(len(stamps), 5)
+        self.assertLess(time.monotonic() - t0, 5)
+        self.assertEqual(text, "".join(f"{i}量 " for i in range(5)))
+
+    def test_streamer_stop_cancels_generation(self):
+        from pathlib import Path
+        pipe = self.pool.pipeline(Path("/models/a"), "CPU")
+        seen = []
+        def stop_after_two(p):
+            seen.append(p)
+            return len(seen) >= 2
+        text, metrics = pipe.submit("hi", {"n": 1000}, stop_after_two)
+        self.assertLess(metrics["tokens"], 1000)
+        self.assertEqual(len(seen), 2)
+
+    def test_crashed_worker_is_restarted(self):
+        from pathlib import Path
+        pipe = self.pool.pipeline(Path("/models/a"), "CPU")
+        first = pipe.submit("hi", {})[1]["pid"]
+        with self.assertRaises(WorkerCrashed):
+            pipe.submit("crash", {}, lambda p: None)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                second = pipe.submit("hi", {})[1]["pid"]
+                break
+            except WorkerCrashed:
+                time.sleep(0.1)
+        self.assertNotEqual(first, second)
+        st = self.pool.stats()
+        self.assertEqual(st["crashes"], 1)
+        self.assertGreaterEqual(st["restarts"], 1)
+
+    @unittest.skipUnless(hasattr(os, "sched_getaffinity") and len(os.sched_getaffinity(0)) >= 2, "needs 2 cores")
+    def test_cpu_replicas_are_pinned_and_least_loaded(self):
+        import threading
+        from pathlib import Path
+        pipe = self.pool.pipeline(Path("/models/a"), "CPU", replicas=2)
+        self.assertEqual(pipe.replicas, 2)
+        slow = {}
+        th = threading.Thread(target=lambda: slow.update(pipe.submit("hi", {"sleep": 0.5})[1]))
+        th.start()
+        time.sleep(0.1)
+        # the busy replica is skipped while the other is idle
+        fast = [pipe.submit("hi", {})[1] for _ in range(3)]
+        th.join()
+        self.assertEqual(len({m["pid"] for m in fast}), 1)
+        self.assertNotEqual(fast[0]["pid"], slow["pid"])
+        self.assertFalse(set(fast[0]["cpus"]) & set(slow["cpus"]))
+        self.assertEqual(fast[0]["cpu_threads"], len(fast[0]["cpus"]))
+
+    def test_least_loaded_replica_takes_the_request(self):
+        import threading
+        from pathlib import Path
+        from unittest import mock
+        cpu = sorted(os.sched_getaffinity(0))[:1]
+        parts = [{"node": 0, "cpus": cpu}, {"node": 0, "cpus": cpu}]
+        with mock.patch("backend.services.workers.cpu_partitions", return_value=parts):
+            pipe = self.pool.pipeline(Path("/models/a"), "CPU", replicas=2)
+        slow = {}
+        th = threading.Thread(target=lambda: slow.update(pipe.submit("hi", {"sleep": 0.5})[1]))
+        th.start()
+        time.sleep(0.1)
+        fast = [pipe.submit("hi", {})[1] for _ in range(3)]
+        th.join()
+        self.assertEqual(len({m["pid"] for m in fast}), 1)
+        self.assertNotEqual(fast[0]["pid"], slow["pid"])
+        self.assertEqual(fast[0]["cpu_threads"], 1)
+
+    def test_memory_budget_is_shared_with_workers(self):
+        from pathlib import Path
+        from backend.services import inference
+        inference.set_memory_budget(3000)
+        self.addCleanup(inference.set_memory_budget, None)
+        a = self.pool.pipeline(Path("/models/a"), "CPU")
+        self.assertEqual(float(a.submit("hi", {})[1]["budget_mb"]), 1500.0)
+        # a second worker: the front end and both workers get a third each
+        b = self.pool.pipeline(Path("/models/b"), "CPU")
+        self.assertEqual(float(b.submit("hi", {})[1]["budget_mb"]), 1000.0)
+        self.assertEqual(float(a.submit("hi", {})[1]["budget_mb"]), 1000.0)
+        self.assertEqual(inference._residency.budget(), 1000 * 1024 * 1024)
+        rows = self.pool.memory_stats()
+        self.assertEqual({r["budget_bytes"] for r in rows}, {1000 * 1024 * 1024})
+        self.assertTrue(all(r["rss_bytes"] for r in rows))
+        self.pool.stop()
+        self.assertEqual(inference._residency.budget(), 3000 * 1024 * 1024)
+
+    def test_load_failure_is_reported(self):
+        from pathlib import Path
+        with self.assertRaises(RuntimeError) as cm:
+            self.pool.pipeline(Path("/models/bad"), "CPU")
+        self.assertIn("cannot compile", str(cm.exception))
+
+if __name__ == "__main__":
+    unittest.main()
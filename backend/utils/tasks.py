@@ -3,6 +3,15 @@ import uuid
 import queue
 import copy
 
+class _SignalQueue(queue.Queue):
+    def __init__(self, signal, maxsize=0):
+        super().__init__(maxsize)
+        self.signal = signal
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        self.signal.set()
+
 class TaskStore:
     def __init__(self):
         self._tasks = {}
@@ -34,8 +43,9 @@ class TaskStore:
                 except queue.Full:
                     pass
 
-    def subscribe(self, task_id):
-        q = queue.Queue(maxsize=100)
+    def subscribe(self, task_id, signal=None):
+        """Queue of task snapshots; with `signal` (backend.services.streaming.Signal) every put also sets q.signal."""
+        q = queue.Queue(maxsize=100) if signal is None else _SignalQueue(signal, maxsize=100)
         with self._lock:
             if task_id not in self._listeners:
                 self._listeners[task_id] = []
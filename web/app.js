@@ -83,8 +83,8 @@ function getThinkingCurrent(){return _thinking_text}
 async function copyThinking(){try{const card=$("#thinking_card");const collapsed=card&&card.classList.contains('collapsed');const txt=collapsed?$("#thinking_summary").textContent:$("#thinking_content").textContent;await navigator.clipboard.writeText(txt)}catch(e){}}
 function initSplit(){const cont=$("#chat_split");const handle=$("#split_handle");if(!cont||!handle)return;let p=localStorage.getItem('chat_split_pct');let topPct=p?parseFloat(p):40;let bottomPct=100-topPct;function apply(){cont.style.gridTemplateRows=`${topPct}% 8px ${bottomPct}%`}apply();let dragging=false;handle.addEventListener('mousedown',e=>{dragging=true;document.body.style.cursor='row-resize'});window.addEventListener('mouseup',e=>{if(dragging){dragging=false;document.body.style.cursor=''}});window.addEventListener('mousemove',e=>{if(!dragging)return;const r=cont.getBoundingClientRect();const y=e.clientY-r.top;let tp=y/r.height*100;if(tp<20)tp=20;if(tp>80)tp=80;topPct=tp;bottomPct=100-topPct;apply();localStorage.setItem('chat_split_pct',String(Math.round(topPct)))})}
 function applyMaterialTheme(){const s=getComputedStyle(document.documentElement).getPropertyValue('--primary').trim()||'#6200ee';function hexToHsl(h){let r=parseInt(h.slice(1,3),16)/255;let g=parseInt(h.slice(3,5),16)/255;let b=parseInt(h.slice(5,7),16)/255;let max=Math.max(r,g,b),min=Math.min(r,g,b);let h_,s_,l=(max+min)/2;if(max===min){h_=0;s_=0}else{let d=max-min;s_=l>0.5?d/(2-max-min):d/(max+min);switch(max){case r:h_=(g-b)/d+(g<b?6:0);break;case g:h_=(b-r)/d+2;break;case b:h_=(r-g)/d+4;break}h_/=6}return{h:h_*360,s:s_*100,l:l*100}}function hslToHex(h,s,l){s/=100;l/=100;const c=(1-Math.abs(2*l-1))*s;const x=c*(1-Math.abs((h/60)%2-1));const m=l-c/2;let r,g,b;if(h<60){r=c;g=x;b=0}else if(h<120){r=x;g=c;b=0}else if(h<180){r=0;g=c;b=x}else if(h<240){r=0;g=x;b=c}else if(h<300){r=x;g=0;b=c}else{r=c;g=0;b=x}r=Math.round((r+m)*255);g=Math.round((g+m)*255);b=Math.round((b+m)*255);return"#"+r.toString(16).padStart(2,'0')+g.toString(16).padStart(2,'0')+b.toString(16).padStart(2,'0')}const hsl=hexToHsl(s);const p=hslToHex(hsl.h,Math.min(100,hsl.s),Math.min(70,hsl.l));const sec=hslToHex((hsl.h+200)%360,50,60);const surf=hslToHex(hsl.h,20,98);document.documentElement.style.setProperty('--primary',p);document.documentElement.style.setProperty('--secondary',sec);document.documentElement.style.setProperty('--surface',surf)}
-async function streamGenerate(){hideAlert();const id=$("#model_select").value;if(!id)return;const device=$("#accelerator").value||"CPU";const promptEl=$("#prompt");const base=promptEl.value;if(!base)return;chat.push({role:"user",text:base});renderChat($("#chat_search").value||"");promptEl.value="";promptEl.focus();const thinking={role:"assistant",text:t[lang].thinking,thinking:true};chat.push(thinking);renderChat($("#chat_search").value||"");const maxNewEl=$("#max_new");const tempEl=$("#temperature");const topkEl=$("#top_k");const toppEl=$("#top_p");const repEl=$("#rep_penalty");const autoPerf=$("#auto_perf")?$("#auto_perf").checked:false;const autoMulti=$("#auto_multi")?$("#auto_multi").checked:false;const webSearch=$("#web_search")?$("#web_search").checked:false;const hetero=$("#hetero_enable")?$("#hetero_enable").checked:false;const prompt=buildContextualPrompt(base);const config={max_new_tokens:maxNewEl?parseInt(maxNewEl.value,10):2048,temperature:tempEl?parseFloat(tempEl.value):0.7,top_k:topkEl?parseInt(topkEl.value,10):50,top_p:toppEl?parseFloat(toppEl.value):0.9,repetition_penalty:repEl?parseFloat(repEl.value):1.1,perf_mode:autoPerf?"AUTO":($("#perf_mode")?$("#perf_mode").value:undefined),npu_streams:getAdvancedSettings().streams||undefined,npu_tiles:getAdvancedSettings().tiles||undefined,num_requests:getAdvancedSettings().num_requests||undefined,auto_multi:autoMulti,hetero_enable:hetero,web_search:webSearch,search_query:base};const dev2=(hetero&&(device.startsWith("AUTO")||device.startsWith("MULTI")))?("HETERO:"+(device.includes(":")?device.split(":",2)[1]:"")):device;const key=`${dev2}:${id}`;let needOverlay=!_firstLoadShown[key];try{const r0=await fetch(`/api/models/is_loaded?model_id=${encodeURIComponent(id)}&device=${encodeURIComponent(dev2)}`);if(r0.status===200){const j0=await r0.json();if(j0.loaded===true)needOverlay=false}}catch(_){ }let overlayShown=false;if(needOverlay){showOverlay();overlayShown=true}const qs=`model_id=${encodeURIComponent(id)}&device=${encodeURIComponent(dev2)}&prompt=${encodeURIComponent(prompt)}&config=${encodeURIComponent(JSON.stringify(config))}`;let es;let done=false;function close(){if(es)es.close()}async function fallback(){if(done)return;close();let j;try{const r=await fetch("/api/infer/chat",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({model_id:id,device:dev2,prompt,config})});j=await r.json()}catch(e){j={error:String(e)}}if(overlayShown)hideOverlay();if(j.friendly){showAlert(j.message,j.docs_link,j.recommended);const idx=chat.indexOf(thinking);if(idx>-1){chat.splice(idx,1)}renderChat($("#chat_search").value||"");return}const reply=j.output||j.error||"";thinking.thinking=false;thinking.text=reply;renderChat($("#chat_search").value||"")}try{let ts0=Date.now();let ft=null;let inThink=false;let thinkBuf="";es=new EventSource(`/api/infer/stream?${qs}`);es.addEventListener('sources',e=>{try{const d=JSON.parse(e.data);const arr=Array.isArray(d.sources)?d.sources:[];const lines=arr.map((s,i)=>`[${i+1}] ${(s.title||'')} \n ${(s.url||'')} \n ${(s.snippet||'')}`);if(lines.length){updateThinking(lines.join("\n\n"))}}catch(_){}});es.addEventListener('token',e=>{try{const d=JSON.parse(e.data);let seg=d.text||"";if(ft===null)ft=Date.now();if(overlayShown){hideOverlay();overlayShown=false}if(thinking.thinking)thinking.thinking=false;const oopen=/<think[\s\S]*?>/i.test(seg);const oclose=/<\/think>/i.test(seg);if(oopen||inThink){thinkBuf+=seg;inThink=true;if(oclose){inThink=false;try{const cleaned=thinkBuf.replace(/<think[\s\S]*?>|<\/think>/gi,"").trim();if(cleaned)updateThinking(cleaned)}catch(_){ }thinkBuf=""}return}seg=seg.replace(/<final>|<\/final>/gi,"");const cur=thinking.text===t[lang].thinking?"":(thinking.text||"");thinking.text=cur+seg;renderChat($("#chat_search").value||"")}catch(_){}});es.addEventListener('chunk',e=>{try{const d=JSON.parse(e.data);let seg=d.text||"";if(ft===null)ft=Date.now();if(overlayShown){hideOverlay();overlayShown=false}if(thinking.thinking)thinking.thinking=false;const oopen=/<think[\s\S]*?>/i.test(seg);const oclose=/<\/think>/i.test(seg);if(oopen||inThink){thinkBuf+=seg;inThink=true;if(oclose){inThink=false;try{const cleaned=thinkBuf.replace(/<think[\s\S]*?>|<\/think>/gi,"").trim();if(cleaned)updateThinking(cleaned)}catch(_){ }thinkBuf=""}return}seg=seg.replace(/<final>|<\/final>/gi,"");const cur=thinking.text===t[lang].thinking?"":(thinking.text||"");thinking.text=cur+seg;renderChat($("#chat_search").value||"")}catch(_){}});es.addEventListener('final',e=>{try{const d=JSON.parse(e.data);thinking.thinking=false;thinking.text=d.text||"";renderChat($("#chat_search").value||"");done=true;if(overlayShown)hideOverlay();_firstLoadShown[key]=true;window.__last_ttft_front=ft?(ft-ts0):null;close()}catch(_){close();fallback()}});es.addEventListener('error',()=>{close();fallback()})}catch(_){fallback()}}
-async function streamContinueGenerate(){hideAlert();const id=$("#model_select").value;if(!id)return;const device=$("#accelerator").value||"CPU";const base=buildPromptFromChat();const prompt=buildContextualPrompt(base);const thinking={role:"assistant",text:t[lang].thinking,thinking:true};chat.push(thinking);renderChat($("#chat_search").value||"");const maxNewEl=$("#max_new");const tempEl=$("#temperature");const topkEl=$("#top_k");const toppEl=$("#top_p");const repEl=$("#rep_penalty");const autoPerf=$("#auto_perf")?$("#auto_perf").checked:false;const autoMulti=$("#auto_multi")?$("#auto_multi").checked:false;const webSearch=$("#web_search")?$("#web_search").checked:false;const hetero=$("#hetero_enable")?$("#hetero_enable").checked:false;const config={max_new_tokens:maxNewEl?parseInt(maxNewEl.value,10):2048,temperature:tempEl?parseFloat(tempEl.value):0.7,top_k:topkEl?parseInt(topkEl.value,10):50,top_p:toppEl?parseFloat(toppEl.value):0.9,repetition_penalty:repEl?parseFloat(repEl.value):1.1,perf_mode:autoPerf?"AUTO":($("#perf_mode")?$("#perf_mode").value:undefined),npu_streams:getAdvancedSettings().streams||undefined,npu_tiles:getAdvancedSettings().tiles||undefined,num_requests:getAdvancedSettings().num_requests||undefined,auto_multi:autoMulti,hetero_enable:hetero,web_search:webSearch,search_query:base};const dev2=(hetero&&(device.startsWith("AUTO")||device.startsWith("MULTI")))?("HETERO:"+(device.includes(":")?device.split(":",2)[1]:"")):device;const qs=`model_id=${encodeURIComponent(id)}&device=${encodeURIComponent(dev2)}&prompt=${encodeURIComponent(prompt)}&config=${encodeURIComponent(JSON.stringify(config))}`;let es;let done=false;function close(){if(es)es.close()}async function fallback(){if(done)return;close();let j;try{const r=await fetch("/api/infer/chat",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({model_id:id,device:dev2,prompt,config})});j=await r.json()}catch(e){j={error:String(e)}}const reply=j.output||j.error||"";thinking.thinking=false;thinking.text=reply;renderChat($("#chat_search").value||"")}try{let ts1=Date.now();let ft1=null;let inThink=false;let thinkBuf="";es=new EventSource(`/api/infer/stream?${qs}`);es.addEventListener('sources',e=>{try{const d=JSON.parse(e.data);const arr=Array.isArray(d.sources)?d.sources:[];const lines=arr.map((s,i)=>`[${i+1}] ${(s.title||'')} \n ${(s.url||'')} \n ${(s.snippet||'')}`);if(lines.length){updateThinking(lines.join("\n\n"))}}catch(_){}});es.addEventListener('token',e=>{try{const d=JSON.parse(e.data);let seg=d.text||"";if(ft1===null)ft1=Date.now();if(thinking.thinking)thinking.thinking=false;const oopen=/<think[\s\S]*?>/i.test(seg);const oclose=/<\/think>/i.test(seg);if(oopen||inThink){thinkBuf+=seg;inThink=true;if(oclose){inThink=false;try{const cleaned=thinkBuf.replace(/<think[\s\S]*?>|<\/think>/gi,"").trim();if(cleaned)updateThinking(cleaned)}catch(_){ }thinkBuf=""}return}seg=seg.replace(/<final>|<\/final>/gi,"");const cur=thinking.text===t[lang].thinking?"":(thinking.text||"");thinking.text=cur+seg;renderChat($("#chat_search").value||"")}catch(_){}});es.addEventListener('chunk',e=>{try{const d=JSON.parse(e.data);let seg=d.text||"";if(ft1===null)ft1=Date.now();const oopen=/<think[\s\S]*?>/i.test(seg);const oclose=/<\/think>/i.test(seg);if(oopen||inThink){thinkBuf+=seg;inThink=true;if(oclose){inThink=false;try{const cleaned=thinkBuf.replace(/<think[\s\S]*?>|<\/think>/gi,"").trim();if(cleaned)updateThinking(cleaned)}catch(_){ }thinkBuf=""}return}seg=seg.replace(/<final>|<\/final>/gi,"");if(thinking.thinking)thinking.thinking=false;const cur=thinking.text===t[lang].thinking?"":(thinking.text||"");thinking.text=cur+seg;renderChat($("#chat_search").value||"")}catch(_){}});es.addEventListener('final',e=>{try{const d=JSON.parse(e.data);thinking.thinking=false;thinking.text=d.text||"";renderChat($("#chat_search").value||"");done=true;window.__last_ttft_front=ft1?(ft1-ts1):null;close()}catch(_){close();fallback()}});es.addEventListener('error',()=>{close();fallback()})}catch(_){fallback()}}
+async function streamGenerate(){hideAlert();const id=$("#model_select").value;if(!id)return;const device=$("#accelerator").value||"CPU";const promptEl=$("#prompt");const base=promptEl.value;if(!base)return;chat.push({role:"user",text:base});renderChat($("#chat_search").value||"");promptEl.value="";promptEl.focus();const thinking={role:"assistant",text:t[lang].thinking,thinking:true};chat.push(thinking);renderChat($("#chat_search").value||"");const maxNewEl=$("#max_new");const tempEl=$("#temperature");const topkEl=$("#top_k");const toppEl=$("#top_p");const repEl=$("#rep_penalty");const autoPerf=$("#auto_perf")?$("#auto_perf").checked:false;const autoMulti=$("#auto_multi")?$("#auto_multi").checked:false;const webSearch=$("#web_search")?$("#web_search").checked:false;const hetero=$("#hetero_enable")?$("#hetero_enable").checked:false;const prompt=buildContextualPrompt(base);const config={max_new_tokens:maxNewEl?parseInt(maxNewEl.value,10):2048,temperature:tempEl?parseFloat(tempEl.value):0.7,top_k:topkEl?parseInt(topkEl.value,10):50,top_p:toppEl?parseFloat(toppEl.value):0.9,repetition_penalty:repEl?parseFloat(repEl.value):1.1,perf_mode:autoPerf?"AUTO":($("#perf_mode")?$("#perf_mode").value:undefined),npu_streams:getAdvancedSettings().streams||undefined,npu_tiles:getAdvancedSettings().tiles||undefined,num_requests:getAdvancedSettings().num_requests||undefined,auto_multi:autoMulti,hetero_enable:hetero,web_search:webSearch,search_query:base};const dev2=(hetero&&(device.startsWith("AUTO")||device.startsWith("MULTI")))?("HETERO:"+(device.includes(":")?device.split(":",2)[1]:"")):device;const key=`${dev2}:${id}`;let needOverlay=!_firstLoadShown[key];try{const r0=await fetch(`/api/models/is_loaded?model_id=${encodeURIComponent(id)}&device=${encodeURIComponent(dev2)}`);if(r0.status===200){const j0=await r0.json();if(j0.loaded===true)needOverlay=false}}catch(_){ }let overlayShown=false;if(needOverlay){showOverlay();overlayShown=true}const qs=`model_id=${encodeURIComponent(id)}&device=${encodeURIComponent(dev2)}&prompt=${encodeURIComponent(prompt)}&config=${encodeURIComponent(JSON.stringify(config))}`;let es;let done=false;function close(){if(es)es.close()}async function fallback(){if(done)return;close();let j;try{const r=await fetch("/api/infer/chat",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({model_id:id,device:dev2,prompt,config})});j=await r.json()}catch(e){j={error:String(e)}}if(overlayShown)hideOverlay();if(j.friendly){showAlert(j.message,j.docs_link,j.recommended);const idx=chat.indexOf(thinking);if(idx>-1){chat.splice(idx,1)}renderChat($("#chat_search").value||"");return}const reply=j.output||j.error||"";thinking.thinking=false;thinking.text=reply;renderChat($("#chat_search").value||"")}try{let ts0=Date.now();let ft=null;let inThink=false;let thinkBuf="";es=new EventSource(`/api/infer/stream?${qs}`);es.addEventListener('sources',e=>{try{const d=JSON.parse(e.data);const arr=Array.isArray(d.sources)?d.sources:[];const lines=arr.map((s,i)=>`[${i+1}] ${(s.title||'')} \n ${(s.url||'')} \n ${(s.snippet||'')}`);if(lines.length){updateThinking(lines.join("\n\n"))}}catch(_){}});es.addEventListener('thinking',e=>{try{const d=JSON.parse(e.data);thinkBuf+=d.text||"";updateThinking(thinkBuf)}catch(_){}});es.addEventListener('token',e=>{try{const d=JSON.parse(e.data);let seg=d.text||"";if(ft===null)ft=Date.now();if(overlayShown){hideOverlay();overlayShown=false}if(thinking.thinking)thinking.thinking=false;const oopen=/<think[\s\S]*?>/i.test(seg);const oclose=/<\/think>/i.test(seg);if(oopen||inThink){thinkBuf+=seg;inThink=true;if(oclose){inThink=false;try{const cleaned=thinkBuf.replace(/<think[\s\S]*?>|<\/think>/gi,"").trim();if(cleaned)updateThinking(cleaned)}catch(_){ }thinkBuf=""}return}seg=seg.replace(/<final>|<\/final>/gi,"");const cur=thinking.text===t[lang].thinking?"":(thinking.text||"");thinking.text=cur+seg;renderChat($("#chat_search").value||"")}catch(_){}});es.addEventListener('chunk',e=>{try{const d=JSON.parse(e.data);let seg=d.text||"";if(ft===null)ft=Date.now();if(overlayShown){hideOverlay();overlayShown=false}if(thinking.thinking)thinking.thinking=false;const oopen=/<think[\s\S]*?>/i.test(seg);const oclose=/<\/think>/i.test(seg);if(oopen||inThink){thinkBuf+=seg;inThink=true;if(oclose){inThink=false;try{const cleaned=thinkBuf.replace(/<think[\s\S]*?>|<\/think>/gi,"").trim();if(cleaned)updateThinking(cleaned)}catch(_){ }thinkBuf=""}return}seg=seg.replace(/<final>|<\/final>/gi,"");const cur=thinking.text===t[lang].thinking?"":(thinking.text||"");thinking.text=cur+seg;renderChat($("#chat_search").value||"")}catch(_){}});es.addEventListener('final',e=>{try{const d=JSON.parse(e.data);thinking.thinking=false;thinking.text=d.text||"";renderChat($("#chat_search").value||"");done=true;if(overlayShown)hideOverlay();_firstLoadShown[key]=true;window.__last_ttft_front=ft?(ft-ts0):null;close()}catch(_){close();fallback()}});es.addEventListener('error',()=>{close();fallback()})}catch(_){fallback()}}
+async function streamContinueGenerate(){hideAlert();const id=$("#model_select").value;if(!id)return;const device=$("#accelerator").value||"CPU";const base=buildPromptFromChat();const prompt=buildContextualPrompt(base);const thinking={role:"assistant",text:t[lang].thinking,thinking:true};chat.push(thinking);renderChat($("#chat_search").value||"");const maxNewEl=$("#max_new");const tempEl=$("#temperature");const topkEl=$("#top_k");const toppEl=$("#top_p");const repEl=$("#rep_penalty");const autoPerf=$("#auto_perf")?$("#auto_perf").checked:false;const autoMulti=$("#auto_multi")?$("#auto_multi").checked:false;const webSearch=$("#web_search")?$("#web_search").checked:false;const hetero=$("#hetero_enable")?$("#hetero_enable").checked:false;const config={max_new_tokens:maxNewEl?parseInt(maxNewEl.value,10):2048,temperature:tempEl?parseFloat(tempEl.value):0.7,top_k:topkEl?parseInt(topkEl.value,10):50,top_p:toppEl?parseFloat(toppEl.value):0.9,repetition_penalty:repEl?parseFloat(repEl.value):1.1,perf_mode:autoPerf?"AUTO":($("#perf_mode")?$("#perf_mode").value:undefined),npu_streams:getAdvancedSettings().streams||undefined,npu_tiles:getAdvancedSettings().tiles||undefined,num_requests:getAdvancedSettings().num_requests||undefined,auto_multi:autoMulti,hetero_enable:hetero,web_search:webSearch,search_query:base};const dev2=(hetero&&(device.startsWith("AUTO")||device.startsWith("MULTI")))?("HETERO:"+(device.includes(":")?device.split(":",2)[1]:"")):device;const qs=`model_id=${encodeURIComponent(id)}&device=${encodeURIComponent(dev2)}&prompt=${encodeURIComponent(prompt)}&config=${encodeURIComponent(JSON.stringify(config))}`;let es;let done=false;function close(){if(es)es.close()}async function fallback(){if(done)return;close();let j;try{const r=await fetch("/api/infer/chat",{method:"POST",headers:{"Content-Type":"application/json"},body:JSON.stringify({model_id:id,device:dev2,prompt,config})});j=await r.json()}catch(e){j={error:String(e)}}const reply=j.output||j.error||"";thinking.thinking=false;thinking.text=reply;renderChat($("#chat_search").value||"")}try{let ts1=Date.now();let ft1=null;let inThink=false;let thinkBuf="";es=new EventSource(`/api/infer/stream?${qs}`);es.addEventListener('sources',e=>{try{const d=JSON.parse(e.data);const arr=Array.isArray(d.sources)?d.sources:[];const lines=arr.map((s,i)=>`[${i+1}] ${(s.title||'')} \n ${(s.url||'')} \n ${(s.snippet||'')}`);if(lines.length){updateThinking(lines.join("\n\n"))}}catch(_){}});es.addEventListener('thinking',e=>{try{const d=JSON.parse(e.data);thinkBuf+=d.text||"";updateThinking(thinkBuf)}catch(_){}});es.addEventListener('token',e=>{try{const d=JSON.parse(e.data);let seg=d.text||"";if(ft1===null)ft1=Date.now();if(thinking.thinking)thinking.thinking=false;const oopen=/<think[\s\S]*?>/i.test(seg);const oclose=/<\/think>/i.test(seg);if(oopen||inThink){thinkBuf+=seg;inThink=true;if(oclose){inThink=false;try{const cleaned=thinkBuf.replace(/<think[\s\S]*?>|<\/think>/gi,"").trim();if(cleaned)updateThinking(cleaned)}catch(_){ }thinkBuf=""}return}seg=seg.replace(/<final>|<\/final>/gi,"");const cur=thinking.text===t[lang].thinking?"":(thinking.text||"");thinking.text=cur+seg;renderChat($("#chat_search").value||"")}catch(_){}});es.addEventListener('chunk',e=>{try{const d=JSON.parse(e.data);let seg=d.text||"";if(ft1===null)ft1=Date.now();const oopen=/<think[\s\S]*?>/i.test(seg);const oclose=/<\/think>/i.test(seg);if(oopen||inThink){thinkBuf+=seg;inThink=true;if(oclose){inThink=false;try{const cleaned=thinkBuf.replace(/<think[\s\S]*?>|<\/think>/gi,"").trim();if(cleaned)updateThinking(cleaned)}catch(_){ }thinkBuf=""}return}seg=seg.replace(/<final>|<\/final>/gi,"");if(thinking.thinking)thinking.thinking=false;const cur=thinking.text===t[lang].thinking?"":(thinking.text||"");thinking.text=cur+seg;renderChat($("#chat_search").value||"")}catch(_){}});es.addEventListener('final',e=>{try{const d=JSON.parse(e.data);thinking.thinking=false;thinking.text=d.text||"";renderChat($("#chat_search").value||"");done=true;window.__last_ttft_front=ft1?(ft1-ts1):null;close()}catch(_){close();fallback()}});es.addEventListener('error',()=>{close();fallback()})}catch(_){fallback()}}
 generate=streamGenerate
 continueGenerate=streamContinueGenerate
 async function generateImage(){const status=document.querySelector('#t2i_status');const img=document.querySelector('#t2i_img');if(status)status.textContent="";if(img){img.removeAttribute('src');img.style.display='none'}const model=document.querySelector('#t2i_model_path')?document.querySelector('#t2i_model_path').value.trim():"";const prompt=document.querySelector('#t2i_prompt')?document.querySelector('#t2i_prompt').value.trim():"";const width=parseInt(document.querySelector('#t2i_width')?document.querySelector('#t2i_width').value:512,10)||512;const height=parseInt(document.querySelector('#t2i_height')?document.querySelector('#t2i_height').value:512,10)||512;const steps=parseInt(document.querySelector('#t2i_steps')?document.querySelector('#t2i_steps').value:30,10)||30;const guidance=parseFloat(document.querySelector('#t2i_guidance')?document.querySelector('#t2i_guidance').value:7.5)||7.5;const te=document.querySelector('#t2i_device_te')?document.querySelector('#t2i_device_te').value:null;const un=document.querySelector('#t2i_device_unet')?document.querySelector('#t2i_device_unet').value:null;const vae=document.querySelector('#t2i_device_vae')?document.querySelector('#t2i_device_vae').value:null;if(!model||!prompt){if(status)status.textContent=lang==="zh"?"请输入模型路径与提示词":"Enter model path and prompt";return}try{const body={model_path:model,prompt,width,height,steps,guidance_scale:guidance};if(te||un||vae){body.text_encoder_device=te;body.unet_device=un;body.vae_decoder_device=vae}else{body.device='CPU'}const r=await fetch('/api/image/generate',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(body)});const j=await r.json();if(j.error){if(status)status.textContent=j.error}else{const mime=j.mime||'image/bmp';const b64=j.image_b64;const url=`data:${mime};base64,${b64}`;if(img){img.src=url;img.style.display=''}}}catch(e){if(status)status.textContent=String(e)}}